@@ -0,0 +1,94 @@
+"""Time the Todoist summary sort against the old recursive subtree walk.
+
+Builds synthetic goal trees in memory: a wide tree with a fixed branching
+factor and a single deep chain, which the recursive walk cannot finish.
+"""
+
+import argparse
+import random
+import sys
+import timeit
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from web_app.todoist.data_interface import Goal, GoalIndex, GoalState, Goals, goal_index
+
+
+def synthetic_goals(count: int, branching: int) -> Goals:
+    """`count` goals; each goal's parent is one of the previous ones, `branching` apart."""
+    rng = random.Random(0)
+    start = datetime(2026, 1, 1)
+    goals: dict[int, Goal] = {}
+    for goal_id in range(count):
+        parent = (goal_id - 1) // branching if branching and goal_id else None
+        goals[goal_id] = Goal(
+            id=goal_id,
+            name=f"Goal {goal_id}",
+            state=rng.choice((GoalState.ACTIVE, GoalState.COMPLETED)),
+            last_modified=start + timedelta(minutes=rng.randrange(500_000)),
+            completion_date=start + timedelta(days=rng.randrange(365)),
+            parent=parent,
+        )
+        if parent is not None:
+            goals[parent].children.append(goal_id)
+    synthetic = Goals(version=1, goals=goals)
+    # Stands in for the file mtime load_goals records, so goal_index caches it.
+    synthetic._mtime_ns = 1
+    return synthetic
+
+
+def legacy_sort(all_goals: dict[int, Goal]) -> list[Goal]:
+    def max_last_modified(goal: Goal) -> float:
+        ts = goal.last_modified.timestamp()
+        for child_id in goal.children:
+            if child_id in all_goals:
+                ts = max(ts, max_last_modified(all_goals[child_id]))
+        return ts
+
+    goals = [goal for goal in all_goals.values() if goal.parent is None]
+    goals.sort(key=max_last_modified, reverse=True)
+    return goals
+
+
+def indexed_sort(index: GoalIndex) -> list[Goal]:
+    goals = [goal for goal in index.goals.values() if goal.parent is None]
+    goals.sort(key=lambda goal: index.latest_modified[goal.id], reverse=True)
+    return goals
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--goals", type=int, default=10_000, help="goals per tree")
+    parser.add_argument("--number", type=int, default=20, help="sorts per timing run")
+    args = parser.parse_args(argv)
+
+    goals_file = Path("benchmark-goals.json")
+    for label, branching in (("wide", 8), ("chain", 1)):
+        goals = synthetic_goals(args.goals, branching)
+        try:
+            legacy = min(timeit.repeat(
+                lambda: legacy_sort(goals.goals), number=args.number, repeat=3,
+            )) / args.number
+            legacy_text = f"{legacy * 1000:8.3f} ms"
+        except RecursionError:
+            legacy_text = "  failed  "
+        build = min(timeit.repeat(
+            lambda: GoalIndex.build(goals), number=args.number, repeat=3,
+        )) / args.number
+        goal_index(goals, goals_file)
+        cached = min(timeit.repeat(
+            lambda: indexed_sort(goal_index(goals, goals_file)), number=args.number, repeat=3,
+        )) / args.number
+        print(
+            f"{label:6} {args.goals:7} goals  legacy {legacy_text}  "
+            f"index build {build * 1000:8.3f} ms  cached sort {cached * 1000:8.3f} ms"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
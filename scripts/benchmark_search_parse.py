@@ -0,0 +1,67 @@
+"""Time the YouTube results-page parser against the old regex extractor.
+
+Runs offline on the saved pages in tests/unit/fixtures/tubio, padded with
+filler script to roughly the size of a live results page.
+"""
+
+import argparse
+import json
+import re
+import sys
+import timeit
+
+from pathlib import Path
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from web_app.tubio.audio_downloader import AudioDownloader
+
+
+FIXTURES = Path(__file__).resolve().parents[1] / "tests" / "unit" / "fixtures" / "tubio"
+
+
+def legacy_sections(html: str) -> list:
+    match = re.search(r'var ytInitialData = (\{.*?\});', html, re.DOTALL)
+    if not match:
+        return []
+    data = json.loads(match.group(1))
+    return data.get('contents', {}) \
+        .get('twoColumnSearchResultsRenderer', {}) \
+        .get('primaryContents', {}) \
+        .get('sectionListRenderer', {}) \
+        .get('contents', [])
+
+
+def padded_page(html: str, target_bytes: int) -> str:
+    filler = "<script>var ytcfg = {\"d\": \"" + "x" * 4096 + "\"};</script>\n"
+    head = filler * max(0, target_bytes // 2 // len(filler))
+    tail = "<script>" + json.dumps({"responseContext": ["y" * 64] * 256}) + "</script>\n"
+    tail = tail * max(0, target_bytes // 2 // len(tail))
+    return head + html + tail
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-kb", type=int, default=1024, help="padded page size")
+    parser.add_argument("--number", type=int, default=50, help="parses per timing run")
+    args = parser.parse_args(argv)
+
+    for path in sorted(FIXTURES.glob("search_page_*.html")):
+        html = padded_page(path.read_text(encoding="utf-8"), args.size_kb * 1024)
+        new = min(timeit.repeat(
+            lambda: AudioDownloader._search_result_sections(html), number=args.number, repeat=3,
+        )) / args.number
+        try:
+            legacy = min(timeit.repeat(
+                lambda: legacy_sections(html), number=args.number, repeat=3,
+            )) / args.number
+            legacy_text = f"{legacy * 1000:8.3f} ms"
+        except (ValueError, AttributeError):
+            legacy_text = "  failed  "
+        print(f"{path.name:32} {len(html) // 1024:6} KB  legacy {legacy_text}  new {new * 1000:8.3f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""Time waveform peak extraction against a per-bucket Python loop.
+
+Runs offline on synthetic PCM fed in read-sized chunks, as ffmpeg's pipe
+delivers it. Pass --audio to also time the full decode of a real file.
+"""
+
+import argparse
+import struct
+import sys
+import time
+import timeit
+
+from pathlib import Path
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from web_app.config import ConfigManager
+from web_app.tubio.waveform import decode_pcm, extract_peaks
+
+
+def legacy_peaks(pcm: bytes, bucket_samples: int) -> list[tuple[int, int]]:
+    samples = struct.unpack(f"<{len(pcm) // 2}h", pcm)
+    return [
+        (min(bucket), max(bucket))
+        for start in range(0, len(samples), bucket_samples)
+        if (bucket := samples[start:start + bucket_samples])
+    ]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=float, default=10, help="synthetic track length")
+    parser.add_argument("--number", type=int, default=3, help="extractions per timing run")
+    parser.add_argument("--audio", type=Path, help="also time ffmpeg decoding of this file")
+    args = parser.parse_args(argv)
+
+    config = ConfigManager().tubio
+    options = dict(
+        sample_rate=config.waveform_sample_rate,
+        bucket_samples=config.waveform_bucket_samples,
+        levels=config.waveform_levels,
+        level_factor=config.waveform_level_factor,
+    )
+    sample_count = int(args.minutes * 60 * config.waveform_sample_rate)
+    pcm = np.random.default_rng(0).integers(
+        -32768, 32767, size=sample_count, dtype=np.int16,
+    ).astype("<i2").tobytes()
+    chunk = config.waveform_read_chunk_bytes
+    chunks = [pcm[start:start + chunk] for start in range(0, len(pcm), chunk)]
+
+    new = min(timeit.repeat(
+        lambda: extract_peaks(chunks, **options), number=args.number, repeat=3,
+    )) / args.number
+    legacy = min(timeit.repeat(
+        lambda: legacy_peaks(pcm, config.waveform_bucket_samples), number=1, repeat=3,
+    ))
+    blob = extract_peaks(chunks, **options)
+    print(
+        f"{args.minutes:g} min PCM {len(pcm) // 1024:8} KB  "
+        f"legacy {legacy * 1000:9.1f} ms  new {new * 1000:8.1f} ms  blob {len(blob) // 1024} KB"
+    )
+
+    if args.audio:
+        started = time.perf_counter()
+        blob = extract_peaks(decode_pcm(args.audio), **options)
+        elapsed = time.perf_counter() - started
+        print(f"{args.audio.name:32} decode+extract {elapsed * 1000:9.1f} ms  blob {len(blob) // 1024} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
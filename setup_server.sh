@@ -72,7 +72,7 @@ function run_server_side()
 		sudo certbot certonly --standalone -d $DOMAIN --staple-ocsp -m $EMAIL --agree-tos \
 			--pre-hook "systemctl stop nginx" \
 			--post-hook "systemctl start nginx"
-		sudo cp nabicat.conf /etc/nginx/conf.d/
+		sed "s|__NABICAT_DATA_ROOT__|$HOME/.nabicat/data|g" nabicat.conf | sudo tee /etc/nginx/conf.d/nabicat.conf >/dev/null
 	}
 
 	sudo apt update
@@ -38,6 +38,14 @@ class TestCacheFiles:
         assert "clearCaches" in content
         assert "clearCache" in content
 
+    def test_tubio_offline_cache_survives_version_bumps_but_not_logout(self):
+        content = Path('web_app/static/service-worker.js').read_text()
+
+        assert "const TUBIO_OFFLINE_CACHE_NAME = `${CACHE_PREFIX}tubio-offline`;" in content
+        assert "[CACHE_NAME, TUBIO_OFFLINE_CACHE_NAME].includes(name)" in content
+        assert "tubioOfflineSync" in content
+        assert "status: 206" in content
+
     def test_cache_manager_exists(self):
         """Verify cache manager file exists"""
         cm_path = Path('web_app/static/cache-manager.js')
@@ -289,6 +289,22 @@ def test_scheduled_job_systemd_configuration():
             "download-health-check",
             "*-*-* 04:10:00",
         ),
+        (
+            "nabicat-file-store-usage-verify.timer",
+            "file-store-usage-verify",
+            "*-*-* 03:30:00",
+        ),
+        ("nabicat-trash-reap.timer", "trash-reap", "*-*-* *:20:00"),
+        (
+            "nabicat-thumbnail-backfill.timer",
+            "thumbnail-backfill",
+            "*-*-* 04:30:00",
+        ),
+        (
+            "nabicat-tubio-refcount-verify.timer",
+            "tubio-refcount-verify",
+            "*-*-* 03:40:00",
+        ),
     )
 
 
@@ -6,6 +6,7 @@ import binascii
 import logging
 import zipfile
 from datetime import datetime
+from pathlib import PurePosixPath
 from unittest.mock import Mock, patch
 from werkzeug.datastructures import FileStorage
 
@@ -18,6 +19,7 @@ from web_app.file_store.data_interface import (
     Metadata,
     UserMetadata,
     FileMetadata,
+    StaleCursorError,
     UserFileEntry
 )
 from web_app.helpers import limiter
@@ -73,6 +75,8 @@ def data_interface(tmp_path):
     di = DataInterface()
     di.file_store_dir = tmp_path / "file_store"
     di.files_dir = di.file_store_dir / "files"
+    di.thumbnails_dir = di.file_store_dir / "thumbnails"
+    di.trash_dir = di.file_store_dir / "trash"
     di.metadata_file = di.file_store_dir / "metadata.json"
     return di
 
@@ -127,6 +131,48 @@ class TestDataInterface:
             ('file', 'old.txt'),
         ]
 
+    def test_list_directory_page_sorts_and_paginates_compact_rows(self, data_interface, test_user):
+        for name, content in (('b.txt', b'bb'), ('a.txt', b'aaaa'), ('docs/c.txt', b'c' * 10)):
+            data_interface.save_file(
+                FileStorage(io.BytesIO(content), PurePosixPath(name).name), test_user, relative_path=name,
+            )
+
+        by_name = data_interface.list_directory_page('', test_user, sort='name')
+        assert by_name['columns'] == ('kind', 'name', 'size', 'modified', 'mime_type')
+        assert [row[1] for row in by_name['rows']] == ['docs', 'a.txt', 'b.txt']
+        assert by_name['rows'][0][:3] == ['folder', 'docs', 10]
+
+        by_size = data_interface.list_directory_page('', test_user, sort='size', limit=2)
+        assert by_size['total'] == 3
+        assert [row[1] for row in by_size['rows']] == ['docs', 'a.txt']
+        rest = data_interface.list_directory_page(
+            '', test_user, sort='size', cursor=by_size['next_cursor'],
+        )
+        assert [row[1] for row in rest['rows']] == ['b.txt']
+        assert rest['next_cursor'] is None
+
+    def test_list_directory_page_rejects_stale_and_mismatched_cursors(self, data_interface, test_user):
+        for name in ('one.txt', 'two.txt'):
+            data_interface.save_file(FileStorage(io.BytesIO(name.encode()), name), test_user)
+        page = data_interface.list_directory_page('', test_user, sort='name', limit=1)
+
+        with pytest.raises(ValueError, match='does not match'):
+            data_interface.list_directory_page('', test_user, sort='size', cursor=page['next_cursor'])
+        with pytest.raises(ValueError, match='Invalid cursor'):
+            data_interface.list_directory_page('', test_user, sort='name', cursor='not-a-cursor')
+
+        data_interface.create_folder('new', test_user)
+        with pytest.raises(StaleCursorError):
+            data_interface.list_directory_page('', test_user, sort='name', cursor=page['next_cursor'])
+        assert data_interface.list_directory_page('', test_user, sort='name')['total'] == 3
+
+    def test_edit_metadata_bumps_version_only_on_change(self, data_interface, test_user):
+        data_interface.create_folder('docs', test_user)
+        version = data_interface.get_metadata().version
+        with data_interface.edit_metadata():
+            pass
+        assert data_interface.get_metadata().version == version
+
     def test_batch_operations_move_and_delete_nested_selections(self, data_interface, test_user):
         data_interface.create_folder('reports/2026', test_user)
         data_interface.save_file(
@@ -171,6 +217,32 @@ class TestDataInterface:
                 test_user,
             )
 
+    def test_save_archive_ingests_entries_and_skips_writing_stored_content(self, data_interface, test_user):
+        data_interface.save_file(FileStorage(io.BytesIO(b'shared'), 'shared.txt'), test_user)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('album/shared-copy.txt', b'shared')
+            for index in range(8):
+                archive.writestr(f'album/{index}.txt', f'content {index}'.encode())
+
+        written = []
+        spool = data_interface._spool_stream
+
+        def record_spool(stream, *, write=True):
+            written.append(write)
+            return spool(stream, write=write)
+
+        with zipfile.ZipFile(buffer) as archive, patch.object(data_interface, '_spool_stream', record_spool):
+            entries = [(entry, entry.filename) for entry in archive.infolist()]
+            data_interface.save_archive(archive, entries, ['album'], test_user)
+
+        assert sorted(written) == [False] + [True] * 8
+        assert data_interface.get_file_path('album/shared-copy.txt', test_user).read_bytes() == b'shared'
+        assert data_interface.get_file_path('album/7.txt', test_user).read_bytes() == b'content 7'
+        assert sorted(path.name for path in data_interface.files_dir.iterdir()) == sorted(
+            str(crc) for crc in data_interface.get_metadata().files
+        )
+
     def test_save_file_streams_large_upload_in_chunks(self, data_interface, test_user):
         """Uploads are copied incrementally rather than buffered in memory."""
         class ChunkOnlyStream(io.BytesIO):
@@ -292,6 +364,29 @@ class TestDataInterface:
         file_path = data_interface.files_dir / str(crc1)
         assert file_path.exists()
 
+    def test_reap_trash_keeps_blob_that_was_re_added(self, data_interface, test_user):
+        crc = data_interface.save_file(FileStorage(io.BytesIO(b'again'), 'a.txt'), test_user)
+        data_interface.delete_file('a.txt', test_user)
+        data_interface.save_file(FileStorage(io.BytesIO(b'again'), 'b.txt'), test_user)
+
+        data_interface.reap_trash()
+
+        assert (data_interface.files_dir / str(crc)).read_bytes() == b'again'
+        assert not data_interface.get_metadata().trash
+
+    def test_reap_trash_finishes_after_interrupted_run(self, data_interface, test_user):
+        crc = data_interface.save_file(FileStorage(io.BytesIO(b'gone'), 'a.txt'), test_user)
+        data_interface.delete_file('a.txt', test_user)
+        # Simulate a crash after the blob was moved to trash but before the
+        # tombstone removal was committed.
+        data_interface.trash_dir.mkdir(parents=True)
+        (data_interface.files_dir / str(crc)).rename(data_interface.trash_dir / str(crc))
+
+        data_interface.reap_trash()
+
+        assert not any(data_interface.trash_dir.iterdir())
+        assert not data_interface.get_metadata().trash
+
     def test_get_file_path(self, data_interface, test_user):
         """Test getting file path by original filename"""
         file_data = b'test content'
@@ -321,12 +416,17 @@ class TestDataInterface:
 
         data_interface.delete_file('test.txt', test_user)
 
-        # File should be deleted from disk
+        # The blob is tombstoned, then deleted from disk by the reaper
+        assert data_interface.get_metadata().trash.keys() == {crc}
+        assert isinstance(data_interface.get_metadata().trash[crc], datetime)
+        assert file_path.exists()
+        assert data_interface.reap_trash() == 1
         assert not file_path.exists()
 
         # Metadata should be cleaned up
         metadata = data_interface.get_metadata()
         assert crc not in metadata.files
+        assert not metadata.trash
         assert not any(f.crc == crc for f in metadata.users[test_user.id].files)
 
     def test_delete_file_multiple_users(self, data_interface, test_user, test_user2):
@@ -358,6 +458,7 @@ class TestDataInterface:
         data_interface.delete_file('file2.txt', test_user2)
 
         # Now file should be deleted
+        data_interface.reap_trash()
         assert not file_path.exists()
         metadata = data_interface.get_metadata()
         assert crc not in metadata.files
@@ -408,6 +509,38 @@ class TestDataInterface:
         size = data_interface.get_total_storage_size(test_user)
         assert size == 300
 
+    def test_usage_counters_follow_saves_replacements_and_deletes(self, data_interface, test_user):
+        data_interface.save_file(FileStorage(io.BytesIO(b'12345'), 'a.txt'), test_user, relative_path='docs/a.txt')
+        data_interface.save_file(FileStorage(io.BytesIO(b'123'), 'b.txt'), test_user)
+        data_interface.save_file(FileStorage(io.BytesIO(b'1234567'), 'a.txt'), test_user, relative_path='docs/a.txt')
+        user_metadata = data_interface.get_metadata().users[test_user.id]
+        assert (user_metadata.used_bytes, user_metadata.file_count) == (10, 2)
+
+        data_interface.move_path('docs', 'archive', test_user)
+        data_interface.delete_paths(['archive'], test_user)
+        user_metadata = data_interface.get_metadata().users[test_user.id]
+        assert (user_metadata.used_bytes, user_metadata.file_count) == (3, 1)
+        assert data_interface.get_total_storage_size(test_user) == 3
+
+    def test_validate_batch_quota_subtracts_replaced_paths(self, data_interface, test_user):
+        quota = ConfigManager().file_store.non_admin_quota_bytes
+        data_interface.save_file(FileStorage(io.BytesIO(b'x' * 10), 'big.bin'), test_user)
+
+        data_interface.validate_batch_quota(['big.bin'], quota, test_user)
+        with pytest.raises(ValueError, match='storage limit'):
+            data_interface.validate_batch_quota(['other.bin'], quota, test_user)
+
+    def test_verify_usage_counters_seeds_and_corrects_drift(self, data_interface, test_user, caplog):
+        data_interface.save_file(FileStorage(io.BytesIO(b'1234'), 'a.txt'), test_user)
+        with data_interface.edit_metadata() as metadata:
+            metadata.users[test_user.id].used_bytes = 99
+
+        caplog.set_level(logging.WARNING)
+        assert data_interface.verify_usage_counters() == 1
+        assert data_interface.get_metadata().users[test_user.id].used_bytes == 4
+        assert '"event": "file_store.usage_drift"' in caplog.text
+        assert data_interface.verify_usage_counters() == 0
+
     def test_get_user_metadata_new_user(self, data_interface, test_user):
         """Test getting metadata for new user"""
         user_meta = data_interface.get_user_metadata(test_user)
@@ -423,12 +556,11 @@ class TestFileStoreRoutes:
     def test_index_list_mode(self, mock_di_class, client, auth_mock):
         """Test index page in list mode"""
         mock_di = mock_di_class.return_value
-        file_item = {
-            'name': 'file1.txt', 'path': 'file1.txt', 'size': 100,
-            'size_formatted': '100.0 B', 'mime_type': 'text/plain', 'kind': 'file',
-        }
-        mock_di.list_directory.return_value = {
-            'folders': [], 'files': [file_item], 'items': [file_item],
+        mock_di.list_directory_page.return_value = {
+            'version': 1, 'path': '', 'sort': 'recent', 'total': 1,
+            'columns': ['kind', 'name', 'size', 'modified', 'mime_type'],
+            'rows': [['file', 'file1.txt', 100, 1767261600, 'text/plain']],
+            'next_cursor': None,
         }
         mock_di.get_total_storage_size.return_value = 100
 
@@ -439,11 +571,33 @@ class TestFileStoreRoutes:
 
         assert response.status_code == 200
         assert b'file1.txt' in response.data
+        assert b'id="virtualDirectory"' in response.data
+        mock_di.list_directory.assert_not_called()
         assert b'file-store-actions' not in response.data
         assert b'class="btn btn-outline-secondary btn-sm move-button"' not in response.data
         assert b'Delete file' not in response.data
         assert b'id="galleryColumns"' not in response.data
 
+    @patch('web_app.file_store.DataInterface')
+    def test_entries_returns_page_and_conflict_for_stale_cursor(self, mock_di_class, client, auth_mock):
+        mock_di = mock_di_class.return_value
+        mock_di.list_directory_page.return_value = {'total': 0, 'rows': [], 'next_cursor': None}
+        with client.session_transaction() as sess:
+            sess['_user_id'] = auth_mock.id
+
+        response = client.get('/file_store/entries?path=docs&sort=size&limit=50')
+
+        assert response.status_code == 200
+        assert response.json['total'] == 0
+        mock_di.list_directory_page.assert_called_once_with(
+            'docs', auth_mock, sort='size', cursor=None, limit=50,
+        )
+
+        mock_di.list_directory_page.side_effect = StaleCursorError('Listing changed, reload it')
+        assert client.get('/file_store/entries?cursor=abc').status_code == 409
+        mock_di.list_directory_page.side_effect = ValueError('Invalid sort')
+        assert client.get('/file_store/entries?sort=bogus').status_code == 400
+
     @patch('web_app.file_store.DataInterface')
     def test_index_grid_mode_shows_folders_and_images_only(self, mock_di_class, client, auth_mock):
         """Grid mode is a visual gallery, not a second file list."""
@@ -518,6 +672,24 @@ class TestFileStoreRoutes:
         assert '"event": "file_store.upload"' in caplog.text
         assert '"files": 1' in caplog.text
 
+    @patch('web_app.file_store.DataInterface')
+    def test_upload_rejects_highly_compressed_archive_entry(self, mock_di_class, client, auth_mock):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('bomb.bin', b'\0' * (ConfigManager().file_store.archive_ratio_check_min_bytes * 4))
+        buffer.seek(0)
+        with client.session_transaction() as sess:
+            sess['_user_id'] = auth_mock.id
+
+        response = client.post(
+            '/file_store/upload', data={'folder_archive': (buffer, 'folder.zip')},
+            content_type='multipart/form-data', headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+
+        assert response.status_code == 413
+        assert 'too highly compressed' in response.json['error']
+        mock_di_class.return_value.save_archive.assert_not_called()
+
     @patch('web_app.file_store.DataInterface')
     def test_upload_file_rejection_is_logged(self, mock_di_class, client, auth_mock, caplog):
         with client.session_transaction() as sess:
@@ -563,6 +735,42 @@ class TestFileStoreRoutes:
         assert response.status_code == 200
         assert 'filename=report.csv' in response.headers['Content-Disposition']
 
+    @patch('web_app.file_store.DataInterface')
+    def test_download_file_falls_back_outside_data_root(self, mock_di_class, client, auth_mock, tmp_path, monkeypatch):
+        monkeypatch.setattr(ConfigManager(), 'x_accel_redirect_enabled', True)
+        stored_file = tmp_path / '123'
+        stored_file.write_text('download test content')
+        mock_di_class.return_value.get_file_path.return_value = stored_file
+
+        with client.session_transaction() as sess:
+            sess['_user_id'] = auth_mock.id
+
+        response = client.get('/file_store/download/report.csv')
+
+        assert 'X-Accel-Redirect' not in response.headers
+        assert response.get_data() == b'download test content'
+
+    @patch('web_app.file_store.DataInterface')
+    def test_download_file_uses_x_accel_redirect(self, mock_di_class, client, auth_mock, tmp_path, monkeypatch):
+        monkeypatch.setattr(ConfigManager(), 'x_accel_redirect_enabled', True)
+        monkeypatch.setattr(ConfigManager, 'save_data_path', property(lambda self: tmp_path))
+        stored_file = tmp_path / 'file_store' / 'files' / '123'
+        stored_file.parent.mkdir(parents=True)
+        stored_file.write_text('download test content')
+        mock_di_class.return_value.get_file_path.return_value = stored_file
+
+        with client.session_transaction() as sess:
+            sess['_user_id'] = auth_mock.id
+
+        response = client.get('/file_store/download/my report.csv')
+
+        assert response.status_code == 200
+        assert response.headers['X-Accel-Redirect'] == '/_nabicat_data/file_store/files/123'
+        assert 'filename="my report.csv"' in response.headers['Content-Disposition']
+        assert response.headers['Content-Type'].startswith('text/csv')
+        assert 'no-store' in response.headers['Cache-Control']
+        assert response.get_data() == b''
+
     @patch('web_app.file_store.DataInterface')
     def test_bulk_routes_submit_all_selected_paths(self, mock_di_class, client, auth_mock):
         mock_di = mock_di_class.return_value
@@ -130,6 +130,91 @@ def test_download_health_logs_success_alert_failure(tmp_path):
     )
 
 
+def test_file_store_usage_verify_reports_corrections():
+    from web_app import scheduled_jobs
+
+    with (
+        patch.object(scheduled_jobs, "ensure_local_redis"),
+        patch.object(scheduled_jobs, "FileStoreDataInterface") as file_store,
+        patch.object(scheduled_jobs, "log_event") as log_event,
+    ):
+        file_store.return_value.verify_usage_counters.return_value = 2
+        scheduled_jobs.run_file_store_usage_verify()
+
+    log_event.assert_called_with(
+        "file_store",
+        "usage_verify.completed",
+        source="systemd",
+        job_id="file-store-usage-verify",
+        corrected=2,
+    )
+
+
+def test_trash_reap_covers_file_store_and_tubio():
+    from web_app import scheduled_jobs
+
+    with (
+        patch.object(scheduled_jobs, "ensure_local_redis"),
+        patch.object(scheduled_jobs, "FileStoreDataInterface") as file_store,
+        patch.object(scheduled_jobs, "TubioDataInterface") as tubio,
+        patch.object(scheduled_jobs, "log_event") as log_event,
+    ):
+        file_store.return_value.reap_trash.return_value = 2
+        tubio.return_value.reap_trash.return_value = 3
+        scheduled_jobs.run_trash_reap()
+
+    log_event.assert_called_with(
+        "system",
+        "trash_reap.completed",
+        source="systemd",
+        job_id="trash-reap",
+        removed=5,
+    )
+
+
+def test_thumbnail_backfill_runs_the_tubio_backfill():
+    from web_app import scheduled_jobs
+
+    with (
+        patch.object(scheduled_jobs, "ensure_local_redis"),
+        patch.object(
+            scheduled_jobs.AudioDownloader, "backfill_thumbnails", return_value=4,
+        ) as backfill,
+        patch.object(scheduled_jobs, "log_event") as log_event,
+    ):
+        scheduled_jobs.run_thumbnail_backfill()
+
+    backfill.assert_called_once_with()
+    log_event.assert_called_with(
+        "tubio",
+        "thumbnail_backfill.completed",
+        source="systemd",
+        job_id="thumbnail-backfill",
+        completed=4,
+    )
+
+
+def test_tubio_refcount_verify_runs_a_verifying_cleanup():
+    from web_app import scheduled_jobs
+
+    with (
+        patch.object(scheduled_jobs, "ensure_local_redis"),
+        patch.object(scheduled_jobs, "TubioDataInterface") as tubio,
+        patch.object(scheduled_jobs, "log_event") as log_event,
+    ):
+        tubio.return_value.cleanup_unused_resources.return_value = 3
+        scheduled_jobs.run_tubio_refcount_verify()
+
+    tubio.return_value.cleanup_unused_resources.assert_called_once_with(verify=True)
+    log_event.assert_called_with(
+        "tubio",
+        "refcount_verify.completed",
+        source="systemd",
+        job_id="tubio-refcount-verify",
+        collected=3,
+    )
+
+
 def test_cli_dispatches_the_selected_job_once():
     from web_app import scheduled_jobs
 
@@ -138,6 +223,10 @@ def test_cli_dispatches_the_selected_job_once():
         scheduled_backup_job_id="backup",
         scheduled_cookie_keepalive_job_id="cookie-keepalive",
         scheduled_download_health_check_job_id="download-health-check",
+        scheduled_file_store_usage_verify_job_id="file-store-usage-verify",
+        scheduled_trash_reap_job_id="trash-reap",
+        scheduled_thumbnail_backfill_job_id="thumbnail-backfill",
+        scheduled_tubio_refcount_verify_job_id="tubio-refcount-verify",
     )
     with (
         patch.object(scheduled_jobs, "ConfigManager", return_value=config),
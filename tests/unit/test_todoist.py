@@ -14,7 +14,7 @@ from web_app.todoist import (
     _completed_goals_to_blocks,
     PAGE_SIZE
 )
-from web_app.todoist.data_interface import Goal, GoalState, Goals
+from web_app.todoist.data_interface import DataInterface, Goal, GoalIndex, GoalState, Goals, goal_index
 
 
 @pytest.fixture
@@ -253,6 +253,135 @@ class TestGoalReparenting:
         assert parent.children == [2]
 
 
+class TestGoalIndex:
+    """Tests for the derived goal tree index"""
+
+    def test_subtree_aggregates(self):
+        root = Goal(id=1, name='Root', state=GoalState.ACTIVE,
+                    last_modified=datetime(2026, 1, 1), children=[2, 3])
+        done = Goal(id=2, name='Done', state=GoalState.COMPLETED, parent=1,
+                    last_modified=datetime(2026, 1, 2), completion_date=datetime(2026, 1, 2))
+        branch = Goal(id=3, name='Branch', state=GoalState.ACTIVE, parent=1,
+                      last_modified=datetime(2026, 1, 1), children=[4])
+        leaf = Goal(id=4, name='Leaf', state=GoalState.COMPLETED, parent=3,
+                    last_modified=datetime(2026, 1, 5), completion_date=datetime(2026, 1, 5))
+
+        index = GoalIndex.build(Goals(goals={goal.id: goal for goal in (root, done, branch, leaf)}))
+
+        assert index.parents == {1: None, 2: 1, 3: 1, 4: 3}
+        assert index.depth == {1: 0, 2: 1, 3: 1, 4: 2}
+        assert index.latest_modified[1] == datetime(2026, 1, 5).timestamp()
+        assert index.latest_modified[2] == datetime(2026, 1, 2).timestamp()
+        assert index.descendants == {1: 3, 2: 0, 3: 1, 4: 0}
+        assert index.completed_descendants == {1: 2, 2: 0, 3: 1, 4: 0}
+        assert [goal.id for goal in index.completed] == [4, 2]
+
+    def test_deep_trees_and_cycles_do_not_recurse(self):
+        depth = 5000
+        goals = {
+            goal_id: Goal(id=goal_id, name=str(goal_id), state=GoalState.ACTIVE,
+                          last_modified=datetime(2026, 1, 1) + timedelta(minutes=goal_id),
+                          parent=goal_id - 1 if goal_id else None,
+                          children=[goal_id + 1] if goal_id + 1 < depth else [])
+            for goal_id in range(depth)
+        }
+        goals[depth] = Goal(id=depth, name='Loop', state=GoalState.ACTIVE, children=[depth + 1])
+        goals[depth + 1] = Goal(id=depth + 1, name='Back', state=GoalState.ACTIVE, children=[depth])
+
+        index = GoalIndex.build(Goals(goals=goals))
+
+        assert index.depth[depth - 1] == depth - 1
+        assert index.descendants[0] == depth - 1
+        assert index.latest_modified[0] == goals[depth - 1].last_modified.timestamp()
+        assert {index.descendants[depth], index.descendants[depth + 1]} == {0, 1}
+
+    def test_index_is_reused_until_the_goals_are_edited(self, tmp_path, test_user):
+        data = DataInterface()
+        data.todoist_data_directory = tmp_path
+        with data.edit_goals(test_user) as goals:
+            goals.goals[1] = Goal(id=1, name='Goal', state=GoalState.ACTIVE)
+
+        loaded = data.load_goals(test_user)
+        first = goal_index(loaded, data.get_goals_file(test_user))
+        assert goal_index(data.load_goals(test_user), data.get_goals_file(test_user)) is first
+
+        with data.edit_goals(test_user) as goals:
+            goals.goals[1].name = 'Renamed'
+
+        edited = goal_index(data.load_goals(test_user), data.get_goals_file(test_user))
+        assert edited is not first
+        assert edited.goals[1].name == 'Renamed'
+
+    def test_recreated_goals_file_is_not_served_a_stale_index(self, tmp_path, test_user):
+        import os
+
+        data = DataInterface()
+        data.todoist_data_directory = tmp_path
+        goals_file = data.get_goals_file(test_user)
+        with data.edit_goals(test_user) as goals:
+            goals.goals[1] = Goal(id=1, name='Old', state=GoalState.ACTIVE)
+        first = goal_index(data.load_goals(test_user), goals_file)
+        old_mtime_ns = goals_file.stat().st_mtime_ns
+
+        data.delete_user_data(test_user)
+        with data.edit_goals(test_user) as goals:
+            goals.goals[1] = Goal(id=1, name='New', state=GoalState.ACTIVE)
+        os.utime(goals_file, ns=(old_mtime_ns + 1, old_mtime_ns + 1))
+        recreated = data.load_goals(test_user)
+
+        assert recreated.version == 1
+        assert goal_index(recreated, goals_file) is not first
+        assert goal_index(recreated, goals_file).goals[1].name == 'New'
+
+
+class TestGoalVelocity:
+    """Tests for the velocity chart series"""
+
+    def test_velocity_series_buckets_completions_by_week(self):
+        from web_app.todoist.visualiser import velocity_series
+
+        # Wednesday 2026-01-07 to Monday 2026-03-02: nine weeks from Monday 01-05
+        dates = [datetime(2026, 1, 7, 9), datetime(2026, 1, 8, 9), datetime(2026, 1, 20, 9),
+                 datetime(2026, 2, 2, 9), datetime(2026, 3, 2, 9)]
+        goals = [Goal(id=i, name=str(i), state=GoalState.COMPLETED, completion_date=date)
+                 for i, date in enumerate(reversed(dates))]
+
+        series = velocity_series(goals)
+
+        assert series['completions'][0] == '2026-01-07T09:00:00'
+        assert series['weeks'][0] == '2026-01-05T09:00:00'
+        assert len(series['weeks']) == len(series['smoothed']) == 9
+        assert series['max_weekly'] == 2
+        assert series['simple_rate'][:2] == [0.0, 7.0]
+        assert series['simple_rate'][2] == pytest.approx(2 / (13 / 7), abs=1e-3)
+
+    def test_goal_velocity_is_cached_per_goals_version(self, tmp_path, test_user):
+        from web_app.todoist.visualiser import goal_velocity
+
+        data = DataInterface()
+        data.todoist_data_directory = tmp_path
+        with data.edit_goals(test_user) as goals:
+            for day in range(10):
+                goals.goals[day] = Goal(
+                    id=day, name=str(day), state=GoalState.COMPLETED,
+                    completion_date=datetime(2026, 1, 1) + timedelta(weeks=day),
+                )
+        goals_file = data.get_goals_file(test_user)
+
+        first = goal_velocity(data.load_goals(test_user), goals_file)
+
+        assert goal_velocity(data.load_goals(test_user), goals_file) is first
+        assert len(first['completions']) == 10
+
+    def test_velocity_page_plots_client_side(self):
+        template = open('web_app/todoist/templates/goal_velocity.html').read()
+        script = open('web_app/todoist/static/script.js').read()
+
+        assert "data-velocity='{{ velocity|tojson }}'" in template
+        assert 'plotly.js-dist-min@' in template
+        assert 'renderGoalVelocity' in script
+
+
 def test_goal_creation_dates_are_independent_per_instance():
     """Regression guard: the datetime default must be evaluated per-instance
     (default_factory), not once at import — otherwise every Goal would share the
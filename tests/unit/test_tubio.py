@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from bs4 import BeautifulSoup
 from yt_dlp.utils import DownloadError
+import requests
 
 from web_app.tubio.audio_downloader import AudioDownloader, VideoTooLongError, DownloadProgress, get_download_progress, clear_download_progress
 from web_app.tubio.data_interface import (
@@ -46,10 +47,21 @@ def tubio_data(tmp_path):
     data.app_dir = tmp_path / "tubio"
     data.app_audio_dir = data.app_dir / "audio"
     data.app_thumbnails_dir = data.app_dir / "thumbnails"
+    data.app_trash_dir = data.app_dir / "trash"
     data.app_metadata_file = data.app_dir / "metadata.json"
+    data.app_users_dir = data.app_dir / "users"
     return data
 
 
+def _image_bytes(size=(640, 360), image_format="JPEG") -> bytes:
+    from io import BytesIO
+    from PIL import Image
+
+    output = BytesIO()
+    Image.new("RGB", size, (120, 160, 110)).save(output, image_format)
+    return output.getvalue()
+
+
 class TestExtractVideoId:
     """Tests for YouTube URL detection and video ID extraction."""
 
@@ -308,6 +320,152 @@ class TestDownloadThumbnail:
         assert result is None
 
 
+class TestWebpThumbnails:
+    def test_save_stores_each_size_and_drops_the_legacy_jpeg(self, tubio_data):
+        from PIL import Image
+
+        tubio_data.app_thumbnails_dir.mkdir(parents=True)
+        tubio_data.get_legacy_thumbnail_path(101).write_bytes(b'old')
+
+        tubio_data.save_thumbnail(101, _image_bytes())
+
+        with Image.open(tubio_data.get_thumbnail_path(101, 'small')) as small:
+            assert (small.format, small.size) == ('WEBP', (128, 72))
+        with Image.open(tubio_data.get_thumbnail_path(101)) as medium:
+            assert (medium.format, medium.size) == ('WEBP', (320, 180))
+        assert not tubio_data.get_legacy_thumbnail_path(101).exists()
+
+    def test_undecodable_thumbnail_is_rejected(self, tubio_data):
+        from web_app.tubio.thumbnails import ThumbnailError
+
+        with pytest.raises(ThumbnailError):
+            tubio_data.save_thumbnail(101, b'<html>not an image</html>')
+
+    def test_serves_renditions_as_immutable(self, app, tubio_data):
+        from web_app.tubio.routes.media import serve_thumbnail
+
+        tubio_data.save_thumbnail(101, _image_bytes())
+        with (
+            patch('web_app.tubio.routes.media.DataInterface', return_value=tubio_data),
+            app.test_request_context('/tubio/thumbnail/101?size=small'),
+        ):
+            response = serve_thumbnail(101)
+            response.direct_passthrough = False
+
+            assert response.mimetype == 'image/webp'
+            assert response.get_data() == tubio_data.get_thumbnail_path(101, 'small').read_bytes()
+            assert response.headers['ETag'] == '"101-small"'
+            assert response.cache_control.immutable
+            assert response.cache_control.max_age == ConfigManager().tubio.thumbnail_cache_max_age_s
+
+    def test_serves_unconverted_legacy_jpeg_without_immutable(self, app, tubio_data):
+        from web_app.tubio.routes.media import serve_thumbnail
+
+        tubio_data.app_thumbnails_dir.mkdir(parents=True)
+        tubio_data.get_legacy_thumbnail_path(101).write_bytes(b'jpeg')
+        with (
+            patch('web_app.tubio.routes.media.DataInterface', return_value=tubio_data),
+            app.test_request_context('/tubio/thumbnail/101'),
+        ):
+            response = serve_thumbnail(101)
+            assert response.mimetype == 'image/jpeg'
+            assert not response.cache_control.immutable
+            response.close()
+            assert serve_thumbnail(202) == ('', 404)
+
+    def test_backfill_converts_legacy_jpegs_and_fetches_missing(self, tubio_data):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[101] = AudioMetadata(crc=101, title='Legacy', yt_video_id='legacy00001')
+            metadata.audios[202] = AudioMetadata(crc=202, title='Missing', yt_video_id='missing0001')
+            metadata.audios[303] = AudioMetadata(crc=303, title='Done')
+            metadata.audios[404] = AudioMetadata(crc=404, title='Upload')
+        tubio_data.app_thumbnails_dir.mkdir(parents=True)
+        tubio_data.get_legacy_thumbnail_path(101).write_bytes(_image_bytes())
+        tubio_data.save_thumbnail(303, _image_bytes())
+
+        with patch.object(
+            AudioDownloader, 'download_thumbnail', return_value=Path('202.medium.webp'),
+        ) as download:
+            assert AudioDownloader.backfill_thumbnails(data=tubio_data) == 2
+
+        download.assert_called_once_with('missing0001', 202, data=tubio_data)
+        assert tubio_data.get_thumbnail_path(101, 'small').exists()
+        assert tubio_data.thumbnail_crcs() >= {101, 303}
+
+
+class TestAutocomplete:
+    @pytest.fixture(autouse=True)
+    def clear_suggestion_cache(self):
+        from web_app.redis_client import get_redis
+
+        for key in get_redis().scan_iter('nabicat:tubio:suggest:*'):
+            get_redis().delete(key)
+
+    def test_remote_suggestions_are_cached_per_normalized_prefix(self):
+        response = MagicMock(text='["lo fi", ["lo fi beats", "lo fi girl"]]')
+        with patch('web_app.tubio.audio_downloader._youtube_session') as session:
+            session.return_value.get.side_effect = [requests.ConnectionError('down'), response]
+            assert AudioDownloader.suggest_queries('Lo Fi') == []
+            assert AudioDownloader.suggest_queries('Lo Fi') == ['lo fi beats', 'lo fi girl']
+            assert AudioDownloader.suggest_queries('  lo   FI ') == ['lo fi beats', 'lo fi girl']
+
+        assert session.return_value.get.call_count == 2
+        assert session.return_value.get.call_args.kwargs['params']['q'] == 'lo fi'
+
+    def test_title_index_matches_from_any_word_start(self):
+        from web_app.tubio.data_interface import TitleIndex
+
+        titles = TitleIndex(['Daft Punk - Around the World', 'Around  the Bend', 'around the bend', 'Worldwide'])
+
+        assert titles.lookup('around the', 5) == ['Daft Punk - Around the World', 'Around  the Bend']
+        assert titles.lookup('WORLD', 5) == ['Daft Punk - Around the World', 'Worldwide']
+        assert titles.lookup('round', 5) == []
+        assert titles.lookup('a', 1) == ['Daft Punk - Around the World']
+
+    def test_library_titles_survive_other_users_downloads(self, tubio_data):
+        from web_app.tubio.data_interface import library_titles
+
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata('alice') as user_metadata,
+        ):
+            metadata.audios[101] = AudioMetadata(crc=101, title='Lofi Study Mix')
+            user_metadata.add_to_playlist(101)
+        titles = library_titles(tubio_data.load_user_metadata('alice'), tubio_data.get_metadata())
+
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata('bob') as user_metadata,
+        ):
+            metadata.audios[202] = AudioMetadata(crc=202, title='Lofi Hip Hop')
+            user_metadata.add_to_playlist(202)
+        assert library_titles(tubio_data.load_user_metadata('alice'), tubio_data.get_metadata()) is titles
+
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[101].title = 'Lofi Study Mix (Live)'
+        renamed = library_titles(tubio_data.load_user_metadata('alice'), tubio_data.get_metadata())
+        assert renamed.lookup('lofi', 3) == ['Lofi Study Mix (Live)']
+
+    def test_library_titles_lead_the_remote_suggestions(self, client, auth_mock, tubio_data):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[101] = AudioMetadata(crc=101, title='Lofi Study Mix')
+            metadata.audios[202] = AudioMetadata(crc=202, title='Not In My Library Lofi')
+        with tubio_data.edit_user_metadata(auth_mock.id) as user_metadata:
+            user_metadata.add_to_playlist(101)
+        with client.session_transaction() as session:
+            session['_user_id'] = auth_mock.id
+
+        with (
+            patch('web_app.tubio.routes.search.DataInterface', return_value=tubio_data),
+            patch.object(
+                AudioDownloader, 'suggest_queries', return_value=['lofi study mix', 'lofi hip hop'],
+            ),
+        ):
+            response = client.post('/tubio/suggest', data={'youtube_query': 'lofi'})
+
+        assert response.get_json() == {'suggestions': ['Lofi Study Mix', 'lofi hip hop']}
+
+
 class TestSearchYoutubeWithDirectUrl:
     """Tests for search_youtube handling direct URLs."""
 
@@ -363,25 +521,109 @@ class TestSearchYoutubeWithDirectUrl:
 
         assert search_data == {'results': [], 'page': 0, 'total_pages': 1}
 
-    @patch('web_app.tubio.audio_downloader.requests.get')
-    def test_search_with_regular_query_does_normal_search(self, mock_get):
-        mock_response = Mock()
-        mock_response.text = 'var ytInitialData = {};'
-        mock_response.raise_for_status = Mock()
-        mock_get.return_value = mock_response
+    @patch('web_app.tubio.audio_downloader._youtube_session')
+    def test_search_with_regular_query_does_normal_search(self, mock_session):
+        from web_app.redis_client import get_redis
+
+        for key in get_redis().scan_iter('nabicat:tubio:search:*'):
+            get_redis().delete(key)
+        mock_get = mock_session.return_value.get
+        mock_get.return_value.text = 'var ytInitialData = {};'
 
-        results = AudioDownloader.search_youtube('rick astley', set())
+        AudioDownloader.search_youtube('rick astley', set())
+        AudioDownloader.search_youtube('rick astley', set(), page=1)
 
         tiers = ConfigManager().tubio.search_length_filter_sps
         assert mock_get.call_count == len(tiers)
-        assert [
-            request.kwargs["params"]
-            for request in mock_get.call_args_list
-        ] == [
+        assert sorted(
+            (request.kwargs["params"] for request in mock_get.call_args_list),
+            key=lambda params: params.get("sp") or "",
+        ) == [
             {"search_query": "rick astley", **({"sp": tier} if tier else {})}
             for tier in tiers
         ]
 
+    @patch('web_app.tubio.audio_downloader._youtube_session')
+    def test_unparseable_search_pages_are_not_cached(self, mock_session):
+        from web_app.redis_client import get_redis
+        from web_app.tubio.audio_downloader import SearchUnavailableError
+
+        for key in get_redis().scan_iter('nabicat:tubio:search:*'):
+            get_redis().delete(key)
+        mock_get = mock_session.return_value.get
+        mock_get.return_value.text = '<html><body>consent wall</body></html>'
+
+        with pytest.raises(SearchUnavailableError):
+            AudioDownloader.search_youtube('rick astley', set())
+        assert not any(get_redis().scan_iter('nabicat:tubio:search:*'))
+
+        mock_get.return_value.text = 'var ytInitialData = {};'
+        assert AudioDownloader.search_youtube('rick astley', set())['results'] == []
+        assert mock_get.call_count == 2 * len(ConfigManager().tubio.search_length_filter_sps)
+
+    def test_search_results_are_cached_per_query_and_marked_per_user(self):
+        from web_app.redis_client import get_redis
+
+        for key in get_redis().scan_iter('nabicat:tubio:search:*'):
+            get_redis().delete(key)
+        scraped = {
+            'results': [{'video_id': f'video{index:06d}', 'cached': False} for index in range(15)],
+            'filtered_too_long': 2,
+        }
+        with patch.object(
+            AudioDownloader, '_scrape_all_tiers', return_value=scraped,
+        ) as scrape:
+            first = AudioDownloader.search_youtube('lofi', set())
+            second = AudioDownloader.search_youtube('lofi', {'video000012'}, page=1)
+
+        scrape.assert_called_once_with('lofi')
+        assert len(first['results']) == 10
+        assert second['page'] == 1
+        assert [vid['video_id'] for vid in second['results']][:3] == [
+            'video000010', 'video000011', 'video000012',
+        ]
+        assert [vid['cached'] for vid in second['results']][:3] == [False, False, True]
+        assert second['filtered_too_long'] == 2
+
+    def test_identical_in_flight_search_waits_for_the_leader(self, monkeypatch):
+        import threading
+        from web_app.redis_client import get_redis
+
+        for key in get_redis().scan_iter('nabicat:tubio:search:*'):
+            get_redis().delete(key)
+        monkeypatch.setattr(ConfigManager().tubio, 'search_coalesce_poll_interval_s', 0.01)
+        release = threading.Event()
+        scraped = {'results': [{'video_id': 'video000001', 'cached': False}], 'filtered_too_long': 0}
+
+        def slow_scrape(_query):
+            release.wait(5)
+            return scraped
+
+        with patch.object(AudioDownloader, '_scrape_all_tiers', side_effect=slow_scrape) as scrape:
+            leader = threading.Thread(target=AudioDownloader.search_youtube, args=('jazz', set()))
+            leader.start()
+            while not any(get_redis().scan_iter('nabicat:tubio:search:*:lock')):
+                pass
+            threading.Timer(0.1, release.set).start()
+            follower = AudioDownloader.search_youtube('jazz', set())
+            leader.join()
+
+        assert scrape.call_count == 1
+        assert follower['results'][0]['video_id'] == 'video000001'
+
+    def test_mix_results_are_cached_per_seed_but_failures_are_not(self):
+        from web_app.redis_client import get_redis
+
+        for key in get_redis().scan_iter('nabicat:tubio:mix:*'):
+            get_redis().delete(key)
+        mix = [{'video_id': 'mixvideo001', 'duration_s': 120}]
+        with patch.object(AudioDownloader, '_extract_mix', side_effect=[None, mix]) as extract:
+            assert AudioDownloader.get_mix_related('seedvideo01') == []
+            assert AudioDownloader.get_mix_related('seedvideo01') == mix
+            assert AudioDownloader.get_mix_related('seedvideo01') == mix
+
+        assert extract.call_count == 2
+
     @patch.object(AudioDownloader, 'get_video_info')
     def test_search_with_direct_url_raises_video_too_long_error(self, mock_get_info):
         """Test that VideoTooLongError propagates when direct URL video is too long."""
@@ -412,27 +654,36 @@ class TestDownloadProgress:
         assert response.mimetype == 'text/event-stream'
         assert response.get_data(as_text=True) == 'data: {"status": "not_found"}\n\n'
 
-    @patch('web_app.tubio.routes.downloads.get_playlists_data', return_value=[])
-    @patch('web_app.tubio.routes.downloads.get_cached_yt_vid_ids', return_value=set())
-    @patch('web_app.tubio.routes.downloads.AudioDownloader.download_youtube_audio')
-    def test_youtube_download_resolves_playlist_dependencies(
-        self, mock_download, _mock_cached_ids, _mock_playlists, client, auth_mock
+    @patch('web_app.tubio.routes.downloads.enqueue_download', return_value=False)
+    def test_youtube_download_is_queued(
+        self, mock_enqueue, client, auth_mock, tubio_data
     ):
-        mock_download.return_value = Mock(crc=123)
         with client.session_transaction() as session:
             session['_user_id'] = auth_mock.id
 
-        response = client.post(
-            '/tubio/youtube_download',
-            data={'video_id': 'dQw4w9WgXcQ', 'title': 'Test track'},
-            headers={'X-Requested-With': 'XMLHttpRequest'},
-        )
+        with patch('web_app.tubio.routes.downloads.DataInterface', return_value=tubio_data):
+            response = client.post(
+                '/tubio/youtube_download',
+                data={'video_id': 'dQw4w9WgXcQ', 'title': 'Test track'},
+                headers={'X-Requested-With': 'XMLHttpRequest'},
+            )
 
-        assert response.status_code == 200
+        assert response.status_code == 202
         payload = response.get_json()
         assert payload['success'] is True
-        assert 'library_html' in payload
-        assert 'playlists' not in payload
+        assert payload['queued'] is True
+        assert mock_enqueue.call_args.args[:2] == ('dQw4w9WgXcQ', 'Test track')
+
+    def test_library_route_renders_library(self, client, auth_mock, tubio_data):
+        with client.session_transaction() as session:
+            session['_user_id'] = auth_mock.id
+
+        with patch('web_app.tubio.routes.playlists.DataInterface', return_value=tubio_data):
+            response = client.get('/tubio/library')
+
+        assert response.status_code == 200
+        assert 'library_html' in response.get_json()
+        assert response.get_json()['library_version'] == 0
 
     def test_progress_tracking(self):
         clear_download_progress('test123')
@@ -453,6 +704,45 @@ class TestDownloadProgress:
         clear_download_progress('test123')
         assert get_download_progress('test123') is None
 
+    def test_percent_updates_are_coalesced_but_status_changes_are_not(self):
+        from web_app.redis_client import get_redis
+
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe('nabicat:tubio:progress-events:coalesce1')
+        pubsub.get_message(timeout=0.1)
+        progress = DownloadProgress.start('coalesce1')
+        for percent in range(1, 50):
+            progress.update(status='downloading', percent=percent)
+        progress.update(status='processing', percent=100)
+
+        published = []
+        while (message := pubsub.get_message(timeout=0.1)) is not None:
+            published.append(DownloadProgress.from_json('coalesce1', message['data']))
+        pubsub.close()
+
+        assert [update.status for update in published] == ['starting', 'downloading', 'processing']
+        assert get_download_progress('coalesce1').percent == 100
+
+    def test_progress_stream_forwards_published_updates(self, client, auth_mock):
+        import threading
+
+        with client.session_transaction() as session:
+            session['_user_id'] = auth_mock.id
+        progress = DownloadProgress.start('stream1', status='queued')
+        publisher = threading.Timer(
+            0.2, lambda: progress.update(status='complete', percent=100)
+        )
+        publisher.start()
+
+        response = client.get('/tubio/download_progress/stream1')
+        body = response.get_data(as_text=True)
+        publisher.join()
+
+        assert body == (
+            'data: {"status": "queued", "percent": 0.0, "error": null}\n\n'
+            'data: {"status": "complete", "percent": 100, "error": null}\n\n'
+        )
+
     def test_completed_download_returns_persisted_audio(
         self, auth_mock, tubio_data, tmp_path
     ):
@@ -476,7 +766,7 @@ class TestDownloadProgress:
                 'download_audio_file',
                 side_effect=write_download,
             ),
-            patch.object(AudioDownloader, 'download_thumbnail', return_value=None),
+            patch.object(AudioDownloader, 'schedule_thumbnail'),
         ):
             audio = AudioDownloader.download_youtube_audio(
                 video_id,
@@ -487,10 +777,403 @@ class TestDownloadProgress:
         persisted = tubio_data.get_metadata()
         progress = get_download_progress(video_id)
         assert audio == persisted.audios[audio.crc]
-        assert persisted.users[auth_mock.id].get_playlist().audio_crcs == [audio.crc]
+        assert tubio_data.get_user_metadata(auth_mock).get_playlist().audio_crcs == [audio.crc]
         assert tubio_data.get_audio_path(audio.crc).read_bytes() == b'converted-audio'
         assert progress.status == 'complete'
 
+    def test_cancelled_download_reports_cancelled(self, tubio_data, tmp_path):
+        from yt_dlp.utils import DownloadCancelled
+
+        video_id = 'dQw4w9WgXcQ'
+        tubio_data.find_avail_temp_file_path = Mock(
+            return_value=tmp_path / 'download.%(ext)s'
+        )
+
+        def report_progress(_video_id, options):
+            options['progress_hooks'][0]({'status': 'downloading'})
+
+        with (
+            patch(
+                'web_app.tubio.audio_downloader.DataInterface',
+                return_value=tubio_data,
+            ),
+            patch.object(
+                AudioDownloader,
+                'download_audio_file',
+                side_effect=report_progress,
+            ),
+            pytest.raises(DownloadCancelled),
+        ):
+            AudioDownloader.download_youtube_audio(
+                video_id,
+                'Cancelled track',
+                None,
+                should_cancel=lambda: True,
+            )
+
+        assert get_download_progress(video_id).status == 'cancelled'
+        assert tubio_data.get_metadata().audios == {}
+
+    def test_progress_hook_polls_cancellation_at_the_progress_rate(self, monkeypatch):
+        import web_app.tubio.audio_downloader as audio_downloader
+
+        monkeypatch.setattr(ConfigManager().tubio, 'download_progress_max_updates_per_s', 2)
+        clock = iter([0.0, 0.1, 0.2, 0.6, 0.7])
+        monkeypatch.setattr(audio_downloader.time, 'monotonic', lambda: next(clock))
+        should_cancel = Mock(return_value=False)
+        progress = Mock(video_id='dQw4w9WgXcQ')
+        hook = AudioDownloader._progress_hook(progress, should_cancel)
+
+        for _ in range(5):
+            hook({'status': 'downloading', 'downloaded_bytes': 1, 'total_bytes': 2})
+
+        assert should_cancel.call_count == 2
+
+
+class TestCatalogIndex:
+    def test_indexes_are_cached_per_version_and_rebuilt_after_edits(self, tubio_data):
+        from web_app.tubio.data_interface import catalog_index, user_index
+
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata('alice') as user_metadata,
+        ):
+            metadata.audios[1] = AudioMetadata(crc=1, title='One', yt_video_id='video000001')
+            metadata.audios[2] = AudioMetadata(crc=2, title='Two', yt_video_id='video000002')
+            user_metadata.add_to_playlist(1)
+            user_metadata.set_surprise_playlist(Playlist(
+                name='Surprise', audio_crcs=[2], last_active=datetime.now(timezone.utc),
+            ))
+        first = tubio_data.get_metadata()
+        catalog = catalog_index(first, tubio_data.app_metadata_file)
+        index = user_index(
+            tubio_data.load_user_metadata('alice'), first, tubio_data.app_metadata_file,
+        )
+
+        assert first.version == 1
+        assert catalog_index(tubio_data.get_metadata(), tubio_data.app_metadata_file) is catalog
+        assert user_index(
+            tubio_data.load_user_metadata('alice'), first, tubio_data.app_metadata_file,
+        ) is index
+        assert catalog.crc_by_video_id == {'video000001': 1, 'video000002': 2}
+        assert index.owned_video_ids == {'video000001'}
+        assert index.owned_crcs == {1}
+        assert index.playlist_crcs[ConfigManager().tubio.surprise_playlist_storage_key] == {2}
+        assert tubio_data.get_audio_metadata(yt_video_id='video000002').crc == 2
+
+        # A user-only edit leaves the catalog version alone.
+        with tubio_data.edit_user_metadata('alice') as user_metadata:
+            user_metadata.add_to_playlist(2)
+        updated = user_index(
+            tubio_data.load_user_metadata('alice'),
+            tubio_data.get_metadata(),
+            tubio_data.app_metadata_file,
+        )
+
+        assert tubio_data.get_metadata().version == 1
+        assert updated is not index
+        assert updated.owned_video_ids == {'video000001', 'video000002'}
+
+    def test_recreated_user_document_is_not_served_a_stale_index(self, tubio_data):
+        from web_app.tubio.data_interface import user_index
+
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[1] = AudioMetadata(crc=1, title='One', yt_video_id='video000001')
+            metadata.audios[2] = AudioMetadata(crc=2, title='Two', yt_video_id='video000002')
+            with tubio_data.edit_user_metadata('alice') as user_metadata:
+                user_metadata.add_to_playlist(1)
+        catalog = tubio_data.get_metadata()
+        first = tubio_data.load_user_metadata('alice')
+        assert user_index(first, catalog, tubio_data.app_metadata_file).owned_crcs == {1}
+
+        tubio_data.delete_user_data(User(username='alice', password='x', folder='alice', is_admin=False))
+        with tubio_data.edit_user_metadata('alice') as user_metadata:
+            user_metadata.add_to_playlist(2)
+        recreated = tubio_data.load_user_metadata('alice')
+        if recreated._mtime_ns == first._mtime_ns:
+            recreated._mtime_ns += 1
+
+        assert recreated.version == first.version
+        assert user_index(recreated, catalog, tubio_data.app_metadata_file).owned_crcs == {2}
+
+
+class TestUserDocuments:
+    def test_legacy_metadata_is_split_into_user_documents(self, tubio_data):
+        from web_app.tubio.data_interface import Metadata, UserMetadata
+
+        legacy = Metadata(
+            audios={1: AudioMetadata(crc=1, title='One')},
+            users={'alice/bob': UserMetadata(user_id='alice/bob')},
+        )
+        legacy.users['alice/bob'].add_to_playlist(1)
+        tubio_data._save_model(tubio_data.app_metadata_file, legacy)
+
+        metadata = tubio_data.get_metadata()
+
+        assert metadata.users == {}
+        assert set(metadata.audios) == {1}
+        assert tubio_data.load_user_metadata('alice/bob').get_playlist().audio_crcs == [1]
+        assert len(list(tubio_data.app_users_dir.iterdir())) == 1
+
+    def test_restored_legacy_metadata_is_split_again(self, tubio_data):
+        from web_app.tubio.data_interface import Metadata, UserMetadata
+
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[1] = AudioMetadata(crc=1, title='One')
+        assert tubio_data.load_user_metadata('alice').get_playlist().audio_crcs == []
+
+        restored = Metadata(
+            audios={1: AudioMetadata(crc=1, title='One')},
+            users={'alice': UserMetadata(user_id='alice')},
+        )
+        restored.users['alice'].add_to_playlist(1)
+        tubio_data._save_model(tubio_data.app_metadata_file, restored)
+
+        assert tubio_data.load_user_metadata('alice').get_playlist().audio_crcs == [1]
+        assert tubio_data.get_metadata().users == {}
+
+    def test_cleanup_keeps_tracks_referenced_by_any_user(self, tubio_data, monkeypatch):
+        monkeypatch.setattr(ConfigManager().tubio, "unreferenced_grace_period_s", 0)
+        with tubio_data.edit_metadata() as metadata:
+            for crc in (1, 2, 3):
+                metadata.audios[crc] = AudioMetadata(crc=crc, title=str(crc))
+            with tubio_data.edit_user_metadata('alice') as alice:
+                alice.add_to_playlist(1)
+                alice.add_to_playlist(2)
+                alice.set_playback_trim(2, 1, 0)
+            with tubio_data.edit_user_metadata('bob') as bob:
+                bob.add_to_playlist(2)
+        with tubio_data.edit_user_metadata('alice') as alice:
+            alice.get_playlist().audio_crcs = [1]
+
+        tubio_data.cleanup_unused_resources(verify=True)
+
+        metadata = tubio_data.get_metadata()
+        assert set(metadata.audios) == {1, 2}
+        assert set(metadata.trash) == {3}
+        assert tubio_data.load_user_metadata('alice').playback_trims == {}
+
+    def test_playlist_edits_keep_refcounts_and_schedule_unreferenced_tracks(self, tubio_data):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[1] = AudioMetadata(crc=1, title='Shared')
+            with tubio_data.edit_user_metadata('alice') as alice:
+                alice.add_to_playlist(1)
+                alice.add_to_playlist(1, 'Road Trip')
+            with tubio_data.edit_user_metadata('bob') as bob:
+                bob.add_to_playlist(1)
+        assert tubio_data.get_metadata().refcounts == {1: 2}
+
+        with tubio_data.edit_user_metadata('alice') as alice:
+            alice.remove_from_regular_playlists(1)
+        metadata = tubio_data.get_metadata()
+        assert metadata.refcounts == {1: 1}
+        assert metadata.unreferenced == {}
+
+        tubio_data.delete_user_data(User(username='bob', password='x', folder='bob', is_admin=False))
+        metadata = tubio_data.get_metadata()
+        assert metadata.refcounts == {}
+        assert set(metadata.unreferenced) == {1}
+
+        with tubio_data.edit_metadata(), tubio_data.edit_user_metadata('alice') as alice:
+            alice.add_to_playlist(1)
+        metadata = tubio_data.get_metadata()
+        assert metadata.refcounts == {1: 1}
+        assert metadata.unreferenced == {}
+
+    def test_sweep_collects_only_tracks_past_the_grace_period(self, tubio_data):
+        now = datetime.now(timezone.utc)
+        grace = timedelta(seconds=ConfigManager().tubio.unreferenced_grace_period_s)
+        with tubio_data.edit_metadata() as metadata:
+            for crc in (1, 2):
+                metadata.audios[crc] = AudioMetadata(crc=crc, title=str(crc))
+            metadata.unreferenced = {1: now - grace, 2: now}
+
+        assert tubio_data.sweep_unreferenced(now) == 1
+
+        metadata = tubio_data.get_metadata()
+        assert set(metadata.audios) == {2}
+        assert set(metadata.trash) == {1}
+        assert set(metadata.unreferenced) == {2}
+
+    def test_verification_repairs_refcount_drift(self, tubio_data):
+        with tubio_data.edit_metadata() as metadata:
+            for crc in (1, 2):
+                metadata.audios[crc] = AudioMetadata(crc=crc, title=str(crc))
+            with tubio_data.edit_user_metadata('alice') as alice:
+                alice.add_to_playlist(1)
+            metadata.refcounts = {2: 3}
+            metadata.unreferenced = {1: datetime.now(timezone.utc)}
+
+        assert tubio_data.cleanup_unused_resources(verify=True) == 0
+
+        metadata = tubio_data.get_metadata()
+        assert metadata.refcounts == {1: 1}
+        assert set(metadata.unreferenced) == {2}
+        assert set(metadata.audios) == {1, 2}
+
+
+class TestLibraryDiff:
+    def test_download_of_cached_audio_sends_only_the_new_track(
+        self, client, auth_mock, tubio_data
+    ):
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
+            metadata.audios[101] = AudioMetadata(crc=101, title='Old', yt_video_id='video000101')
+            metadata.audios[202] = AudioMetadata(crc=202, title='New', yt_video_id='video000202')
+            user_metadata.add_to_playlist(101)
+        with client.session_transaction() as session:
+            session['_user_id'] = auth_mock.id
+
+        with (
+            patch('web_app.tubio.routes.downloads.DataInterface', return_value=tubio_data),
+            patch('web_app.tubio.routes.downloads.enqueue_download') as enqueue,
+        ):
+            response = client.post(
+                '/tubio/youtube_download',
+                data={'video_id': 'video000202', 'title': 'New'},
+                headers={'X-Requested-With': 'XMLHttpRequest'},
+            )
+
+        enqueue.assert_not_called()
+        library = response.get_json()['library']
+        assert (library['base_version'], library['version']) == (1, 2)
+        favourites = library['playlists']['Favourites']
+        assert favourites['order'] == ['202:0', '101:0']
+        assert list(favourites['tracks']) == ['202:0']
+        assert 'data-track-key="regular:Favourites:202:0"' in favourites['tracks']['202:0']
+
+    def test_trim_resends_the_trimmed_track_everywhere_it_appears(
+        self, client, auth_mock, tubio_data
+    ):
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
+            metadata.audios[101] = AudioMetadata(crc=101, title='Trimmed')
+            metadata.audios[202] = AudioMetadata(crc=202, title='Untouched')
+            user_metadata.get_playlist('Favourites').audio_crcs = [101, 202]
+            user_metadata.get_playlist('Road Trip').audio_crcs = [202]
+            user_metadata.get_playlist('Gym').audio_crcs = [101]
+        with client.session_transaction() as session:
+            session['_user_id'] = auth_mock.id
+
+        with patch('web_app.tubio.routes.media.DataInterface', return_value=tubio_data):
+            response = client.post('/tubio/audio/101/trim', data={
+                'trim_start_s': '3',
+                'trim_end_s': '0',
+            }, headers={'X-Requested-With': 'XMLHttpRequest'})
+
+        playlists = response.get_json()['library']['playlists']
+        assert set(playlists) == {'Favourites', 'Gym'}
+        assert playlists['Favourites']['order'] == ['202:0', '101:0']
+        assert list(playlists['Favourites']['tracks']) == ['101:0']
+        assert 'data-trim-start="3.0"' in playlists['Gym']['tracks']['101:0']
+
+    def test_structural_change_renders_the_documents_own_user(self, app, tubio_data):
+        from web_app.tubio.routes.playlists import library_update
+
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata('carol') as user_metadata,
+        ):
+            metadata.audios[101] = AudioMetadata(crc=101, title='Carol only')
+            user_metadata.add_to_playlist(101)
+        before = tubio_data.load_user_metadata('carol')
+        with tubio_data.edit_user_metadata('carol') as user_metadata:
+            user_metadata.get_playlist('Road Trip')
+
+        with app.test_request_context('/tubio/'):
+            update = library_update(before, data=tubio_data)
+
+        assert update['library_version'] == 2
+        assert 'Carol only' in update['library_html']
+        assert 'Road Trip' in update['library_html']
+
+    def test_thumbnail_listing_is_cached_until_the_directory_changes(self, tubio_data):
+        import os
+
+        assert tubio_data.thumbnail_crcs() == frozenset()
+        tubio_data.save_thumbnail(101, _image_bytes())
+        assert tubio_data.thumbnail_crcs() == {101}
+
+        settled_ns = 1_000_000_000_000_000_000
+        os.utime(tubio_data.app_thumbnails_dir, ns=(settled_ns, settled_ns))
+        listing = tubio_data.thumbnail_crcs()
+        assert tubio_data.thumbnail_crcs() is listing
+
+        tubio_data.get_thumbnail_path(101).unlink()
+        tubio_data.save_thumbnail(202, _image_bytes())
+        assert tubio_data.thumbnail_crcs() == {202}
+
+
+class TestUploadIngest:
+    @staticmethod
+    def _fake_media_commands(codec, duration_s):
+        import json
+        import subprocess
+
+        commands = []
+
+        def run(cmd, **_kwargs):
+            commands.append(cmd)
+            if cmd[0] == 'ffprobe':
+                stdout = json.dumps({
+                    'streams': [{'codec_name': codec}] if codec else [],
+                    'format': {'duration': str(duration_s)},
+                })
+                return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr='')
+            Path(cmd[-1]).write_bytes(b'transcoded')
+            return subprocess.CompletedProcess(cmd, 0, stdout='', stderr='')
+
+        return commands, run
+
+    @pytest.mark.parametrize('codec,stream_copy', [('aac', True), ('mp3', False)])
+    def test_upload_is_spooled_hashed_and_converted_file_to_file(
+        self, tubio_data, monkeypatch, codec, stream_copy
+    ):
+        import binascii
+        import io
+
+        monkeypatch.setattr(ConfigManager().tubio, 'upload_stream_chunk_bytes', 4)
+        upload = b'not-really-audio-bytes'
+        commands, run = self._fake_media_commands(codec, 61.5)
+
+        with patch('web_app.tubio.data_interface.subprocess.run', side_effect=run):
+            crc = tubio_data.save_audio('Upload', io.BytesIO(upload), 'mp4')
+
+        assert crc == binascii.crc32(upload)
+        ffmpeg = commands[-1]
+        assert ffmpeg[0] == 'ffmpeg'
+        assert (ffmpeg[ffmpeg.index('-c:a') + 1] == 'copy') is stream_copy
+        assert (tubio_data.app_audio_dir / f'{crc}.m4a').read_bytes() == b'transcoded'
+        assert list(tubio_data.app_audio_dir.iterdir()) == [tubio_data.app_audio_dir / f'{crc}.m4a']
+        assert tubio_data.get_metadata().audios[crc].is_cached
+
+    @pytest.mark.parametrize('limit,value,codec', [
+        ('upload_max_bytes', 8, 'aac'),
+        ('upload_max_duration_s', 60, 'aac'),
+        (None, None, None),
+    ])
+    def test_rejected_upload_leaves_nothing_behind(
+        self, tubio_data, monkeypatch, limit, value, codec
+    ):
+        import io
+        from web_app.tubio.data_interface import UploadRejectedError
+
+        if limit is not None:
+            monkeypatch.setattr(ConfigManager().tubio, limit, value)
+        commands, run = self._fake_media_commands(codec, 61.5)
+
+        with patch('web_app.tubio.data_interface.subprocess.run', side_effect=run):
+            with pytest.raises(UploadRejectedError):
+                tubio_data.save_audio('Upload', io.BytesIO(b'0123456789abcdef'), 'mp3')
+
+        assert not any(command[0] == 'ffmpeg' for command in commands)
+        assert list(tubio_data.app_audio_dir.iterdir()) == []
+        assert tubio_data.get_metadata().audios == {}
+
 
 class TestTrimAudio:
     def test_playback_trim_is_user_specific_and_zero_resets_it(self):
@@ -508,9 +1191,12 @@ class TestTrimAudio:
     def test_updates_playback_boundaries_without_writing_audio(
         self, client, auth_mock, tubio_data
     ):
-        with tubio_data.edit_metadata() as metadata:
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
             metadata.audios[123] = AudioMetadata(crc=123, title='Original')
-            metadata.get_user(auth_mock.id).get_playlist().audio_crcs = [123]
+            user_metadata.get_playlist().audio_crcs = [123]
         tubio_data.app_audio_dir.mkdir(parents=True)
         audio_path = tubio_data.app_audio_dir / '123.m4a'
         audio_path.write_bytes(b'original-audio')
@@ -555,8 +1241,7 @@ class TestPlaylistMutations:
     def test_deleting_regular_playlist_moves_its_tracks_to_favourites(
         self, client, auth_mock, tubio_data
     ):
-        with tubio_data.edit_metadata() as metadata:
-            user_metadata = metadata.get_user(auth_mock.id)
+        with tubio_data.edit_user_metadata(auth_mock.id) as user_metadata:
             user_metadata.get_playlist("Road Trip").audio_crcs = [101, 202]
 
         with client.session_transaction() as session:
@@ -574,11 +1259,13 @@ class TestPlaylistMutations:
         assert user_metadata.get_playlist("Favourites").audio_crcs == [101, 202]
 
     def test_removing_a_custom_playlist_track_deletes_unreferenced_media(
-        self, client, auth_mock, tubio_data
+        self, client, auth_mock, tubio_data, monkeypatch
     ):
-        with tubio_data.edit_metadata() as metadata:
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
             metadata.audios[101] = AudioMetadata(crc=101, title="Road Song")
-            user_metadata = metadata.get_user(auth_mock.id)
             user_metadata.get_playlist("Favourites").audio_crcs = [101]
             user_metadata.get_playlist("Road Trip").audio_crcs = [101, 101]
             user_metadata.set_playback_trim(101, 1.5, 2)
@@ -602,28 +1289,42 @@ class TestPlaylistMutations:
 
         payload = response.get_json()
         metadata = tubio_data.get_metadata()
-        user_metadata = metadata.users[auth_mock.id]
+        user_metadata = tubio_data.get_user_metadata(auth_mock)
         assert response.status_code == 200
         assert payload['success'] is True
-        assert 'library_html' in payload
+        # Both playlists became empty, so each is re-sent as a whole panel.
+        assert payload['library']['base_version'] == 1
+        assert payload['library']['version'] == 2
+        assert {
+            name: set(change) for name, change in payload['library']['playlists'].items()
+        } == {'Favourites': {'panel_html'}, 'Road Trip': {'panel_html'}}
         assert all(
             101 not in playlist.audio_crcs
             for playlist in user_metadata.get_playlists()
         )
         assert 101 not in user_metadata.playback_trims
-        assert 101 not in metadata.audios
+        assert 101 not in metadata.refcounts
+        assert 101 in metadata.unreferenced
+        tubio_data.reap_trash()
+        assert 101 in tubio_data.get_metadata().audios
+
+        monkeypatch.setattr(ConfigManager().tubio, "unreferenced_grace_period_s", 0)
+        tubio_data.reap_trash()
+        assert 101 not in tubio_data.get_metadata().audios
         assert not (tubio_data.app_audio_dir / "101.m4a").exists()
         assert not (tubio_data.app_thumbnails_dir / "101.jpg").exists()
 
     def test_removing_a_track_preserves_media_referenced_by_another_user(
         self, client, auth_mock, tubio_data
     ):
-        with tubio_data.edit_metadata() as metadata:
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
             metadata.audios[101] = AudioMetadata(crc=101, title="Shared Song")
-            metadata.get_user(auth_mock.id).get_playlist(
-                "Road Trip"
-            ).audio_crcs = [101]
-            metadata.get_user("another-listener").get_playlist().audio_crcs = [101]
+            user_metadata.get_playlist("Road Trip").audio_crcs = [101]
+            with tubio_data.edit_user_metadata("another-listener") as other:
+                other.get_playlist().audio_crcs = [101]
         tubio_data.app_audio_dir.mkdir(parents=True)
         audio_path = tubio_data.app_audio_dir / "101.m4a"
         audio_path.write_bytes(b"shared-audio")
@@ -649,8 +1350,9 @@ class TestPlaylistMutations:
 
         metadata = tubio_data.get_metadata()
         assert response.status_code == 200
-        assert metadata.users[auth_mock.id].playlists["Road Trip"].audio_crcs == []
-        assert metadata.users["another-listener"].get_playlist().audio_crcs == [101]
+        user_metadata = tubio_data.get_user_metadata(auth_mock)
+        assert user_metadata.playlists["Road Trip"].audio_crcs == []
+        assert tubio_data.load_user_metadata("another-listener").get_playlist().audio_crcs == [101]
         assert metadata.audios[101].title == "Shared Song"
         assert audio_path.read_bytes() == b"shared-audio"
         cleanup.assert_not_called()
@@ -658,9 +1360,11 @@ class TestPlaylistMutations:
     def test_moving_tracks_between_regular_playlists_preserves_surprise(
         self, client, auth_mock, tubio_data
     ):
-        with tubio_data.edit_metadata() as metadata:
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
             metadata.audios[101] = AudioMetadata(crc=101, title="Road Song")
-            user_metadata = metadata.get_user(auth_mock.id)
             user_metadata.get_playlist("Favourites").audio_crcs = [101]
             user_metadata.get_playlist("Road Trip")
             user_metadata.set_surprise_playlist(Playlist(
@@ -690,9 +1394,11 @@ class TestPlaylistMutations:
     def test_moving_tracks_rejects_audio_outside_the_users_library(
         self, client, auth_mock, tubio_data
     ):
-        with tubio_data.edit_metadata() as metadata:
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
             metadata.audios[101] = AudioMetadata(crc=101, title="Someone Else's Song")
-            user_metadata = metadata.get_user(auth_mock.id)
             user_metadata.get_playlist("Favourites")
             user_metadata.get_playlist("Road Trip")
 
@@ -726,15 +1432,16 @@ class TestSearchRoutes:
     def test_search_marks_tracks_cached_from_any_regular_playlist(
         self, client, auth_mock, tubio_data
     ):
-        with tubio_data.edit_metadata() as metadata:
+        with (
+            tubio_data.edit_metadata() as metadata,
+            tubio_data.edit_user_metadata(auth_mock.id) as user_metadata,
+        ):
             metadata.audios[101] = AudioMetadata(
                 crc=101,
                 title="Road Song",
                 yt_video_id="abcdefghijk",
             )
-            metadata.get_user(auth_mock.id).get_playlist(
-                "Road Trip"
-            ).audio_crcs = [101]
+            user_metadata.get_playlist("Road Trip").audio_crcs = [101]
 
         with client.session_transaction() as session:
             session['_user_id'] = auth_mock.id
@@ -854,6 +1561,35 @@ class TestAudioRangeResponse:
         assert response.headers["Accept-Ranges"] == "bytes"
         response.close()
 
+    def test_x_accel_redirect_hands_body_to_nginx(self, app, tmp_path, monkeypatch):
+        from web_app.tubio.routes.media import _range_response
+
+        monkeypatch.setattr(ConfigManager(), "x_accel_redirect_enabled", True)
+        monkeypatch.setattr(ConfigManager, "save_data_path", property(lambda self: tmp_path))
+        audio_path = tmp_path / "tubio" / "audio" / "123.m4a"
+        audio_path.parent.mkdir(parents=True)
+        audio_path.write_bytes(b"abcdef")
+
+        with app.test_request_context(
+            "/tubio/audio/123", headers={"Range": "bytes=4-99"}
+        ):
+            response = _range_response(audio_path, "123", "123.m4a")
+
+        assert response.status_code == 200
+        assert response.headers["X-Accel-Redirect"] == "/_nabicat_data/tubio/audio/123.m4a"
+        assert response.headers["ETag"] == '"123"'
+        assert response.headers["Content-Type"] == "audio/mp4"
+        assert "Content-Length" not in response.headers
+        assert response.get_data() == b""
+
+        with app.test_request_context(
+            "/tubio/audio/123", headers={"If-None-Match": '"123"'}
+        ):
+            response = _range_response(audio_path, "123", "123.m4a")
+
+        assert response.status_code == 304
+        assert "X-Accel-Redirect" not in response.headers
+
 
 def test_duplicate_playlist_entries_have_unique_dom_identity(app):
     from web_app.tubio.routes.playlists import add_track_occurrences
@@ -0,0 +1,327 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import web_app.helpers as helpers
+from web_app.config import ConfigManager
+from web_app.redis_client import get_redis
+from web_app.tubio import download_queue
+from web_app.tubio.audio_downloader import get_download_progress
+from web_app.tubio.data_interface import AudioMetadata, DataInterface
+from web_app.users import User
+
+
+@pytest.fixture(scope="module", autouse=True)
+def setup_app():
+    from web_app.app import app
+    from web_app.helpers import limiter, register_all_blueprints
+
+    app.config["TESTING"] = True
+    app.config["WTF_CSRF_ENABLED"] = False
+    limiter.enabled = False
+    if "tubio" not in app.blueprints:
+        register_all_blueprints(app)
+
+
+@pytest.fixture(autouse=True)
+def clean_redis():
+    get_redis().flushall()
+    yield
+    get_redis().flushall()
+
+
+@pytest.fixture
+def alice():
+    return User(username="alice", password="x", folder="alice_folder", is_admin=False)
+
+
+@pytest.fixture
+def bob():
+    return User(username="bob", password="x", folder="bob_folder", is_admin=False)
+
+
+@pytest.fixture
+def tubio_data(tmp_path):
+    data = DataInterface()
+    data.app_dir = tmp_path / "tubio"
+    data.app_audio_dir = data.app_dir / "audio"
+    data.app_thumbnails_dir = data.app_dir / "thumbnails"
+    data.app_trash_dir = data.app_dir / "trash"
+    data.app_metadata_file = data.app_dir / "metadata.json"
+    data.app_users_dir = data.app_dir / "users"
+    return data
+
+
+def _queued() -> list[bytes]:
+    return get_redis().lrange(ConfigManager().tubio.download_queue_redis_key, 0, -1)
+
+
+def _processing() -> list[bytes]:
+    return get_redis().lrange(ConfigManager().tubio.download_processing_redis_key, 0, -1)
+
+
+def _publish(data: DataInterface, video_id: str, crc: int = 321):
+    def download(_video_id, title, user, **_kwargs):
+        assert user is None
+        audio = AudioMetadata(crc=crc, title=title, yt_video_id=video_id, is_cached=True)
+        with data.edit_metadata() as metadata:
+            metadata.audios[crc] = audio
+        return audio
+    return download
+
+
+def test_concurrent_requests_attach_to_one_job(alice, bob):
+    assert download_queue.enqueue_download("vid12345678", "Song", alice) is False
+    assert download_queue.enqueue_download("vid12345678", "Song", bob) is True
+
+    assert _queued() == [b"vid12345678"]
+    assert get_redis().smembers(download_queue._users_key("vid12345678")) == {b"alice", b"bob"}
+    assert get_download_progress("vid12345678").status == "queued"
+
+
+def test_finished_job_is_added_for_every_attached_user(alice, bob, tubio_data):
+    download_queue.enqueue_download("vid12345678", "Song", alice)
+    download_queue.enqueue_download("vid12345678", "Song", bob)
+
+    with (
+        patch.object(download_queue, "DataInterface", return_value=tubio_data),
+        patch.object(
+            download_queue.AudioDownloader, "download_youtube_audio",
+            side_effect=_publish(tubio_data, "vid12345678"),
+        ) as download,
+    ):
+        video_id = download_queue.claim_next_job("token")
+        download_queue.process_job(video_id, "token")
+
+    download.assert_called_once()
+    assert tubio_data.load_user_metadata("alice").get_playlist().audio_crcs == [321]
+    assert tubio_data.load_user_metadata("bob").get_playlist().audio_crcs == [321]
+    assert _queued() == [] and _processing() == []
+    assert not get_redis().exists(download_queue._job_key("vid12345678"))
+
+
+def test_last_user_cancelling_skips_the_download(alice, bob, tubio_data):
+    download_queue.enqueue_download("vid12345678", "Song", alice)
+    download_queue.enqueue_download("vid12345678", "Song", bob)
+
+    assert download_queue.cancel_download("vid12345678", alice) is True
+    assert download_queue.is_cancelled("vid12345678") is False
+    assert download_queue.cancel_download("vid12345678", bob) is True
+    assert download_queue.is_cancelled("vid12345678") is True
+    assert download_queue.cancel_download("vid12345678", bob) is False
+
+    with (
+        patch.object(download_queue, "DataInterface", return_value=tubio_data),
+        patch.object(download_queue.AudioDownloader, "download_youtube_audio") as download,
+    ):
+        download_queue.process_job(download_queue.claim_next_job("token"), "token")
+
+    download.assert_not_called()
+    assert get_download_progress("vid12345678").status == "cancelled"
+    assert _processing() == []
+
+
+def test_failed_attempts_are_retried_until_the_limit(alice, tubio_data):
+    download_queue.enqueue_download("vid12345678", "Song", alice)
+    max_attempts = ConfigManager().tubio.download_max_attempts
+
+    with (
+        patch.object(download_queue, "DataInterface", return_value=tubio_data),
+        patch.object(
+            download_queue.AudioDownloader, "download_youtube_audio",
+            side_effect=RuntimeError("HTTP Error 503"),
+        ) as download,
+    ):
+        for _ in range(max_attempts):
+            download_queue.process_job(download_queue.claim_next_job("token"), "token")
+
+    assert download.call_count == max_attempts
+    assert [call.kwargs["final_attempt"] for call in download.call_args_list] == (
+        [False] * (max_attempts - 1) + [True]
+    )
+    assert _queued() == [] and _processing() == []
+    assert not get_redis().exists(download_queue._job_key("vid12345678"))
+
+
+def test_job_of_a_crashed_worker_is_requeued(alice):
+    download_queue.enqueue_download("vid12345678", "Song", alice)
+    video_id = download_queue.claim_next_job("token")
+
+    assert download_queue.recover_stalled_jobs() == 0
+
+    get_redis().delete(download_queue._lease_key(video_id))
+    get_redis().hset(
+        download_queue._job_key(video_id), "claimed_at",
+        time.time() - ConfigManager().tubio.download_lease_ttl_s - 1,
+    )
+
+    assert download_queue.recover_stalled_jobs() == 1
+    assert _queued() == [b"vid12345678"]
+    assert _processing() == []
+
+
+def test_worker_exits_for_recycling_after_max_jobs(alice, monkeypatch):
+    monkeypatch.setattr(ConfigManager().tubio, "extractor_max_jobs", 2)
+    for video_id in ("vid00000001", "vid00000002", "vid00000003"):
+        download_queue.enqueue_download(video_id, "Song", alice)
+
+    with patch.object(download_queue, "process_job") as process_job:
+        download_queue.run_worker(recycle=True)
+
+    assert [call.args[0] for call in process_job.call_args_list] == ["vid00000001", "vid00000002"]
+    assert _queued() == [b"vid00000003"]
+
+
+def test_dev_worker_thread_is_never_recycled(alice, monkeypatch):
+    monkeypatch.setattr(ConfigManager().tubio, "extractor_max_jobs", 1)
+    for video_id in ("vid00000001", "vid00000002"):
+        download_queue.enqueue_download(video_id, "Song", alice)
+    stop = threading.Event()
+
+    def process(video_id, token):
+        if video_id == "vid00000002":
+            stop.set()
+
+    with patch.object(download_queue, "process_job", side_effect=process) as process_job:
+        download_queue.run_worker(stop)
+
+    assert process_job.call_count == 2
+
+
+def test_download_route_queues_and_returns_immediately(client, alice, tubio_data):
+    original = helpers.login_manager._user_callback
+    helpers.login_manager._user_callback = lambda username: alice if username == alice.id else None
+    try:
+        with client.session_transaction() as session:
+            session["_user_id"] = alice.id
+        with patch(
+            "web_app.tubio.routes.downloads.DataInterface", return_value=tubio_data,
+        ):
+            response = client.post(
+                "/tubio/youtube_download",
+                data={"video_id": "vid12345678", "title": "Song"},
+                headers={"X-Requested-With": "XMLHttpRequest"},
+            )
+        cancel = client.post("/tubio/youtube_download/vid12345678/cancel")
+        missing = client.post("/tubio/youtube_download/vid12345678/cancel")
+    finally:
+        helpers.login_manager._user_callback = original
+
+    assert response.status_code == 202
+    assert response.get_json()["queued"] is True
+    assert _queued() == [b"vid12345678"]
+    assert cancel.status_code == 200
+    assert missing.status_code == 404
+
+
+def _bulk_catalog(data: DataInterface, user: User) -> list[AudioMetadata]:
+    tracks = [AudioMetadata(crc=100, title="Cached", yt_video_id="vid00000000", is_cached=True)] + [
+        AudioMetadata(crc=100 + n, title=f"Song {n}", yt_video_id=f"vid0000000{n}")
+        for n in range(1, 5)
+    ]
+    with data.edit_metadata() as metadata:
+        metadata.audios.update({track.crc: track for track in tracks})
+    with data.edit_user_metadata(user.id) as user_metadata:
+        for track in tracks:
+            user_metadata.add_to_playlist(track.crc, "Road trip")
+    return tracks
+
+
+def test_bulk_cache_feeds_tracks_within_the_concurrency_cap(alice, tubio_data, monkeypatch):
+    monkeypatch.setattr(ConfigManager().tubio, "bulk_cache_concurrency", 2)
+    monkeypatch.setattr(ConfigManager().tubio, "bulk_cache_bandwidth_bytes_per_s", 1_000_000)
+    tracks = _bulk_catalog(tubio_data, alice)
+
+    def publish(video_id, title, user, crc=None, **kwargs):
+        assert user is None and kwargs["ratelimit"] == 500_000
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[crc].is_cached = True
+        return metadata.audios[crc]
+
+    with (
+        patch.object(download_queue, "DataInterface", return_value=tubio_data),
+        patch.object(
+            download_queue.AudioDownloader, "download_youtube_audio", side_effect=publish,
+        ) as download,
+    ):
+        job_id = download_queue.start_bulk_cache(alice, "Road trip", tracks)
+        assert _queued() == [b"vid00000001", b"vid00000002"]
+        assert download_queue.bulk_cache_progress(job_id, tubio_data) == {
+            "user": "alice", "playlist": "Road trip", "total": 5, "cached": 1,
+            "in_flight": 2, "pending": 2, "failed": 0, "percent": 20.0, "done": False,
+        }
+
+        download_queue.process_job(download_queue.claim_next_job("token"), "token")
+        assert download_queue.feed_bulk_caches() == 1
+        assert _queued() == [b"vid00000002", b"vid00000003"]
+
+        while video_id := download_queue.claim_next_job("token"):
+            download_queue.process_job(video_id, "token")
+            download_queue.feed_bulk_caches()
+
+    assert download.call_args_list[0].kwargs["crc"] == 101
+    progress = download_queue.bulk_cache_progress(job_id, tubio_data)
+    assert (progress["cached"], progress["percent"], progress["done"]) == (5, 100.0, True)
+    assert tubio_data.load_user_metadata("alice").get_playlist("Road trip").audio_crcs == [
+        100, 101, 102, 103, 104,
+    ]
+    assert not get_redis().sismember(ConfigManager().tubio.bulk_cache_active_redis_key, job_id)
+
+
+def test_bulk_cache_joins_downloads_already_in_flight(alice, bob, tubio_data):
+    download_queue.enqueue_download("vid00000001", "Song 1", bob)
+    tracks = _bulk_catalog(tubio_data, alice)
+
+    job_id = download_queue.start_bulk_cache(alice, "Road trip", tracks[:2])
+
+    assert _queued() == [b"vid00000001"]
+    assert get_redis().smembers(download_queue._users_key("vid00000001")) == {b"bob"}
+    assert get_redis().hget(download_queue._job_key("vid00000001"), "ratelimit") == b"0"
+    assert download_queue.cancel_download("vid00000001", bob) is True
+    assert download_queue.is_cancelled("vid00000001") is False
+
+    def publish(video_id, title, user, crc=None, **kwargs):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[crc].is_cached = True
+        return metadata.audios[crc]
+
+    with (
+        patch.object(download_queue, "DataInterface", return_value=tubio_data),
+        patch.object(download_queue.AudioDownloader, "download_youtube_audio", side_effect=publish),
+    ):
+        download_queue.process_job(download_queue.claim_next_job("token"), "token")
+
+    progress = download_queue.bulk_cache_progress(job_id, tubio_data)
+    assert (progress["cached"], progress["failed"]) == (2, 0)
+
+
+def test_cache_playlist_route_reports_progress_to_its_owner(client, alice, bob, tubio_data):
+    _bulk_catalog(tubio_data, alice)
+    original = helpers.login_manager._user_callback
+    users = {alice.id: alice, bob.id: bob}
+    helpers.login_manager._user_callback = users.get
+    try:
+        with client.session_transaction() as session:
+            session["_user_id"] = alice.id
+        with (
+            patch("web_app.tubio.routes.downloads.DataInterface", return_value=tubio_data),
+            patch.object(download_queue, "DataInterface", return_value=tubio_data),
+        ):
+            started = client.post("/tubio/cache_playlist", data={"playlist_name": "Road trip"})
+            missing = client.post("/tubio/cache_playlist", data={"playlist_name": "Nope"})
+            job_id = started.get_json()["job_id"]
+            progress = client.get(f"/tubio/cache_playlist/{job_id}")
+            with client.session_transaction() as session:
+                session["_user_id"] = bob.id
+            foreign = client.get(f"/tubio/cache_playlist/{job_id}")
+    finally:
+        helpers.login_manager._user_callback = original
+
+    assert started.status_code == 202
+    assert (started.get_json()["total"], started.get_json()["in_flight"]) == (5, 2)
+    assert "user" not in progress.get_json()
+    assert progress.get_json()["pending"] == 2
+    assert missing.status_code == 404
+    assert foreign.status_code == 404
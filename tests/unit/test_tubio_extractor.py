@@ -0,0 +1,188 @@
+import json
+import threading
+import time
+
+from unittest.mock import patch
+
+import pytest
+
+from web_app.config import ConfigManager
+from web_app.redis_client import get_redis
+from web_app.tubio.extractor import ExtractorError, extract_info, run_extractor
+
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.fixture
+def ydl_class():
+    with patch('web_app.tubio.extractor.yt_dlp.YoutubeDL') as mock_class:
+        mock_class.sanitize_info.side_effect = lambda info: info
+        ydl = mock_class.return_value
+        ydl.__enter__.return_value = ydl
+        ydl.extract_info.side_effect = lambda url, download: {"webpage_url": url, "title": "Song"}
+        yield mock_class
+
+
+@pytest.fixture
+def extractor(ydl_class):
+    config = ConfigManager().tubio
+    client = get_redis()
+    client.delete(config.extractor_alive_redis_key, config.extractor_requests_redis_key)
+    stop = threading.Event()
+    thread = threading.Thread(target=run_extractor, args=(stop,), daemon=True)
+    thread.start()
+    while not client.exists(config.extractor_alive_redis_key):
+        stop.wait(0.01)
+    yield thread
+    stop.set()
+    thread.join()
+    client.delete(config.extractor_alive_redis_key)
+
+
+def test_runs_in_process_without_a_live_extractor(ydl_class):
+    get_redis().delete(ConfigManager().tubio.extractor_alive_redis_key)
+
+    assert extract_info(URL, {"quiet": True}) == {"webpage_url": URL, "title": "Song"}
+    ydl_class.assert_called_once_with({"quiet": True})
+
+
+def test_live_extractor_reuses_a_warm_instance_per_option_set(ydl_class, extractor):
+    assert extract_info(URL, {"quiet": True}) == {"webpage_url": URL, "title": "Song"}
+    assert extract_info(URL, {"quiet": True})["title"] == "Song"
+    extract_info(URL, {"quiet": True, "extract_flat": True})
+
+    assert [call.args[0] for call in ydl_class.call_args_list] == [
+        {"quiet": True},
+        {"quiet": True, "extract_flat": True},
+    ]
+
+
+def test_extractor_failures_are_raised_and_the_instance_replaced(ydl_class, extractor):
+    ydl_class.return_value.extract_info.side_effect = [
+        RuntimeError("Video unavailable"),
+        {"title": "Song"},
+    ]
+
+    with pytest.raises(ExtractorError, match="RuntimeError: Video unavailable"):
+        extract_info(URL, {"quiet": True})
+    assert extract_info(URL, {"quiet": True}) == {"title": "Song"}
+
+    assert ydl_class.call_count == 2
+    ydl_class.return_value.close.assert_called_once()
+
+
+def test_concurrent_callers_are_not_serialised_behind_one_extractor(ydl_class, extractor):
+    def slow_extract(url, download):
+        time.sleep(0.2)
+        return {"title": "Song"}
+
+    ydl_class.return_value.extract_info.side_effect = slow_extract
+    answers, errors = [], []
+
+    def call() -> None:
+        try:
+            answers.append(extract_info(URL, {"quiet": True}, timeout_s=1))
+        except ExtractorError as error:
+            errors.append(error)
+
+    callers = [threading.Thread(target=call) for _ in range(8)]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join()
+
+    assert errors == []
+    assert answers == [{"title": "Song"}] * 8
+
+
+def test_falls_back_in_process_when_the_extractor_dies(ydl_class, monkeypatch):
+    config = ConfigManager().tubio
+    monkeypatch.setattr(config, "extractor_alive_ttl_s", 1)
+    client = get_redis()
+    client.set(config.extractor_alive_redis_key, 1, ex=1)
+    started = time.monotonic()
+    try:
+        assert extract_info(URL, {"quiet": True}, timeout_s=30) == {"webpage_url": URL, "title": "Song"}
+    finally:
+        client.delete(config.extractor_requests_redis_key)
+
+    assert time.monotonic() - started < 5
+    assert client.llen(config.extractor_requests_redis_key) == 0
+    ydl_class.assert_called_once_with({"quiet": True})
+
+
+def test_a_lookup_longer_than_the_alive_ttl_is_not_run_twice(ydl_class, extractor, monkeypatch):
+    config = ConfigManager().tubio
+    monkeypatch.setattr(config, "extractor_alive_ttl_s", 1)
+    # Let the idle extractor refresh its alive key with the shortened TTL.
+    time.sleep(config.extractor_claim_timeout_s + 0.2)
+
+    def slow_extract(url, download):
+        time.sleep(2.5)
+        return {"title": "Song"}
+
+    ydl_class.return_value.extract_info.side_effect = slow_extract
+
+    assert extract_info(URL, {"quiet": True}, timeout_s=10) == {"title": "Song"}
+    assert ydl_class.return_value.extract_info.call_count == 1
+
+
+def test_falls_back_when_the_claiming_extractor_dies(ydl_class, monkeypatch):
+    config = ConfigManager().tubio
+    monkeypatch.setattr(config, "extractor_alive_ttl_s", 1)
+    client = get_redis()
+    stop = threading.Event()
+
+    def claim_then_die() -> None:
+        # Other extractors keep the alive key fresh throughout.
+        while not stop.is_set():
+            client.set(config.extractor_alive_redis_key, 1, ex=1)
+            raw = client.lpop(config.extractor_requests_redis_key)
+            if raw is not None:
+                request_id = json.loads(raw)["id"]
+                client.set(config.extractor_claim_redis_prefix + request_id, 1, ex=1)
+            stop.wait(0.1)
+
+    crashed = threading.Thread(target=claim_then_die, daemon=True)
+    client.set(config.extractor_alive_redis_key, 1, ex=1)
+    crashed.start()
+    started = time.monotonic()
+    try:
+        assert extract_info(URL, {"quiet": True}, timeout_s=30) == {"webpage_url": URL, "title": "Song"}
+    finally:
+        stop.set()
+        crashed.join()
+        client.delete(config.extractor_alive_redis_key, config.extractor_requests_redis_key)
+
+    assert time.monotonic() - started < 5
+    ydl_class.assert_called_once_with({"quiet": True})
+
+
+def test_times_out_when_no_extractor_answers(ydl_class):
+    config = ConfigManager().tubio
+    client = get_redis()
+    client.set(config.extractor_alive_redis_key, 1, ex=config.extractor_alive_ttl_s)
+    try:
+        with pytest.raises(ExtractorError, match="No extractor answered"):
+            extract_info(URL, {"quiet": True}, timeout_s=1)
+    finally:
+        client.delete(config.extractor_alive_redis_key, config.extractor_requests_redis_key)
+    ydl_class.assert_not_called()
+
+
+def test_extractor_exits_for_recycling_after_max_jobs(ydl_class, monkeypatch):
+    config = ConfigManager().tubio
+    monkeypatch.setattr(config, "extractor_max_jobs", 1)
+    client = get_redis()
+    client.set(config.extractor_alive_redis_key, 1, ex=config.extractor_alive_ttl_s)
+    answered = []
+    caller = threading.Thread(target=lambda: answered.append(extract_info(URL, {"quiet": True})))
+    caller.start()
+
+    run_extractor(recycle=True)
+
+    caller.join()
+    assert answered == [{"webpage_url": URL, "title": "Song"}]
+    ydl_class.return_value.close.assert_called_once()
+    client.delete(config.extractor_alive_redis_key)
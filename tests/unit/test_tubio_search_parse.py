@@ -0,0 +1,66 @@
+"""Offline regression suite for the YouTube results-page parser.
+
+Runs against saved pages in tests/unit/fixtures/tubio; see
+scripts/benchmark_search_parse.py for the matching timing comparison.
+"""
+
+import pytest
+
+from pathlib import Path
+
+from web_app.tubio.audio_downloader import AudioDownloader
+
+
+FIXTURES = Path(__file__).parent / "fixtures" / "tubio"
+
+
+def _fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+
+@pytest.mark.parametrize("name", ["search_page_compact.html", "search_page_spaced.html"])
+def test_parses_saved_results_page(name):
+    parsed = AudioDownloader._parse_search_page(_fixture(name), {"aaaaaaaaaa2"})
+
+    assert [r["video_id"] for r in parsed["results"]] == ["aaaaaaaaaa1", "aaaaaaaaaa2", "aaaaaaaaaa4"]
+    assert parsed["filtered_too_long"] == ["aaaaaaaaaa3", "aaaaaaaaaa5"]
+    assert parsed["raw_count"] == 5
+    first, second = parsed["results"][0], parsed["results"][1]
+    # A "};" inside a title ended the old non-greedy regex match early.
+    assert first["title"] == "Lofi beats }; to study to"
+    assert first["description"] == "Relaxing beats"
+    assert first["cached"] is False
+    assert second["cached"] is True
+    assert second["view_count"] == "12,345,678 views"
+    assert second["url"].endswith("aaaaaaaaaa2")
+
+
+def test_decodes_only_the_primary_sections():
+    sections = AudioDownloader._search_result_sections(_fixture("search_page_compact.html"))
+
+    video_ids = [
+        item["videoRenderer"]["videoId"]
+        for section in sections
+        for item in section.get("itemSectionRenderer", {}).get("contents", [])
+        if "videoRenderer" in item
+    ]
+    assert "secondary01" not in video_ids
+    assert "shelfshelf1" not in video_ids
+
+
+def test_page_without_results_parses_empty():
+    parsed = AudioDownloader._parse_search_page(_fixture("search_page_no_results.html"), set())
+
+    assert parsed == {"results": [], "filtered_too_long": [], "raw_count": 0, "parsed": True}
+
+
+@pytest.mark.parametrize("html", [
+    "<html><body>consent wall</body></html>",
+    'var ytInitialData = {"contents": {"twoColumnSearchResultsRenderer": ',
+    'var ytInitialData = {"contents":{"twoColumnSearchResultsRenderer":{"primaryContents":'
+    '{"sectionListRenderer":{"contents":[{"itemSectionRenderer":',
+])
+def test_missing_or_truncated_initial_data_parses_empty(html):
+    parsed = AudioDownloader._parse_search_page(html, set())
+
+    assert parsed == {"results": [], "filtered_too_long": [], "raw_count": 0, "parsed": False}
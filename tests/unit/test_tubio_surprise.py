@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 import json
 from pathlib import Path
@@ -6,6 +7,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 import web_app.helpers as helpers
+from web_app.config import ConfigManager
 from web_app.redis_client import get_redis
 from web_app.tubio.audio_downloader import AudioDownloader
 from web_app.tubio.data_interface import (
@@ -13,8 +15,12 @@ from web_app.tubio.data_interface import (
     DataInterface,
     Metadata,
     Playlist,
+    UserMetadata,
+)
+from web_app.tubio.routes.surprise import (
+    _prefetch_surprise_batch,
+    reserve_audio_metadata,
 )
-from web_app.tubio.routes.surprise import reserve_audio_metadata
 from web_app.users import User
 
 
@@ -30,6 +36,12 @@ def setup_app():
         register_all_blueprints(app)
 
 
+@pytest.fixture(autouse=True)
+def no_background_prefetch(monkeypatch):
+    # A prefetch thread would outlive the per-test patches; tests run it inline.
+    monkeypatch.setattr(ConfigManager().tubio, "surprise_prefetch_enabled", False)
+
+
 @pytest.fixture
 def auth_mock():
     user = User(
@@ -54,12 +66,27 @@ def _surprise(*crcs: int, last_active: datetime | None = None) -> Playlist:
     )
 
 
+def _user(metadata: Metadata, user_id: str) -> UserMetadata:
+    # Tests keep user documents in the legacy `users` field; the mock below
+    # and DataInterface's migration both read them from there.
+    return metadata.users.setdefault(user_id, UserMetadata(user_id=user_id))
+
+
 def _mock_data_interface(metadata: Metadata, tmp_path: Path | None = None):
+    @contextmanager
+    def edit_user_metadata(user_id):
+        yield _user(metadata, user_id)
+
     data = MagicMock()
     data.get_metadata.return_value = metadata
+    data.load_user_metadata.side_effect = (
+        lambda user_id: _user(metadata, user_id).model_copy(deep=True)
+    )
     data.get_user_metadata.side_effect = (
-        lambda user: metadata.get_user(user.id)
+        lambda user: _user(metadata, user.id).model_copy(deep=True)
     )
+    data.edit_user_metadata.side_effect = edit_user_metadata
+    data.iter_user_metadata.side_effect = lambda: iter(list(metadata.users.values()))
     data.edit_metadata.return_value.__enter__.return_value = metadata
     data.has_thumbnail.return_value = False
     if tmp_path is not None:
@@ -78,7 +105,7 @@ class TestPlaylistModel:
 
     def test_user_metadata_filters_temporary_playlist(self):
         metadata = Metadata()
-        user = metadata.get_user("alice")
+        user = _user(metadata, "alice")
         user.get_playlist("Favourites").audio_crcs = [101]
         user.set_surprise_playlist(_surprise(202))
 
@@ -122,13 +149,16 @@ class TestPlaylistModel:
 
 
 class TestSurpriseCleanup:
-    def test_expired_surprise_and_its_resources_are_removed(self, tmp_path):
+    def test_expired_surprise_and_its_resources_are_removed(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(ConfigManager().tubio, "unreferenced_grace_period_s", 0)
         now = datetime.now(timezone.utc)
         data = DataInterface()
         data.app_dir = tmp_path
         data.app_audio_dir = tmp_path / "audio"
         data.app_thumbnails_dir = tmp_path / "thumbnails"
+        data.app_trash_dir = tmp_path / "trash"
         data.app_metadata_file = tmp_path / "metadata.json"
+        data.app_users_dir = tmp_path / "users"
         data.app_audio_dir.mkdir()
         data.app_thumbnails_dir.mkdir()
         metadata = Metadata(audios={
@@ -137,10 +167,10 @@ class TestSurpriseCleanup:
             303: AudioMetadata(crc=303, title="Expired Surprise"),
             404: AudioMetadata(crc=404, title="Unused"),
         })
-        user = metadata.get_user("alice")
+        user = _user(metadata, "alice")
         user.get_playlist("Favourites").audio_crcs = [101]
         user.set_surprise_playlist(_surprise(202, last_active=now))
-        expired_user = metadata.get_user("bob")
+        expired_user = _user(metadata, "bob")
         expired_user.set_surprise_playlist(
             _surprise(303, last_active=now - timedelta(hours=2))
         )
@@ -149,12 +179,14 @@ class TestSurpriseCleanup:
             (data.app_audio_dir / f"{crc}.m4a").write_bytes(b"audio")
             (data.app_thumbnails_dir / f"{crc}.jpg").write_bytes(b"image")
 
-        data.cleanup_unused_resources(now=now)
+        data.cleanup_unused_resources(now=now, verify=True)
 
         cleaned = data.get_metadata()
-        assert cleaned.get_user("alice").get_surprise_playlist() is not None
-        assert cleaned.get_user("bob").get_surprise_playlist() is None
+        assert data.load_user_metadata("alice").get_surprise_playlist() is not None
+        assert data.load_user_metadata("bob").get_surprise_playlist() is None
         assert set(cleaned.audios) == {101, 202}
+        assert set(cleaned.trash) == {303, 404}
+        data.reap_trash()
         assert not (data.app_audio_dir / "303.m4a").exists()
         assert not (data.app_thumbnails_dir / "303.jpg").exists()
 
@@ -164,6 +196,7 @@ class TestSurpriseCleanup:
         data.app_audio_dir = data.app_dir / "audio"
         data.app_thumbnails_dir = data.app_dir / "thumbnails"
         data.app_metadata_file = data.app_dir / "metadata.json"
+        data.app_users_dir = data.app_dir / "users"
         metadata = Metadata(audios={
             101: AudioMetadata(
                 crc=101,
@@ -176,7 +209,7 @@ class TestSurpriseCleanup:
                 yt_video_id="video000002",
             ),
         })
-        user = metadata.get_user("alice")
+        user = _user(metadata, "alice")
         user.get_playlist("Favourites").audio_crcs = [101]
         user.set_surprise_playlist(_surprise(202))
         data._save_model(data.app_metadata_file, metadata)
@@ -190,14 +223,14 @@ class TestSurpriseCleanup:
             sync=False,
         )
         assert set(backed_up.audios) == {101}
-        assert backed_up.get_user("alice").get_surprise_playlist() is None
+        assert backed_up.users["alice"].get_surprise_playlist() is None
 
 class TestLazyCache:
-    @patch.object(AudioDownloader, "download_thumbnail")
+    @patch.object(AudioDownloader, "schedule_thumbnail")
     @patch.object(AudioDownloader, "download_audio_file")
     @patch("web_app.tubio.audio_downloader.DataInterface")
     def test_materializes_audio_without_playlist_membership(
-        self, data_class, download_audio, download_thumbnail, tmp_path
+        self, data_class, download_audio, schedule_thumbnail, tmp_path
     ):
         scratch = tmp_path / "scratch.%(ext)s"
         (tmp_path / "scratch.m4a").write_bytes(b"audio")
@@ -316,6 +349,9 @@ class TestSurpriseRoutes:
             assert 'data-tubio-action="suggest-more"' in html
         assert 'data-tubio-action="favourite-surprise"' not in regular
         assert 'data-tubio-action="favourite-surprise"' in surprise
+        assert 'data-tubio-action="pin-offline"' in regular
+        assert 'data-tubio-action="cache-playlist"' in regular
+        assert 'data-tubio-action="pin-offline"' not in surprise
         assert "Converts on play" not in surprise
         assert "Downloads on play" not in surprise
 
@@ -335,7 +371,7 @@ class TestSurpriseRoutes:
                 source_url="https://www.youtube.com/watch?v=video000001",
             ),
         })
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.set_surprise_playlist(_surprise(101))
         data = _mock_data_interface(metadata)
 
@@ -357,7 +393,7 @@ class TestSurpriseRoutes:
     ):
         old_time = datetime.now(timezone.utc) - timedelta(minutes=30)
         metadata = Metadata()
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.set_surprise_playlist(_surprise(101, last_active=old_time))
         data = _mock_data_interface(metadata)
 
@@ -385,7 +421,7 @@ class TestSurpriseRoutes:
             is_cached=False,
         )
         metadata = Metadata(audios={101: audio})
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.set_surprise_playlist(_surprise(101, last_active=old_time))
         data = _mock_data_interface(metadata, tmp_path)
 
@@ -433,10 +469,36 @@ class TestSurpriseRoutes:
         assert "playlist" not in payload
         assert payload["last_active"] is not None
         assert all(not audio.is_cached for audio in metadata.audios.values())
-        assert metadata.get_user(auth_mock.id).get_surprise_playlist() is not None
+        assert _user(metadata, auth_mock.id).get_surprise_playlist() is not None
         data.cleanup_unused_resources.assert_called_once()
         download_audio.assert_not_called()
 
+    @patch("web_app.tubio.routes.surprise.AudioDownloader.get_mix_related")
+    @patch("web_app.tubio.routes.surprise.get_cached_yt_vid_ids")
+    def test_generation_stops_fetching_mixes_once_enough_are_found(
+        self, owned, related, client, auth_mock
+    ):
+        seeds = {f"seed{i:07d}" for i in range(40)}
+        owned.return_value = seeds
+        related.side_effect = lambda seed: [{
+            "video_id": f"mix-{seed}",
+            "title": f"From {seed}",
+            "duration_s": 120,
+        }]
+        data = _mock_data_interface(Metadata())
+
+        with patch("web_app.tubio.routes.surprise.DataInterface", return_value=data):
+            with client.session_transaction() as session:
+                session["_user_id"] = auth_mock.id
+            response = client.post(
+                "/tubio/surprise",
+                headers={"Accept": "application/json"},
+            )
+
+        assert response.status_code == 200
+        assert len(response.get_json()["playlist"]["audio_crcs"]) == 5
+        assert related.call_count < len(seeds)
+
     @patch("web_app.tubio.routes.surprise.AudioDownloader.get_mix_related")
     def test_seeded_generation_uses_only_accessible_selected_track(
         self, related, client, auth_mock
@@ -470,7 +532,7 @@ class TestSurpriseRoutes:
                 yt_video_id="ownedvideo2",
             ),
         })
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.get_playlist().audio_crcs = [202]
         user.set_surprise_playlist(_surprise(101))
         data = _mock_data_interface(metadata)
@@ -512,7 +574,7 @@ class TestSurpriseRoutes:
         metadata = Metadata(audios={
             101: AudioMetadata(crc=101, title="Uploaded recording"),
         })
-        metadata.get_user(auth_mock.id).get_playlist().audio_crcs = [101]
+        _user(metadata, auth_mock.id).get_playlist().audio_crcs = [101]
         data = _mock_data_interface(metadata)
 
         with patch("web_app.tubio.routes.surprise.DataInterface", return_value=data):
@@ -545,7 +607,7 @@ class TestSurpriseRoutes:
                 yt_video_id="existing01",
             ),
         })
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.get_playlist().audio_crcs = [101]
         user.set_surprise_playlist(_surprise(202))
         data = _mock_data_interface(metadata)
@@ -602,7 +664,7 @@ class TestSurpriseRoutes:
                 yt_video_id="expiredvideo",
             ),
         })
-        metadata.get_user(auth_mock.id).set_surprise_playlist(
+        _user(metadata, auth_mock.id).set_surprise_playlist(
             _surprise(
                 101,
                 last_active=datetime.now(timezone.utc) - timedelta(hours=2),
@@ -639,7 +701,7 @@ class TestSurpriseRoutes:
                 yt_video_id="oldvideo001",
             ),
         })
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.set_surprise_playlist(_surprise(101))
         data = _mock_data_interface(metadata)
 
@@ -655,13 +717,50 @@ class TestSurpriseRoutes:
         assert len(user.get_surprise_playlist().audio_crcs) == 2
         assert response.get_json()["playlist"]["audio_crcs"][0] == 101
 
+    @pytest.mark.parametrize("changed_since_prefetch", [False, True])
+    @patch("web_app.tubio.routes.surprise.AudioDownloader.get_mix_related")
+    @patch("web_app.tubio.routes.surprise.get_cached_yt_vid_ids", return_value={"seed000000a"})
+    def test_growth_uses_prefetched_batch_until_library_changes(
+        self, owned, related, changed_since_prefetch, client, auth_mock
+    ):
+        related.return_value = [{
+            "video_id": "prefetched1",
+            "title": "Prefetched track",
+            "duration_s": 120,
+        }]
+        metadata = Metadata(audios={
+            101: AudioMetadata(crc=101, title="Current", yt_video_id="oldvideo001"),
+        })
+        user = _user(metadata, auth_mock.id)
+        user.set_surprise_playlist(_surprise(101))
+        data = _mock_data_interface(metadata)
+        _prefetch_surprise_batch(auth_mock, user.get_surprise_playlist(), data)
+        related.reset_mock()
+        if changed_since_prefetch:
+            owned.return_value = {"seed000000a", "newlyadded1"}
+
+        with patch("web_app.tubio.routes.surprise.DataInterface", return_value=data):
+            with client.session_transaction() as session:
+                session["_user_id"] = auth_mock.id
+            response = client.post(
+                "/tubio/surprise/grow",
+                headers={"Accept": "application/json"},
+            )
+
+        assert response.status_code == 200
+        assert len(user.get_surprise_playlist().audio_crcs) == 2
+        assert related.called is changed_since_prefetch
+        assert get_redis().get(
+            ConfigManager().tubio.surprise_prefetch_redis_prefix + auth_mock.id
+        ) is None
+
     @patch("web_app.tubio.routes.surprise.AudioDownloader.get_mix_related", return_value=[])
     @patch("web_app.tubio.routes.surprise.get_cached_yt_vid_ids", return_value={"seed000000a"})
     def test_failed_refresh_preserves_existing_playlist_and_still_cleans(
         self, owned, related, client, auth_mock
     ):
         metadata = Metadata()
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         old_time = datetime.now(timezone.utc) - timedelta(minutes=30)
         existing = _surprise(101, last_active=old_time)
         user.set_surprise_playlist(existing)
@@ -698,7 +797,7 @@ class TestSurpriseRoutes:
                 yt_video_id="oldvideo001",
             ),
         })
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.set_surprise_playlist(_surprise(101))
         data = _mock_data_interface(metadata)
 
@@ -720,7 +819,7 @@ class TestSurpriseRoutes:
             101: AudioMetadata(crc=101, title="First"),
             202: AudioMetadata(crc=202, title="Second"),
         })
-        user = metadata.get_user(auth_mock.id)
+        user = _user(metadata, auth_mock.id)
         user.set_surprise_playlist(_surprise(101, 202))
         data = _mock_data_interface(metadata)
 
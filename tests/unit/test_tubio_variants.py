@@ -0,0 +1,175 @@
+"""Opus streaming variants: selection, serving and cleanup."""
+
+import os
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+from web_app.tubio.data_interface import AudioMetadata, DataInterface
+from web_app.tubio.variants import select_quality, transcode_variant
+from web_app.users import User
+import web_app.helpers as helpers
+
+
+@pytest.fixture(scope='module', autouse=True)
+def setup_app():
+    from web_app.app import app
+    from web_app.helpers import limiter, register_all_blueprints
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.secret_key = 'test-secret-key'
+    limiter.enabled = False
+    if 'tubio' not in app.blueprints:
+        register_all_blueprints(app)
+
+
+@pytest.fixture
+def logged_in(client):
+    user = User(username='tubio-user', password='testpass', folder='test_folder', is_admin=False)
+    original_user_loader = helpers.login_manager._user_callback
+    helpers.login_manager._user_callback = lambda username: user if username == user.id else None
+    with client.session_transaction() as session:
+        session['_user_id'] = user.id
+    yield user
+    helpers.login_manager._user_callback = original_user_loader
+
+
+@pytest.fixture
+def tubio_data(tmp_path):
+    data = DataInterface()
+    data.app_dir = tmp_path / "tubio"
+    data.app_audio_dir = data.app_dir / "audio"
+    data.app_thumbnails_dir = data.app_dir / "thumbnails"
+    data.app_trash_dir = data.app_dir / "trash"
+    data.app_metadata_file = data.app_dir / "metadata.json"
+    data.app_users_dir = data.app_dir / "users"
+    with data.edit_metadata() as metadata:
+        metadata.audios[123] = AudioMetadata(crc=123, title='Song', is_cached=True)
+    data.app_audio_dir.mkdir(parents=True)
+    data.get_audio_path(123).write_bytes(b"original-audio")
+    with patch('web_app.tubio.routes.media.DataInterface', return_value=data):
+        yield data
+
+
+@pytest.mark.parametrize(("requested", "headers", "expected"), [
+    ("medium", {"Save-Data": "on"}, "medium"),
+    ("original", {"ECT": "2g"}, None),
+    (None, {"Save-Data": "on", "ECT": "4g"}, "low"),
+    (None, {"ECT": "3g"}, "medium"),
+    (None, {"ECT": "4g"}, None),
+    (None, {}, None),
+])
+def test_select_quality(requested, headers, expected):
+    assert select_quality(requested, headers) == expected
+
+
+class TestServeVariant:
+    def test_a_ready_variant_is_served_from_its_own_url(self, client, logged_in, tubio_data):
+        tubio_data.get_variant_path(123, "low").write_bytes(b"opus-variant")
+
+        response = client.get('/tubio/audio/123?quality=low', headers={'Range': 'bytes=0-'})
+
+        assert response.status_code == 302
+        assert response.location.endswith('/tubio/audio/123/variant/low')
+        variant = client.get(response.location, headers={'Range': 'bytes=5-'})
+        assert variant.status_code == 206
+        assert variant.data == b"variant"
+        assert variant.mimetype == 'audio/webm'
+        mtime_ns = tubio_data.get_variant_path(123, "low").stat().st_mtime_ns
+        assert variant.headers['ETag'] == f'"123-low-{mtime_ns}"'
+        assert variant.headers['Content-Range'] == 'bytes 5-11/12'
+
+    def test_variant_etag_changes_when_it_is_transcoded_again(self, client, logged_in, tubio_data):
+        variant_path = tubio_data.get_variant_path(123, "low")
+        variant_path.write_bytes(b"opus-variant")
+        first = client.get('/tubio/audio/123/variant/low').headers['ETag']
+        variant_path.write_bytes(b"opus-again")
+        os.utime(variant_path, ns=(0, variant_path.stat().st_mtime_ns + 1))
+
+        response = client.get('/tubio/audio/123/variant/low', headers={'If-None-Match': first})
+
+        assert response.status_code == 200
+        assert response.data == b"opus-again"
+
+    def test_ranges_keep_the_representation_the_stream_started_with(self, client, logged_in, tubio_data):
+        with patch('web_app.tubio.routes.media.schedule_variant', return_value=True) as schedule:
+            started = client.get('/tubio/audio/123', headers={'ECT': '2g'})
+        tubio_data.get_variant_path(123, "low").write_bytes(b"opus-variant")
+
+        resumed = client.get('/tubio/audio/123', headers={'ECT': '2g', 'Range': 'bytes=9-'})
+
+        assert started.data == b"original-audio"
+        schedule.assert_called_once_with(123, "low")
+        assert resumed.status_code == 206
+        assert resumed.data == b"audio"
+        assert resumed.mimetype == 'audio/mp4'
+
+    def test_missing_variant_serves_original_and_schedules_it(self, client, logged_in, tubio_data):
+        with patch('web_app.tubio.routes.media.schedule_variant', return_value=True) as schedule:
+            response = client.get('/tubio/audio/123', headers={'ECT': '3g'})
+
+        assert response.status_code == 200
+        assert response.data == b"original-audio"
+        assert response.mimetype == 'audio/mp4'
+        assert {'Save-Data', 'ECT'} <= set(response.vary)
+        schedule.assert_called_once_with(123, "medium")
+
+    def test_original_quality_ignores_client_hints(self, client, logged_in, tubio_data):
+        tubio_data.get_variant_path(123, "low").write_bytes(b"opus-variant")
+
+        with patch('web_app.tubio.routes.media.schedule_variant') as schedule:
+            response = client.get('/tubio/audio/123?quality=original', headers={'Save-Data': 'on'})
+
+        assert response.data == b"original-audio"
+        assert 'ECT' not in response.vary
+        schedule.assert_not_called()
+
+    def test_rejects_unknown_quality(self, client, logged_in, tubio_data):
+        response = client.get('/tubio/audio/123?quality=lossless')
+
+        assert response.status_code == 400
+
+
+class TestVariantLifecycle:
+    def test_transcode_is_dropped_when_the_track_was_collected(self, tubio_data):
+        def collect_while_transcoding(cmd, **kwargs):
+            with open(cmd[-1], "wb") as output:
+                output.write(b"opus-variant")
+            with tubio_data.edit_metadata() as metadata:
+                metadata.audios.pop(123)
+
+        with patch('web_app.tubio.variants.subprocess.run', side_effect=collect_while_transcoding):
+            assert transcode_variant(123, "low", data=tubio_data) is False
+
+        assert list(tubio_data.app_audio_dir.iterdir()) == [tubio_data.app_audio_dir / "123.m4a"]
+
+    def test_cleanup_trashes_orphaned_and_retired_variants(self, tubio_data):
+        kept = tubio_data.get_variant_path(123, "low")
+        kept.write_bytes(b"kept")
+        orphaned = tubio_data.app_audio_dir / "456.32k.webm"
+        orphaned.write_bytes(b"orphaned")
+        retired = tubio_data.app_audio_dir / "123.96k.webm"
+        retired.write_bytes(b"retired")
+        with tubio_data.edit_user_metadata('listener') as user_metadata:
+            user_metadata.add_to_playlist(123)
+
+        tubio_data.cleanup_unused_resources(verify=True)
+
+        assert kept.exists()
+        assert not orphaned.exists()
+        assert not retired.exists()
+        assert sorted(path.name for path in tubio_data.app_trash_dir.iterdir()) == [
+            "123.96k.webm", "456.32k.webm",
+        ]
+
+    def test_reaping_trashed_audio_removes_its_variants(self, tubio_data):
+        variant = tubio_data.get_variant_path(123, "medium")
+        variant.write_bytes(b"variant")
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios.pop(123)
+            metadata.trash[123] = datetime.now(timezone.utc)
+
+        tubio_data.reap_trash()
+
+        assert not variant.exists()
@@ -0,0 +1,200 @@
+"""Waveform peaks encoding and the route that serves them.
+
+See scripts/benchmark_waveform_peaks.py for the matching timing comparison.
+"""
+
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from unittest.mock import patch
+
+from web_app.tubio.data_interface import AudioMetadata, DataInterface
+from web_app.tubio.waveform import PEAKS_HEADER, PEAKS_LEVEL, PEAKS_MAGIC, extract_peaks
+from web_app.users import User
+import web_app.helpers as helpers
+
+
+@pytest.fixture(scope='module', autouse=True)
+def setup_app():
+    from web_app.app import app
+    from web_app.helpers import limiter, register_all_blueprints
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.secret_key = 'test-secret-key'
+    limiter.enabled = False
+    if 'tubio' not in app.blueprints:
+        register_all_blueprints(app)
+
+
+@pytest.fixture
+def logged_in(client):
+    user = User(username='tubio-user', password='testpass', folder='test_folder', is_admin=False)
+    original_user_loader = helpers.login_manager._user_callback
+    helpers.login_manager._user_callback = lambda username: user if username == user.id else None
+    with client.session_transaction() as session:
+        session['_user_id'] = user.id
+    yield user
+    helpers.login_manager._user_callback = original_user_loader
+
+
+@pytest.fixture
+def tubio_data(tmp_path):
+    data = DataInterface()
+    data.app_dir = tmp_path / "tubio"
+    data.app_audio_dir = data.app_dir / "audio"
+    data.app_thumbnails_dir = data.app_dir / "thumbnails"
+    data.app_trash_dir = data.app_dir / "trash"
+    data.app_metadata_file = data.app_dir / "metadata.json"
+    data.app_users_dir = data.app_dir / "users"
+    with patch('web_app.tubio.routes.media.DataInterface', return_value=data):
+        yield data
+
+
+def _parse(blob: bytes) -> tuple[tuple, list[np.ndarray]]:
+    header = PEAKS_HEADER.unpack_from(blob)
+    offset = PEAKS_HEADER.size
+    counts = []
+    for _ in range(header[2]):
+        counts.append(PEAKS_LEVEL.unpack_from(blob, offset)[0])
+        offset += PEAKS_LEVEL.size
+    levels = []
+    for count in counts:
+        levels.append(np.frombuffer(blob, dtype=np.int8, count=2 * count, offset=offset).reshape(-1, 2))
+        offset += 2 * count
+    assert offset == len(blob)
+    return header, levels
+
+
+def _chunked(pcm: bytes, size: int) -> list[bytes]:
+    return [pcm[start:start + size] for start in range(0, len(pcm), size)]
+
+
+class TestExtractPeaks:
+    def test_encodes_min_max_pairs_per_level(self):
+        samples = np.zeros(10 * 4, dtype="<i2")
+        samples[0] = 32767
+        samples[5] = -32767
+        samples[38] = 16384
+
+        blob = extract_peaks(
+            [samples.tobytes()], sample_rate=8000, bucket_samples=4, levels=3, level_factor=4,
+        )
+        header, levels = _parse(blob)
+
+        assert header == (PEAKS_MAGIC, 1, 3, 4, 8000, 4)
+        assert [len(level) for level in levels] == [10, 3, 1]
+        assert levels[0][0].tolist() == [0, 127]
+        assert levels[0][1].tolist() == [-127, 0]
+        assert levels[0][9].tolist() == [0, 64]
+        assert levels[1].tolist() == [[-127, 127], [0, 0], [0, 64]]
+        assert levels[2].tolist() == [[-127, 127]]
+
+    def test_partial_tail_bucket_is_kept(self):
+        samples = np.array([1, 2, 3, 4, -32767], dtype="<i2")
+
+        _, levels = _parse(extract_peaks(
+            [samples.tobytes()], sample_rate=8000, bucket_samples=4, levels=1, level_factor=4,
+        ))
+
+        assert levels[0].tolist() == [[0, 0], [-127, -127]]
+
+    def test_result_does_not_depend_on_chunk_boundaries(self):
+        rng = np.random.default_rng(7)
+        pcm = rng.integers(-32768, 32767, size=10_001, dtype=np.int16).astype("<i2").tobytes()
+        options = dict(sample_rate=8000, bucket_samples=256, levels=4, level_factor=4)
+
+        whole = extract_peaks([pcm], **options)
+
+        for size in (1, 333, 512, 4097):
+            assert extract_peaks(_chunked(pcm, size), **options) == whole
+
+    def test_empty_stream_has_empty_levels(self):
+        _, levels = _parse(extract_peaks(
+            [], sample_rate=8000, bucket_samples=256, levels=2, level_factor=4,
+        ))
+
+        assert [len(level) for level in levels] == [0, 0]
+
+
+class TestServePeaks:
+    def test_serves_stored_peaks(self, client, logged_in, tubio_data):
+        tubio_data.app_audio_dir.mkdir(parents=True)
+        tubio_data.get_peaks_path(123).write_bytes(b"peaks")
+
+        response = client.get('/tubio/audio/123/peaks')
+
+        assert response.status_code == 200
+        assert response.data == b"peaks"
+        assert response.mimetype == 'application/octet-stream'
+        assert response.headers['ETag'] == f'"123-{tubio_data.get_peaks_path(123).stat().st_mtime_ns}"'
+
+    def test_etag_changes_when_peaks_are_rewritten(self, client, logged_in, tubio_data):
+        tubio_data.app_audio_dir.mkdir(parents=True)
+        peaks_path = tubio_data.get_peaks_path(123)
+        peaks_path.write_bytes(b"peaks")
+        first = client.get('/tubio/audio/123/peaks').headers['ETag']
+        peaks_path.write_bytes(b"other")
+        os.utime(peaks_path, ns=(0, peaks_path.stat().st_mtime_ns + 1))
+
+        response = client.get('/tubio/audio/123/peaks', headers={'If-None-Match': first})
+
+        assert response.status_code == 200
+        assert response.data == b"other"
+
+    def test_missing_peaks_are_scheduled(self, client, logged_in, tubio_data):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[123] = AudioMetadata(crc=123, title='Song', is_cached=True)
+
+        with patch('web_app.tubio.routes.media.schedule_peaks', return_value=True) as schedule:
+            response = client.get('/tubio/audio/123/peaks')
+
+        assert response.status_code == 202
+        assert response.headers['Retry-After'] == '3'
+        schedule.assert_called_once_with(123)
+
+    def test_uncached_audio_has_no_peaks(self, client, logged_in, tubio_data):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios[123] = AudioMetadata(crc=123, title='Song')
+
+        with patch('web_app.tubio.routes.media.schedule_peaks') as schedule:
+            response = client.get('/tubio/audio/123/peaks')
+
+        assert response.status_code == 404
+        schedule.assert_not_called()
+
+
+def test_peaks_of_a_collected_track_are_not_published(tubio_data):
+    from web_app.tubio.waveform import compute_peaks
+
+    with tubio_data.edit_metadata() as metadata:
+        metadata.audios[123] = AudioMetadata(crc=123, title='Song', is_cached=True)
+    tubio_data.app_audio_dir.mkdir(parents=True)
+    tubio_data.get_audio_path(123).write_bytes(b"audio")
+
+    def collect_while_decoding(_path):
+        with tubio_data.edit_metadata() as metadata:
+            metadata.audios.pop(123)
+        yield b"\0\0" * 64
+
+    with patch('web_app.tubio.waveform.decode_pcm', side_effect=collect_while_decoding):
+        assert compute_peaks(123, data=tubio_data) is False
+
+    assert not tubio_data.get_peaks_path(123).exists()
+
+
+def test_reaping_trashed_audio_removes_its_peaks(tubio_data):
+    with tubio_data.edit_metadata() as metadata:
+        metadata.audios[123] = AudioMetadata(crc=123, title='Song', is_cached=True)
+    tubio_data.app_audio_dir.mkdir(parents=True)
+    tubio_data.get_audio_path(123).write_bytes(b"audio")
+    tubio_data.get_peaks_path(123).write_bytes(b"peaks")
+    with tubio_data.edit_metadata() as metadata:
+        metadata.audios.pop(123)
+        metadata.trash[123] = datetime.now(timezone.utc)
+
+    tubio_data.reap_trash()
+
+    assert not tubio_data.get_peaks_path(123).exists()
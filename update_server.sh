@@ -184,12 +184,19 @@ rollback() {
         restore_system_file /etc/nginx/conf.d/nabicat.conf nginx.conf
         restore_system_file /etc/systemd/system/nabicat.service nabicat.service
         restore_system_file /etc/systemd/system/meridian.service meridian.service
+        if [[ -f "${BACKUP_DIR}/nabicat-downloads.service.missing" ]]; then
+            sudo systemctl disable --now nabicat-downloads.service || true
+        fi
+        restore_system_file /etc/systemd/system/nabicat-downloads.service nabicat-downloads.service
         restore_scheduled_job_units
         sudo nginx -t
         sudo systemctl daemon-reload
         enable_restored_scheduled_job_timers
         sudo systemctl reload nginx
         sudo systemctl restart nabicat.service
+        if [[ ! -f "${BACKUP_DIR}/nabicat-downloads.service.missing" ]]; then
+            sudo systemctl restart nabicat-downloads.service
+        fi
         if wait_for_commit "http://127.0.0.1:5000/api/health" "$PREVIOUS_COMMIT"; then
             deploy_log "rollback recovered ${PREVIOUS_COMMIT}"
         else
@@ -208,6 +215,7 @@ trap rollback ERR
 backup_system_file /etc/nginx/conf.d/nabicat.conf nginx.conf
 backup_system_file /etc/systemd/system/nabicat.service nabicat.service
 backup_system_file /etc/systemd/system/meridian.service meridian.service
+backup_system_file /etc/systemd/system/nabicat-downloads.service nabicat-downloads.service
 
 deploy_log "deploying ${CANDIDATE_COMMIT} over ${PREVIOUS_COMMIT}"
 ROLLBACK_ARMED=1
@@ -279,6 +287,7 @@ USER_NAME=$(whoami)
 MERIDIAN_BIN=$(which meridian)
 NABICAT_UNIT="${BACKUP_DIR}/nabicat.service.new"
 MERIDIAN_UNIT="${BACKUP_DIR}/meridian.service.new"
+DOWNLOAD_WORKER_UNIT="${BACKUP_DIR}/nabicat-downloads.service.new"
 SCHEDULED_JOB_SERVICE_FILE="${BACKUP_DIR}/${SCHEDULED_JOB_SERVICE_UNIT}.new"
 
 cat >"$NABICAT_UNIT" <<EOF
@@ -321,6 +330,27 @@ RestartSec=3
 WantedBy=multi-user.target
 EOF
 
+cat >"$DOWNLOAD_WORKER_UNIT" <<EOF
+[Unit]
+Description=Nabicat Tubio download workers
+Requires=redis-server.service
+After=network-online.target redis-server.service
+Wants=network-online.target
+StartLimitBurst=5
+StartLimitIntervalSec=60
+
+[Service]
+Type=simple
+User=${USER_NAME}
+WorkingDirectory=${PROJECT_DIR}
+ExecStart=${PYTHON_BIN} -m web_app.tubio.download_queue
+Restart=always
+RestartSec=3
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 cat >"$SCHEDULED_JOB_SERVICE_FILE" <<EOF
 [Unit]
 Description=Nabicat scheduled job (%i)
@@ -353,7 +383,7 @@ WantedBy=timers.target
 EOF
 done
 
-sudo cp nabicat.conf /etc/nginx/conf.d/
+sed "s|__NABICAT_DATA_ROOT__|$HOME/.nabicat/data|g" nabicat.conf | sudo tee /etc/nginx/conf.d/nabicat.conf >/dev/null
 sudo nginx -t
 sudo systemctl reload nginx
 
@@ -379,6 +409,7 @@ if sudo test -f "/etc/systemd/system/${SCHEDULED_JOB_SERVICE_UNIT}" \
 fi
 sudo cp "$NABICAT_UNIT" /etc/systemd/system/nabicat.service
 sudo cp "$MERIDIAN_UNIT" /etc/systemd/system/meridian.service
+sudo cp "$DOWNLOAD_WORKER_UNIT" /etc/systemd/system/nabicat-downloads.service
 sudo cp "$SCHEDULED_JOB_SERVICE_FILE" "/etc/systemd/system/${SCHEDULED_JOB_SERVICE_UNIT}"
 for timer_name in "${SCHEDULED_JOB_TIMER_NAMES[@]}"; do
     sudo cp "${BACKUP_DIR}/${timer_name}.new" "/etc/systemd/system/${timer_name}"
@@ -386,6 +417,7 @@ done
 sudo systemctl daemon-reload
 sudo systemctl enable meridian.service nabicat.service
 sudo systemctl enable --now "${SCHEDULED_JOB_TIMER_NAMES[@]}"
+sudo systemctl enable nabicat-downloads.service
 
 if [[ "$MERIDIAN_UNIT_CHANGED" -eq 1 ]] || ! sudo systemctl is-active --quiet meridian.service; then
     sudo systemctl restart meridian.service
@@ -398,6 +430,8 @@ if sudo systemctl is-active --quiet nabicat.service \
 else
     sudo systemctl restart nabicat.service
 fi
+# Jobs interrupted by the restart are requeued once their lease lapses.
+sudo systemctl restart nabicat-downloads.service
 
 if ! wait_for_commit "http://127.0.0.1:5000/api/health" "$CANDIDATE_COMMIT"; then
     deploy_error "production health check failed for ${CANDIDATE_COMMIT}"
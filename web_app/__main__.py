@@ -1,6 +1,8 @@
 import json
+import os
 import click
 import logging
+import threading
 import time
 import uuid
 import flask_login
@@ -21,6 +23,7 @@ from web_app.helpers import (
 from web_app.redis_client import ensure_local_redis
 from web_app.logging_utils import configure_logging, log_event
 from web_app.loft.data_interface import DataInterface as LoftDataInterface
+from web_app.tubio.download_queue import run_worker as run_download_worker
 from web_app.app import BUILD_VERSION, BUILD_VERSION_IS_TAG, app
 
 
@@ -304,6 +307,12 @@ def cli_start(
     # parent and once in the serving child (WERKZEUG_RUN_MAIN=true). The parent
     # spawns redis-server; the child then finds it already up. That's why cold
     # debug starts log both "Starting local redis-server" and "already running".
+    # Local runs have no download worker service, so the serving process
+    # drains the Tubio download queue itself.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        threading.Thread(
+            target=run_download_worker, name="nabicat-download-worker", daemon=True,
+        ).start()
     app.run(
         host=cfg.server_host,
         port=port,
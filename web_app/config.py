@@ -89,12 +89,100 @@ class TubioConfig:
     upload_allowed_extensions: tuple = ("mp3", "mp4", "m4a")
     upload_transcode_format: str = "mp4"
     upload_transcode_bitrate: str = "128k"
-    download_progress_poll_interval_s: float = 0.3
+    # Uploads are spooled to disk and transcoded by an ffmpeg subprocess.
+    upload_stream_chunk_bytes: int = 1024 * 1024
+    upload_max_bytes: int = 200 * 1024 * 1024
+    upload_max_duration_s: int = 3 * 3600
+    upload_probe_timeout_s: int = 30
+    upload_transcode_timeout_s: int = 600
+    # Thumbnails are stored as WebP at each named size (longest side in px),
+    # fetched on a bounded pool off the request path and served immutable.
+    thumbnail_sizes: tuple = (("small", 128), ("medium", 320))
+    thumbnail_default_size: str = "medium"
+    thumbnail_webp_quality: int = 80
+    thumbnail_fetch_workers: int = 4
+    thumbnail_backfill_concurrency: int = 4
+    thumbnail_cache_max_age_s: int = 365 * 24 * 3600
+    # Catalog indexes cached per worker, keyed on the metadata version.
+    metadata_cache_entries: int = 8
+    # Waveform peaks: min/max per bucket of mono PCM decoded at this rate, with
+    # each further zoom level merging `waveform_level_factor` buckets.
+    waveform_sample_rate: int = 8000
+    waveform_bucket_samples: int = 256
+    waveform_levels: int = 4
+    waveform_level_factor: int = 4
+    waveform_read_chunk_bytes: int = 256 * 1024
+    waveform_decode_timeout_s: int = 600
+    waveform_lock_redis_prefix: str = "nabicat:tubio:waveform-lock:"
+    # Opus variants for slow links, keyed by quality name and transcoded in
+    # the background on first request. Chosen by ?quality= or, failing that,
+    # by the Save-Data and ECT client hints; "original" forces the m4a.
+    audio_variant_bitrates: tuple = (("low", "32k"), ("medium", "64k"))
+    audio_variant_ect_qualities: tuple = (("slow-2g", "low"), ("2g", "low"), ("3g", "medium"))
+    audio_variant_save_data_quality: str = "low"
+    audio_variant_client_hints: str = "Save-Data, ECT"
+    audio_variant_transcode_timeout_s: int = 600
+    audio_variant_lock_redis_prefix: str = "nabicat:tubio:variant-lock:"
+    # Percent-only progress writes are coalesced to this rate per video; an SSE
+    # stream with no published update re-reads the record after the keepalive.
+    download_progress_max_updates_per_s: float = 4.0
+    download_progress_keepalive_s: float = 15.0
     # TTL for the Redis download-progress record. Outlives a normal download so
     # the SSE client (possibly on another gunicorn worker) can read it; expires
     # on its own if a download dies without clearing the key.
     download_progress_ttl_s: int = 3600
     download_progress_redis_prefix: str = "nabicat:tubio:progress:"
+    download_progress_channel_prefix: str = "nabicat:tubio:progress-events:"
+    # YouTube downloads run in dedicated worker processes fed by a Redis list.
+    # A job is keyed by video id, so concurrent requests for the same video
+    # attach to it. Claimed jobs sit in the processing list behind a renewed
+    # lease; one whose lease lapsed belongs to a crashed worker and is requeued.
+    download_worker_processes: int = 2
+    download_queue_redis_key: str = "nabicat:tubio:download_queue"
+    download_processing_redis_key: str = "nabicat:tubio:download_processing"
+    download_job_redis_prefix: str = "nabicat:tubio:download_job:"
+    download_lease_redis_prefix: str = "nabicat:tubio:download_lease:"
+    download_job_ttl_s: int = 86400
+    download_lease_ttl_s: float = 30.0
+    download_lease_renewal_interval_s: float = 10.0
+    download_claim_timeout_s: int = 5
+    download_recovery_interval_s: float = 30.0
+    download_max_attempts: int = 3
+    # "Cache playlist" jobs feed at most `bulk_cache_concurrency` of their
+    # tracks into the download queue at a time, through the same per-video
+    # jobs. A nonzero bandwidth limit is split evenly across those downloads.
+    bulk_cache_redis_prefix: str = "nabicat:tubio:bulk_cache:"
+    bulk_cache_active_redis_key: str = "nabicat:tubio:bulk_cache_active"
+    bulk_cache_feed_lock_redis_key: str = "nabicat:tubio:bulk_cache_feed_lock"
+    bulk_cache_concurrency: int = 2
+    bulk_cache_bandwidth_bytes_per_s: int = 0
+    bulk_cache_job_ttl_s: int = 7 * 86400
+    bulk_cache_feed_lock_ttl_s: int = 10
+    bulk_cache_poll_interval_ms: int = 2000
+    # Opt-in offline mode: the service worker keeps pinned playlists' audio in
+    # Cache Storage within this budget, plus recently played tracks that it
+    # evicts least recently used first.
+    offline_budget_bytes: int = 2 * 1024 * 1024 * 1024
+    # Info and flat-playlist lookups are answered over Redis by warm yt-dlp
+    # extractor processes that the download supervisor also runs; with none
+    # alive they run in-process. Extractor and download workers both exit
+    # after `extractor_max_jobs` jobs or once their peak RSS passes the limit,
+    # and the supervisor starts a fresh one. Keep at least one extractor per
+    # concurrent Surprise Mix fetch; callers that would queue behind
+    # `extractor_max_queued_requests` busy ones run the lookup in-process.
+    extractor_processes: int = 4
+    extractor_max_queued_requests: int = 2
+    extractor_requests_redis_key: str = "nabicat:tubio:extractor:requests"
+    extractor_reply_redis_prefix: str = "nabicat:tubio:extractor:reply:"
+    extractor_alive_redis_key: str = "nabicat:tubio:extractor:alive"
+    # Set by the extractor answering a request and extended every third of
+    # the TTL, together with the alive key, until the reply is pushed.
+    extractor_claim_redis_prefix: str = "nabicat:tubio:extractor:claim:"
+    extractor_alive_ttl_s: int = 5
+    extractor_claim_timeout_s: int = 1
+    extractor_call_timeout_s: float = 30.0
+    extractor_max_jobs: int = 500
+    extractor_max_rss_bytes: int = 768 * 1024 * 1024
     youtube_403_fallback_player_client: str = "web"
     youtube_watch_url_template: str = "https://www.youtube.com/watch?v={video_id}"
     youtube_mix_url_template: str = "https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
@@ -107,6 +195,12 @@ class TubioConfig:
         r'(?:https?://)?(?:www\.)?youtube\.com/embed/([a-zA-Z0-9_-]{11})',
     )
     youtube_search_request_timeout_s: float = 10.0
+    youtube_http_pool_size: int = 8
+    # Combined tier results per (query, tiers), so later pages skip the scrape.
+    search_cache_redis_prefix: str = "nabicat:tubio:search:"
+    search_cache_ttl_s: int = 300
+    search_coalesce_wait_s: float = 15.0
+    search_coalesce_poll_interval_s: float = 0.1
     youtube_thumbnail_request_timeout_s: float = 10.0
     cookie_keepalive_url: str = "https://www.youtube.com/feed/subscriptions"
     cookie_keepalive_timeout_s: float = 30.0
@@ -132,13 +226,33 @@ class TubioConfig:
     autocomplete_debounce_ms: int = 200
     autocomplete_suggest_url: str = "https://suggestqueries.google.com/complete/search"
     autocomplete_request_timeout_s: float = 3.0
+    # Remote suggestions per normalized prefix, shared across users; identical
+    # prefixes in flight wait up to the request timeout for the first fetch.
+    autocomplete_cache_redis_prefix: str = "nabicat:tubio:suggest:"
+    autocomplete_cache_ttl_s: int = 6 * 3600
+    autocomplete_coalesce_poll_interval_s: float = 0.05
+    # Library titles listed ahead of remote suggestions, and the characters
+    # indexed from each word start of a title; longer queries filter the
+    # indexed candidates.
+    autocomplete_library_max_suggestions: int = 3
+    autocomplete_library_index_chars: int = 2
     surprise_mix_entries_per_seed: int = 15
+    surprise_mix_fetch_workers: int = 4
+    # Mix results per seed, shared by every user whose library holds the seed.
+    surprise_mix_cache_redis_prefix: str = "nabicat:tubio:mix:"
+    surprise_mix_cache_ttl_s: int = 6 * 3600
+    # Next grow batch, computed in the background after each create/grow.
+    surprise_prefetch_enabled: bool = True
+    surprise_prefetch_redis_prefix: str = "nabicat:tubio:surprise-next:"
     # Number of Surprise metadata entries kept ready ahead of playback.
     surprise_buffer_size: int = 5
     surprise_grow_batch_size: int = 1
     surprise_playlist_name: str = "Surprise Playlist"
     surprise_playlist_storage_key: str = "__surprise_playlist__"
     surprise_playlist_inactivity_ttl_s: int = 3600
+    # Tracks left without references are collected after this long. Keep it
+    # above the daily refcount verification so drift is repaired first.
+    unreferenced_grace_period_s: int = 2 * 24 * 3600
     surprise_crc_collision_attempts: int = 100
     surprise_media_rate_limit: str = "30 per minute"
     playlist_create_rate_limit: str = "10 per minute"
@@ -146,7 +260,9 @@ class TubioConfig:
     playlist_delete_rate_limit: str = "10 per minute"
     upload_rate_limit: str = "20 per minute"
     audio_serve_rate_limit: str = "100 per second"
+    waveform_serve_rate_limit: str = "60 per minute"
     resync_rate_limit: str = "5 per minute"
+    bulk_cache_rate_limit: str = "5 per minute"
     client_log_rate_limit: str = "30 per minute"
     client_log_max_length: int = 2000
     client_log_scopes: tuple[str, ...] = (
@@ -174,6 +290,7 @@ class TodoistConfig:
     goal_drag_hold_ms: int = 350
     goal_drag_move_threshold_px: int = 8
     goal_drag_hover_expand_ms: int = 650
+    goal_index_cache_entries: int = 32
 
 
 @dataclass
@@ -369,6 +486,9 @@ class FileStoreConfig:
     upload_stream_chunk_bytes: int = 1024 * 1024
     folder_upload_max_entries: int = 10_000
     archive_stream_queue_chunks: int = 8
+    archive_ingest_workers: int = 4
+    archive_max_compression_ratio: int = 100
+    archive_ratio_check_min_bytes: int = 1024 * 1024
     thumbnail_load_stagger_ms: int = 200
     thumbnail_load_max_retries: int = 3
     thumbnail_retry_delay_ms: int = 1_000
@@ -376,6 +496,11 @@ class FileStoreConfig:
     gallery_columns_max: int = 10
     gallery_columns_default: int = 5
     gallery_min_tile_px: int = 40
+    listing_page_size: int = 200
+    listing_max_page_size: int = 1_000
+    metadata_cache_entries: int = 64
+    listing_row_height_px: int = 56
+    listing_overscan_rows: int = 10
 
 
 @dataclass
@@ -432,6 +557,11 @@ class ConfigManager:
         self.debug_session_cookie_name = "session_debug"
         self.site_url = getenv("SITE_URL") or "https://nabicat.site"
         self.redis_url = getenv("REDIS_URL") or "redis://127.0.0.1:6379/0"
+        # When nginx fronts the app, hand file bodies to it instead of streaming
+        # them through a gunicorn worker. Must match the internal location in
+        # nabicat.conf, which aliases the data root.
+        self.x_accel_redirect_enabled = getenv("NABICAT_X_ACCEL_REDIRECT") == "1"
+        self.x_accel_redirect_prefix = "/_nabicat_data/"
         self.redis_readiness_timeout_s = 5.0
         self.redis_readiness_poll_s = 0.1
         self.password_hash_method = "scrypt"
@@ -448,6 +578,10 @@ class ConfigManager:
         self.scheduled_backup_job_id = "backup"
         self.scheduled_cookie_keepalive_job_id = "cookie-keepalive"
         self.scheduled_download_health_check_job_id = "download-health-check"
+        self.scheduled_file_store_usage_verify_job_id = "file-store-usage-verify"
+        self.scheduled_trash_reap_job_id = "trash-reap"
+        self.scheduled_thumbnail_backfill_job_id = "thumbnail-backfill"
+        self.scheduled_tubio_refcount_verify_job_id = "tubio-refcount-verify"
         self.scheduled_job_timers = (
             (
                 "nabicat-backup.timer",
@@ -464,6 +598,26 @@ class ConfigManager:
                 self.scheduled_download_health_check_job_id,
                 "*-*-* 04:10:00",
             ),
+            (
+                "nabicat-file-store-usage-verify.timer",
+                self.scheduled_file_store_usage_verify_job_id,
+                "*-*-* 03:30:00",
+            ),
+            (
+                "nabicat-trash-reap.timer",
+                self.scheduled_trash_reap_job_id,
+                "*-*-* *:20:00",
+            ),
+            (
+                "nabicat-thumbnail-backfill.timer",
+                self.scheduled_thumbnail_backfill_job_id,
+                "*-*-* 04:30:00",
+            ),
+            (
+                "nabicat-tubio-refcount-verify.timer",
+                self.scheduled_tubio_refcount_verify_job_id,
+                "*-*-* 03:40:00",
+            ),
         )
         self.log_format = (
             "%(asctime)s %(levelname)s worker=%(process)d "
@@ -495,6 +649,10 @@ class ConfigManager:
         }
         self.installed_app_config_overrides: dict[str, dict[str, object]] = {}
         self.backup_max_count = 8
+        # Deferred blob deletion: tombstoned blobs are renamed into a trash dir
+        # under the metadata lock, then unlinked in paced batches outside it.
+        self.trash_reap_batch_size = 100
+        self.trash_reap_batch_pause_s = 0.5
         self.production_sync_excluded_paths = (
             "backups/",
             "data/logs/",
@@ -550,6 +708,7 @@ class ConfigManager:
         self.cache_public_media_endpoints = frozenset({
             "tubio.serve_audio",
             "tubio.serve_thumbnail",
+            "tubio.serve_peaks",
         })
         self.git_command_timeout_s = 2
         self.ytdlp_pypi_url = "https://pypi.org/pypi/yt-dlp/json"
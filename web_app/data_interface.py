@@ -5,7 +5,10 @@ import random
 import string
 import os
 import shutil
+import threading
+import time
 
+from collections import OrderedDict
 from git import Repo
 from atomicwrites import atomic_write as _atomic_write
 from botocore.exceptions import ClientError
@@ -92,6 +95,32 @@ class DataSyncer:
         self.client.upload_file(file)
 
 
+class VersionCache:
+    """Per-worker LRU of values derived from a saved document.
+
+    Callers put the document version in the key, so any edit makes stale
+    entries unreachable. `capacity` is read on every insert so config
+    changes apply without a restart.
+    """
+
+    def __init__(self, capacity: Callable[[], int]) -> None:
+        self._capacity = capacity
+        self._entries: OrderedDict[tuple, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, build: Callable[[], object]):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self._capacity():
+                self._entries.popitem(last=False)
+        return value
+
+
 class DataInterface:
     def __init__(self) -> None:
         self.data_syncer = DataSyncer.instance()
@@ -108,14 +137,16 @@ class DataInterface:
         self.generate_metadata_file(backup_dir)
         shutil.copy2(self.users_file, backup_dir / "users.json")
 
-    def _backup_subtree(self, src_dir: Path, backup_dir: Path, name: str) -> None:
+    def _backup_subtree(
+        self, src_dir: Path, backup_dir: Path, name: str, *, ignore: Optional[Callable] = None,
+    ) -> None:
         """Copy a subapp's data subtree into the backup, no-op if it doesn't exist.
 
         Uses ``dirs_exist_ok=True`` so a re-run into an existing backup dir
         merges rather than raising.
         """
         if src_dir.exists():
-            shutil.copytree(src_dir, backup_dir / name, dirs_exist_ok=True)
+            shutil.copytree(src_dir, backup_dir / name, dirs_exist_ok=True, ignore=ignore)
 
     def load_users(self) -> Dict[str, User]:
         """Read-only load. For mutations use edit_users() so the write is locked."""
@@ -209,7 +240,15 @@ class DataInterface:
         )
 
     @contextmanager
-    def edit_model(self, path: Path, model: Type[_M], *, exclude_none: bool = False):
+    def edit_model(
+        self,
+        path: Path,
+        model: Type[_M],
+        *,
+        exclude_none: bool = False,
+        on_change: Optional[Callable[[_M], None]] = None,
+        default: Optional[Callable[[], _M]] = None,
+    ):
         """Transactional read-modify-write of a JSON model file.
 
         Yields a freshly-loaded (mutable) model inside a Redis lock keyed by the
@@ -228,14 +267,21 @@ class DataInterface:
         Skips the disk write entirely when the block leaves the model unchanged
         (e.g. a toggle that was a no-op, or a read-only inspection), avoiding a
         needless atomic rewrite.
+
+        `on_change` runs on the edited model just before a save that is going
+        to happen, e.g. to bump a version counter only on real changes.
+        `default` builds the model when the file does not exist yet (`model()`
+        otherwise).
         """
         from web_app.redis_client import rmw_lock
 
         with rmw_lock(self._model_lock_name(path)):
-            obj = self.load_model(path, model, sync=False) or model()
+            obj = self.load_model(path, model, sync=False) or (default or model)()
             before = obj.model_dump_json(exclude_none=exclude_none)
             yield obj
             if obj.model_dump_json(exclude_none=exclude_none) != before:
+                if on_change is not None:
+                    on_change(obj)
                 self._save_model(path, obj, exclude_none=exclude_none)
 
     def _model_lock_name(self, path: Path) -> str:
@@ -250,6 +296,50 @@ class DataInterface:
         except ValueError:
             return f"model:{path}"
 
+    def _trash_blobs(
+        self,
+        tombstones: dict,
+        live: Container,
+        blob_paths: Callable[[Any], list[Path]],
+        trash_dir: Path,
+    ) -> int:
+        """Move one batch of tombstoned blobs into `trash_dir`, returning the batch size.
+
+        Must run inside the owning metadata lock: re-adding a hash happens under
+        the same lock, so a key that is live again is skipped and its tombstone
+        dropped. Renames cost the same whatever the file size; the unlinks
+        happen later in _purge_trash_dir, outside the lock.
+        """
+        trash_dir.mkdir(parents=True, exist_ok=True)
+        batch = list(tombstones)[:ConfigManager().trash_reap_batch_size]
+        for key in batch:
+            tombstones.pop(key)
+            if key in live:
+                continue
+            for path in blob_paths(key):
+                try:
+                    os.replace(path, trash_dir / path.name)
+                except FileNotFoundError:
+                    pass
+        return len(batch)
+
+    def _purge_trash_dir(self, trash_dir: Path) -> int:
+        """Unlink everything in `trash_dir`, pausing between batches.
+
+        Only unreferenced blobs are ever moved in, so this needs no lock and a
+        crashed run is finished by the next one.
+        """
+        if not trash_dir.exists():
+            return 0
+        config = ConfigManager()
+        removed = 0
+        for path in trash_dir.iterdir():
+            path.unlink(missing_ok=True)
+            removed += 1
+            if removed % config.trash_reap_batch_size == 0:
+                time.sleep(config.trash_reap_batch_pause_s)
+        return removed
+
     def atomic_delete(self, file_path: Path) -> None:
         if file_path.exists():
             file_path.unlink()
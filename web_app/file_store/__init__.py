@@ -1,5 +1,4 @@
 import logging
-import mimetypes
 import queue
 import stat
 import threading
@@ -7,13 +6,18 @@ import zipfile
 from pathlib import PurePosixPath
 
 from werkzeug.datastructures import FileStorage
-from flask import Blueprint, Response, render_template, request, send_file, redirect, stream_with_context, url_for, flash
+from flask import Blueprint, Response, jsonify, render_template, request, send_file, redirect, stream_with_context, url_for, flash
 import flask_login
 
-from web_app.helpers import cur_user, register_app_name, require_login_blueprint
+from web_app.helpers import cur_user, register_app_name, require_login_blueprint, send_data_file
 from web_app.helpers import limiter
 from web_app.config import ConfigManager
-from web_app.file_store.data_interface import DataInterface, format_file_size
+from web_app.file_store.data_interface import (
+    LISTING_SORTS,
+    DataInterface,
+    StaleCursorError,
+    format_file_size,
+)
 from web_app.logging_utils import log_event
 
 
@@ -55,6 +59,19 @@ def _file_size(file: FileStorage) -> int:
     return size
 
 
+def _check_archive_entry(entry: zipfile.ZipInfo) -> None:
+    """Reject zip-bomb entries from their headers, before inflating anything.
+
+    zipfile stops inflating at the declared file_size and verifies the CRC,
+    so the declared sizes checked here bound what is actually written.
+    """
+    fs_cfg = ConfigManager().file_store
+    if entry.file_size < fs_cfg.archive_ratio_check_min_bytes:
+        return
+    if not entry.compress_size or entry.file_size / entry.compress_size > fs_cfg.archive_max_compression_ratio:
+        raise ValueError(f'Folder archive entry {entry.filename} is too highly compressed')
+
+
 @file_store_api.route('/')
 def index():
     user = cur_user()
@@ -64,10 +81,15 @@ def index():
     if mode not in ('list', 'grid'):
         mode = 'list'
     path = request.args.get('path', '')
-    directory = (
-        data_interface.list_directory(path, user, recent=mode == 'list')
-        if user else {'folders': [], 'files': []}
-    )
+    sort = request.args.get('sort', 'recent')
+    if sort not in LISTING_SORTS:
+        sort = 'recent'
+    directory = {'folders': [], 'files': []}
+    first_page = None
+    if user and mode == 'grid':
+        directory = data_interface.list_directory(path, user)
+    elif user:
+        first_page = data_interface.list_directory_page(path, user, sort=sort)
 
     # Calculate storage info for all users
     storage_info = None
@@ -87,8 +109,8 @@ def index():
         }
 
     return render_template(
-        "file_store_index.html", directory=directory, current_path=path,
-        storage_info=storage_info, mode=mode, thumbnail_config=ConfigManager().file_store,
+        "file_store_index.html", directory=directory, first_page=first_page, current_path=path,
+        sort=sort, storage_info=storage_info, mode=mode, thumbnail_config=ConfigManager().file_store,
     )
 
 
@@ -146,22 +168,13 @@ def upload_file():
                     if entry.is_dir():
                         folders.append(path)
                     else:
+                        _check_archive_entry(entry)
                         file_entries.append((entry, path))
                 paths = [path for _, path in file_entries]
                 total_bytes = sum(entry.file_size for entry, _ in file_entries)
                 folder_count = len(folders)
                 data_interface.validate_batch_quota(paths, total_bytes, user)
-                uploads = [
-                    (
-                        FileStorage(
-                            stream=zip_file.open(entry), filename=entry.filename,
-                            content_type=mimetypes.guess_type(entry.filename)[0] or 'application/octet-stream',
-                        ),
-                        path,
-                    )
-                    for entry, path in file_entries
-                ]
-                data_interface.save_files(uploads, folders, user)
+                data_interface.save_archive(zip_file, file_entries, folders, user)
         else:
             paths = [file.filename for file in files]
             total_bytes = sum(_file_size(file) for file in files)
@@ -204,7 +217,7 @@ def download_file(filename: str):
         "file_store", "file_store.download",
         user=user, bytes=file_path.stat().st_size, path=filename,
     )
-    response = send_file(file_path, as_attachment=True, download_name=PurePosixPath(filename).name)
+    response = send_data_file(file_path, as_attachment=True, download_name=PurePosixPath(filename).name)
 
     response.cache_control.private = True
     response.cache_control.no_store = True
@@ -265,6 +278,27 @@ def thumbnail(filename: str):
     return response
 
 
+@file_store_api.route('/entries')
+def list_entries():
+    """Cursor-paginated directory listing used by the virtual-scrolled list view."""
+    try:
+        page = DataInterface().list_directory_page(
+            request.args.get('path', ''),
+            cur_user(),
+            sort=request.args.get('sort', 'recent'),
+            cursor=request.args.get('cursor') or None,
+            limit=request.args.get('limit', type=int),
+        )
+    except StaleCursorError as error:
+        return {'error': str(error)}, 409
+    except ValueError as error:
+        return {'error': str(error)}, 400
+    response = jsonify(page)
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
 @file_store_api.route('/files_list')
 def files_list():
     files = DataInterface().list_files(cur_user())
@@ -390,6 +424,7 @@ def delete_all_files():
         if user_metadata:
             user_metadata.files = []
             user_metadata.folders = []
+            user_metadata.used_bytes = user_metadata.file_count = 0
             data_interface._cleanup_unreferenced(metadata)
 
     log_event(
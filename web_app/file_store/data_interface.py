@@ -1,17 +1,22 @@
+import base64
 import binascii
+import json
 import logging
+import mimetypes
 import os
 import tempfile
-from datetime import datetime
+import zipfile
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
 from io import BytesIO
 from pathlib import Path, PurePosixPath
-from typing import List, Optional
+from typing import IO, Callable, List, Optional
 
 from PIL import Image
 from pydantic import BaseModel
 from werkzeug.datastructures import FileStorage
 
-from web_app.data_interface import DataInterface as BaseDataInterface
+from web_app.data_interface import DataInterface as BaseDataInterface, VersionCache
 from web_app.config import ConfigManager
 from web_app.users import User
 from web_app.logging_utils import log_event
@@ -26,6 +31,18 @@ def format_file_size(size_bytes: int) -> str:
     return f"{size_bytes:.1f} TB"
 
 
+LISTING_SORTS = ('name', 'size', 'recent')
+LISTING_COLUMNS = ('kind', 'name', 'size', 'modified', 'mime_type')
+
+# Derived views of the metadata (sorted listings, path indexes), per worker.
+# Keys include the metadata version, so any edit makes stale entries unreachable.
+listing_cache = VersionCache(lambda: ConfigManager().file_store.metadata_cache_entries)
+
+
+class StaleCursorError(ValueError):
+    """A listing cursor was issued for an older metadata version."""
+
+
 class FileMetadata(BaseModel):
     crc: int
     original_name: str  # First uploaded name (for reference)
@@ -45,11 +62,18 @@ class UserMetadata(BaseModel):
     user_id: str
     files: list[UserFileEntry] = []
     folders: list[str] = []
+    # Running totals over `files`, kept in step by every edit. None until first
+    # measured (metadata written before the counters existed).
+    used_bytes: Optional[int] = None
+    file_count: Optional[int] = None
 
 
 class Metadata(BaseModel):
+    version: int = 0
     users: dict[str, UserMetadata] = {}
     files: dict[int, FileMetadata] = {}
+    # Blobs awaiting physical deletion by reap_trash: crc -> tombstone time.
+    trash: dict[int, datetime] = {}
 
 
 class DataInterface(BaseDataInterface):
@@ -61,6 +85,7 @@ class DataInterface(BaseDataInterface):
         self.file_store_dir = ConfigManager().save_data_path / self.data_sub_dirname
         self.files_dir = self.file_store_dir / "files"
         self.thumbnails_dir = self.file_store_dir / "thumbnails"
+        self.trash_dir = self.file_store_dir / "trash"
         self.metadata_file = self.file_store_dir / "metadata.json"
 
     def get_metadata(self) -> Metadata:
@@ -78,8 +103,14 @@ class DataInterface(BaseDataInterface):
         saves on clean exit (only if changed). The blob is global (all users),
         so this is a global lock. Do NOT stream large uploads inside the block;
         stream to a temp file first (see _stream_upload), then edit_metadata().
+        Every saved change bumps `metadata.version`, which listing cursors and
+        caches are keyed on.
         """
-        return self.edit_model(self.metadata_file, Metadata)
+        return self.edit_model(self.metadata_file, Metadata, on_change=self._bump_version)
+
+    @staticmethod
+    def _bump_version(metadata: Metadata) -> None:
+        metadata.version += 1
 
     @staticmethod
     def _normalise_path(path: str, *, allow_root: bool = False) -> str:
@@ -134,9 +165,52 @@ class DataInterface(BaseDataInterface):
             for entry in user_metadata.files
         }
         for crc in set(metadata.files) - referenced:
-            self.atomic_delete(self.files_dir / str(crc))
-            self.atomic_delete(self.get_thumbnail_path(crc))
             metadata.files.pop(crc, None)
+            metadata.trash[crc] = datetime.now(timezone.utc)
+
+    def reap_trash(self) -> int:
+        """Physically delete tombstoned blobs and thumbnails, one locked batch at a time."""
+        removed = 0
+        while True:
+            with self.edit_metadata() as metadata:
+                claimed = self._trash_blobs(
+                    metadata.trash, metadata.files,
+                    lambda crc: [self.files_dir / str(crc), self.get_thumbnail_path(crc)],
+                    self.trash_dir,
+                )
+            removed += self._purge_trash_dir(self.trash_dir)
+            if not claimed:
+                break
+        log_event("file_store", "file_store.trash_reaped", removed=removed)
+        return removed
+
+    @staticmethod
+    def _measure_usage(metadata: Metadata, user_metadata: UserMetadata) -> tuple[int, int]:
+        sizes = [
+            file_meta.size
+            for entry in user_metadata.files
+            if (file_meta := metadata.files.get(entry.crc))
+        ]
+        return sum(sizes), len(sizes)
+
+    def _ensure_usage(self, metadata: Metadata, user_metadata: UserMetadata) -> None:
+        """Seed missing usage counters from the entries. Call before mutating them."""
+        if user_metadata.used_bytes is None or user_metadata.file_count is None:
+            user_metadata.used_bytes, user_metadata.file_count = self._measure_usage(metadata, user_metadata)
+
+    def _adjust_usage(
+        self, metadata: Metadata, user_metadata: UserMetadata, entries: list[UserFileEntry], sign: int,
+    ) -> None:
+        for entry in entries:
+            if file_meta := metadata.files.get(entry.crc):
+                user_metadata.used_bytes += sign * file_meta.size
+                user_metadata.file_count += sign
+
+    def _path_index(self, metadata: Metadata, user_metadata: UserMetadata) -> dict[str, int]:
+        return listing_cache.get(
+            ('paths', str(self.metadata_file), metadata.version, user_metadata.user_id),
+            lambda: {self._entry_path(entry): entry.crc for entry in user_metadata.files},
+        )
 
     def get_user_metadata(self, user: User) -> UserMetadata:
         """Get user metadata, creates new if doesn't exist."""
@@ -152,14 +226,26 @@ class DataInterface(BaseDataInterface):
         than the lock's auto-expiry timeout, and it touches only a unique temp
         file, so it needs no serialization.
         """
+        return self._spool_stream(file_storage.stream)
+
+    def _spool_stream(self, stream: IO[bytes], *, write: bool = True) -> tuple[Optional[Path], int, int]:
+        """Copy a stream to a temp file chunk by chunk while computing its CRC.
+
+        With ``write=False`` the stream is only hashed and temp_path is None.
+        """
         self.files_dir.mkdir(parents=True, exist_ok=True)
         chunk_size = ConfigManager().file_store.upload_stream_chunk_bytes
         crc = 0
         file_size = 0
+        if not write:
+            while chunk := stream.read(chunk_size):
+                crc = binascii.crc32(chunk, crc)
+                file_size += len(chunk)
+            return None, crc, file_size
         with tempfile.NamedTemporaryFile(dir=self.files_dir, delete=False) as temp_file:
             temp_path = Path(temp_file.name)
             try:
-                while chunk := file_storage.stream.read(chunk_size):
+                while chunk := stream.read(chunk_size):
                     temp_file.write(chunk)
                     crc = binascii.crc32(chunk, crc)
                     file_size += len(chunk)
@@ -191,6 +277,7 @@ class DataInterface(BaseDataInterface):
 
     def _save_file_metadata(self, file_storage, user, relative_path, temp_path, crc, file_size, metadata):
         user_metadata = self._user_metadata(metadata, user)
+        self._ensure_usage(metadata, user_metadata)
         stored_path = self._normalise_path(relative_path or file_storage.filename)
         existing_entry = next(
             (entry for entry in user_metadata.files if self._entry_path(entry) == stored_path),
@@ -201,7 +288,8 @@ class DataInterface(BaseDataInterface):
         if (existing_entry and existing_entry.crc == crc) or (
             relative_path is None and any(entry.crc == crc for entry in user_metadata.files)
         ):
-            temp_path.unlink(missing_ok=True)
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
             return crc
 
         # Check if file content already exists on disk
@@ -209,6 +297,7 @@ class DataInterface(BaseDataInterface):
             file_path = self.files_dir / str(crc)
             os.replace(temp_path, file_path)
             file_path.chmod(0o644)
+            metadata.trash.pop(crc, None)
 
             # Create file metadata (use first uploaded name as reference)
             file_metadata = FileMetadata(
@@ -219,10 +308,11 @@ class DataInterface(BaseDataInterface):
                 mime_type=file_storage.content_type or 'application/octet-stream'
             )
             metadata.files[crc] = file_metadata
-        else:
+        elif temp_path is not None:
             temp_path.unlink(missing_ok=True)
 
         if existing_entry:
+            self._adjust_usage(metadata, user_metadata, [existing_entry], -1)
             user_metadata.files.remove(existing_entry)
 
         # Add to user's file list for new user content entry.
@@ -233,6 +323,7 @@ class DataInterface(BaseDataInterface):
             uploaded_at=datetime.now().isoformat(),
         )
         user_metadata.files.append(user_file_entry)
+        self._adjust_usage(metadata, user_metadata, [user_file_entry], 1)
         self._ensure_parent_folders(user_metadata, stored_path)
         return crc
 
@@ -243,16 +334,80 @@ class DataInterface(BaseDataInterface):
         user: User,
     ) -> None:
         """Atomically save a validated file/folder batch."""
-        if len(uploads) > ConfigManager().file_store.folder_upload_max_entries:
-            raise ValueError('Too many files in folder upload')
-        paths = [self._normalise_path(path) for _, path in uploads]
-        if len(paths) != len(set(paths)):
-            raise ValueError('Folder upload contains duplicate paths')
+        self._check_batch_paths([path for _, path in uploads])
 
         # Stream every upload to a temp file OUTSIDE the metadata lock (slow,
         # and can exceed the lock timeout). Then hold the lock only for the
         # fast validation + metadata mutation + renames.
         streamed = [(*self._stream_upload(file_storage), file_storage, path) for file_storage, path in uploads]
+        self._commit_streamed(streamed, folders, user)
+
+    def save_archive(
+        self,
+        archive: zipfile.ZipFile,
+        entries: list[tuple[zipfile.ZipInfo, str]],
+        folders: list[str],
+        user: User,
+    ) -> None:
+        """Atomically save the file entries of an already-validated folder archive.
+
+        Entries are inflated and hashed in parallel on a bounded thread pool,
+        each worker holding at most one chunk in memory. Entries whose CRC is
+        already stored are inflated only to verify it (zipfile checks the CRC
+        at EOF) and are never written to disk.
+        """
+        self._check_batch_paths([path for _, path in entries])
+        stored_crcs = set(self.get_metadata().files)
+
+        def ingest(item: tuple[zipfile.ZipInfo, str], *, write: bool | None = None) -> tuple:
+            entry, path = item
+            with archive.open(entry) as stream:
+                streamed = self._spool_stream(
+                    stream, write=entry.CRC not in stored_crcs if write is None else write,
+                )
+            content_type = mimetypes.guess_type(entry.filename)[0] or 'application/octet-stream'
+            return (*streamed, FileStorage(filename=entry.filename, content_type=content_type), path)
+
+        with ThreadPoolExecutor(
+            max_workers=ConfigManager().file_store.archive_ingest_workers,
+            thread_name_prefix='file-store-ingest',
+        ) as executor:
+            futures = [executor.submit(ingest, item) for item in entries]
+            _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+        failed = next((future for future in futures if not future.cancelled() and future.exception()), None)
+        if failed is not None:
+            for future in futures:
+                if future.done() and not future.cancelled() and not future.exception() and future.result()[0]:
+                    future.result()[0].unlink(missing_ok=True)
+            raise failed.exception()
+
+        self._commit_streamed(
+            [future.result() for future in futures], folders, user,
+            respool=lambda index: ingest(entries[index], write=True),
+        )
+
+    def _check_batch_paths(self, paths: list[str]) -> None:
+        if len(paths) > ConfigManager().file_store.folder_upload_max_entries:
+            raise ValueError('Too many files in folder upload')
+        normalised = [self._normalise_path(path) for path in paths]
+        if len(normalised) != len(set(normalised)):
+            raise ValueError('Folder upload contains duplicate paths')
+
+    def _commit_streamed(
+        self,
+        streamed: list[tuple],
+        folders: list[str],
+        user: User,
+        respool: Optional[Callable[[int], tuple]] = None,
+    ) -> None:
+        """Validate and record spooled uploads under one metadata lock.
+
+        `streamed` holds (temp_path, crc, size, file_storage, path) tuples;
+        temp_path is None for content that was already stored when spooled.
+        """
+        paths = [self._normalise_path(path) for *_, path in streamed]
         try:
             with self.edit_metadata() as metadata:
                 original_crcs = set(metadata.files)
@@ -276,6 +431,11 @@ class DataInterface(BaseDataInterface):
                     normalised = self._normalise_path(folder)
                     if normalised not in user_metadata.folders:
                         user_metadata.folders.append(normalised)
+                for index, (temp_path, crc, *_) in enumerate(streamed):
+                    if temp_path is None and crc not in metadata.files:
+                        # Skipped as a duplicate, but the stored copy has since
+                        # been deleted; rare enough to re-spool under the lock.
+                        streamed[index] = respool(index)
                 try:
                     for temp_path, crc, file_size, file_storage, path in streamed:
                         self._save_file_metadata(file_storage, user, path, temp_path, crc, file_size, metadata)
@@ -291,7 +451,8 @@ class DataInterface(BaseDataInterface):
             # Any temp files not consumed by os.replace (duplicate content) are
             # cleaned by _save_file_metadata; sweep leftovers on error paths.
             for temp_path, *_ in streamed:
-                Path(temp_path).unlink(missing_ok=True)
+                if temp_path is not None:
+                    Path(temp_path).unlink(missing_ok=True)
 
     def get_folder_files(self, path: str, user: User) -> list[tuple[str, Path]]:
         folder_path = self._normalise_path(path)
@@ -345,6 +506,8 @@ class DataInterface(BaseDataInterface):
             if not removed and not is_folder:
                 raise FileNotFoundError(f"File: {path} not found for user: {user.id}")
 
+            self._ensure_usage(metadata, user_metadata)
+            self._adjust_usage(metadata, user_metadata, removed, -1)
             user_metadata.files = [entry for entry in user_metadata.files if entry not in removed]
             user_metadata.folders = [
                 folder for folder in user_metadata.folders
@@ -371,14 +534,17 @@ class DataInterface(BaseDataInterface):
                 if not exists:
                     raise FileNotFoundError(f'{target_path} not found')
 
-            user_metadata.files = [
+            removed = [
                 entry for entry in user_metadata.files
-                if not any(
+                if any(
                     self._entry_path(entry) == target_path
                     or self._entry_path(entry).startswith(f'{target_path}/')
                     for target_path in target_paths
                 )
             ]
+            self._ensure_usage(metadata, user_metadata)
+            self._adjust_usage(metadata, user_metadata, removed, -1)
+            user_metadata.files = [entry for entry in user_metadata.files if entry not in removed]
             user_metadata.folders = [
                 folder for folder in user_metadata.folders
                 if not any(folder == target_path or folder.startswith(f'{target_path}/') for target_path in target_paths)
@@ -462,6 +628,106 @@ class DataInterface(BaseDataInterface):
         )
         return result
 
+    def list_directory_page(
+        self,
+        path: str,
+        user: User,
+        *,
+        sort: str = 'recent',
+        cursor: str | None = None,
+        limit: int | None = None,
+    ) -> dict:
+        """One page of a directory as compact rows, ordered by `sort`.
+
+        Rows follow LISTING_COLUMNS; `modified` is an epoch second (None for
+        empty folders) and a folder's `size` is the total of its contents.
+        `next_cursor` continues the same listing and raises StaleCursorError
+        once the metadata has changed underneath it.
+        """
+        if sort not in LISTING_SORTS:
+            raise ValueError('Invalid sort')
+        directory = self._normalise_path(path, allow_root=True)
+        fs_cfg = ConfigManager().file_store
+        limit = max(1, min(limit or fs_cfg.listing_page_size, fs_cfg.listing_max_page_size))
+        metadata = self.get_metadata()
+        offset = 0
+        if cursor:
+            state = self._decode_listing_cursor(cursor)
+            if state.get('p') != directory or state.get('s') != sort:
+                raise ValueError('Cursor does not match this listing')
+            if state.get('v') != metadata.version:
+                raise StaleCursorError('Listing changed, reload it')
+            offset = state['o']
+
+        rows = self._listing_rows(metadata, directory, user, sort)
+        end = offset + limit
+        return {
+            'version': metadata.version,
+            'path': directory,
+            'sort': sort,
+            'total': len(rows),
+            'columns': LISTING_COLUMNS,
+            'rows': rows[offset:end],
+            'next_cursor': (
+                self._encode_listing_cursor(metadata.version, directory, sort, end)
+                if end < len(rows) else None
+            ),
+        }
+
+    @staticmethod
+    def _encode_listing_cursor(version: int, directory: str, sort: str, offset: int) -> str:
+        state = json.dumps({'v': version, 'p': directory, 's': sort, 'o': offset}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(state.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_listing_cursor(cursor: str) -> dict:
+        try:
+            state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (ValueError, binascii.Error):
+            raise ValueError('Invalid cursor')
+        if not isinstance(state, dict) or not isinstance(state.get('o'), int) or state['o'] < 0:
+            raise ValueError('Invalid cursor')
+        return state
+
+    def _listing_rows(self, metadata: Metadata, directory: str, user: User, sort: str) -> list[list]:
+        return listing_cache.get(
+            ('listing', str(self.metadata_file), metadata.version, user.id, directory, sort),
+            lambda: self._build_listing_rows(metadata, directory, user, sort),
+        )
+
+    def _build_listing_rows(self, metadata: Metadata, directory: str, user: User, sort: str) -> list[list]:
+        user_metadata = metadata.users.get(user.id)
+        prefix = f'{directory}/' if directory else ''
+        folders: dict[str, list] = {}
+        files: list[list] = []
+        if user_metadata:
+            for folder in user_metadata.folders:
+                if folder.startswith(prefix):
+                    name = folder[len(prefix):].split('/', 1)[0]
+                    folders.setdefault(name, ['folder', name, 0, None, None])
+            for entry in user_metadata.files:
+                entry_path = self._entry_path(entry)
+                file_meta = metadata.files.get(entry.crc)
+                if not entry_path.startswith(prefix) or not file_meta:
+                    continue
+                modified = int(datetime.fromisoformat(entry.uploaded_at or file_meta.upload_date).timestamp())
+                name, _, rest = entry_path[len(prefix):].partition('/')
+                if not rest:
+                    files.append(['file', name, file_meta.size, modified, file_meta.mime_type])
+                    continue
+                row = folders.setdefault(name, ['folder', name, 0, None, None])
+                row[2] += file_meta.size
+                row[3] = modified if row[3] is None else max(row[3], modified)
+
+        rows = list(folders.values()) + files
+        if sort == 'name':
+            rows.sort(key=lambda row: (row[0] != 'folder', row[1].lower()))
+        elif sort == 'size':
+            rows.sort(key=lambda row: (-row[2], row[1].lower()))
+        else:
+            rows.sort(key=lambda row: (-(row[3] if row[3] is not None else float('-inf')), row[1].lower()))
+        return rows
+
     def move_path(self, source: str, destination: str, user: User) -> None:
         source_path = self._normalise_path(source)
         destination_path = self._normalise_path(destination)
@@ -632,32 +898,51 @@ class DataInterface(BaseDataInterface):
         if not user_metadata:
             return 0
 
-        total_size = 0
-        for user_file in user_metadata.files:
-            file_meta = metadata.files.get(user_file.crc)
-            if file_meta:
-                total_size += file_meta.size
-
-        return total_size
+        self._ensure_usage(metadata, user_metadata)
+        return user_metadata.used_bytes
 
     def validate_batch_quota(self, paths: list[str], incoming_size: int, user: User) -> None:
         metadata = self.get_metadata()
         user_metadata = metadata.users.get(user.id)
-        replaced_size = 0
+        used_size = replaced_size = 0
         if user_metadata:
-            replacing = {self._normalise_path(path) for path in paths}
-            for entry in user_metadata.files:
-                if self._entry_path(entry) in replacing and (file_meta := metadata.files.get(entry.crc)):
+            self._ensure_usage(metadata, user_metadata)
+            used_size = user_metadata.used_bytes
+            path_index = self._path_index(metadata, user_metadata)
+            for path in {self._normalise_path(path) for path in paths}:
+                if (crc := path_index.get(path)) is not None and (file_meta := metadata.files.get(crc)):
                     replaced_size += file_meta.size
         max_storage = (
             ConfigManager().file_store.admin_quota_bytes
             if user.has_elevated_access()
             else ConfigManager().file_store.non_admin_quota_bytes
         )
-        final_size = self.get_total_storage_size(user) - replaced_size + incoming_size
+        final_size = used_size - replaced_size + incoming_size
         if final_size > max_storage:
             raise ValueError(f'Upload exceeds the {format_file_size(max_storage)} storage limit')
 
+    def verify_usage_counters(self) -> int:
+        """Recompute every user's usage counters, correcting and logging drift.
+
+        Returns the number of users whose counters were corrected.
+        """
+        corrected = 0
+        with self.edit_metadata() as metadata:
+            for user_id, user_metadata in metadata.users.items():
+                used_bytes, file_count = self._measure_usage(metadata, user_metadata)
+                if (user_metadata.used_bytes, user_metadata.file_count) == (used_bytes, file_count):
+                    continue
+                if user_metadata.used_bytes is not None:
+                    log_event(
+                        "file_store", "file_store.usage_drift",
+                        level=logging.WARNING, user_id=user_id,
+                        recorded_bytes=user_metadata.used_bytes, actual_bytes=used_bytes,
+                        recorded_files=user_metadata.file_count, actual_files=file_count,
+                    )
+                user_metadata.used_bytes, user_metadata.file_count = used_bytes, file_count
+                corrected += 1
+        return corrected
+
     def get_thumbnail_path(self, crc: int) -> Path:
         """Get the path to a thumbnail file."""
         return self.thumbnails_dir / f"{crc}.jpg"
@@ -727,22 +1012,13 @@ class DataInterface(BaseDataInterface):
 
     def backup_data(self, backup_dir: Path) -> None:
         """Backup file store data to the backup directory."""
-        self._backup_subtree(self.file_store_dir, backup_dir, self.data_sub_dirname)
+        self._backup_subtree(
+            self.file_store_dir, backup_dir, self.data_sub_dirname,
+            ignore=lambda directory, names: [self.trash_dir.name] if Path(directory) == self.file_store_dir else [],
+        )
 
     def delete_user_data(self, user: User) -> None:
         with self.edit_metadata() as metadata:
-            user_metadata = metadata.users.pop(user.id, None)
-            if user_metadata is None:
+            if metadata.users.pop(user.id, None) is None:
                 return
-
-            user_crcs = {user_file.crc for user_file in user_metadata.files}
-            referenced_crcs = {
-                user_file.crc
-                for other_user_metadata in metadata.users.values()
-                for user_file in other_user_metadata.files
-            }
-
-            for crc in user_crcs - referenced_crcs:
-                self.atomic_delete(self.files_dir / str(crc))
-                self.atomic_delete(self.get_thumbnail_path(crc))
-                metadata.files.pop(crc, None)
+            self._cleanup_unreferenced(metadata)
@@ -76,22 +76,170 @@ function setupFolderUpload() {
     });
 }
 
-function setupBulkActions() {
+function encodePath(path) {
+    return path.split('/').map(encodeURIComponent).join('/');
+}
+
+function createVirtualDirectory(container) {
+    const shell = document.querySelector('.file-store-shell');
+    const currentPath = shell.dataset.currentPath;
+    const firstPage = JSON.parse(document.getElementById('directoryFirstPage').textContent);
+    const column = Object.fromEntries(firstPage.columns.map((name, index) => [name, index]));
+    const rowHeight = Number(container.dataset.rowHeight);
+    const overscan = Number(container.dataset.overscanRows);
+    const rows = firstPage.rows.slice();
+    const selected = new Set();
+    const listeners = [];
+    let nextCursor = firstPage.next_cursor;
+    let pending = null;
+    let frame = 0;
+
+    const total = firstPage.total;
+    const pathOf = (row) => joinPath(currentPath, row[column.name]);
+    const notify = () => listeners.forEach((listener) => listener());
+
+    const fetchNextPage = () => {
+        if (!nextCursor) return Promise.resolve();
+        if (pending) return pending;
+        const params = new URLSearchParams({ path: firstPage.path, sort: firstPage.sort, cursor: nextCursor });
+        pending = fetch(`${container.dataset.entriesUrl}?${params}`, { headers: { Accept: 'application/json' } })
+            .then((response) => {
+                if (response.status === 409) {
+                    window.location.reload();
+                    throw new Error('Listing changed');
+                }
+                if (!response.ok) throw new Error(`Listing failed: ${response.status}`);
+                return response.json();
+            })
+            .then((page) => {
+                rows.push(...page.rows);
+                nextCursor = page.next_cursor;
+            })
+            .finally(() => { pending = null; });
+        return pending;
+    };
+    const loadUntil = async (count) => {
+        while (rows.length < count && nextCursor) await fetchNextPage();
+    };
+
+    const actionLink = (href, title, icon) => {
+        const link = document.createElement('a');
+        link.className = 'btn btn-outline-success btn-sm';
+        link.href = href;
+        link.title = title;
+        link.innerHTML = `<i class="bi ${icon}"></i>`;
+        return link;
+    };
+    const renderRow = (row, index) => {
+        const path = pathOf(row);
+        const isFolder = row[column.kind] === 'folder';
+        const item = document.createElement('article');
+        item.className = isFolder ? 'directory-item directory-folder' : 'directory-item';
+        item.style.transform = `translateY(${index * rowHeight}px)`;
+
+        const select = document.createElement('label');
+        select.className = 'file-select-item';
+        const checkbox = document.createElement('input');
+        checkbox.className = 'form-check-input file-selection-checkbox';
+        checkbox.type = 'checkbox';
+        checkbox.value = path;
+        checkbox.checked = selected.has(path);
+        checkbox.setAttribute('aria-label', `Select ${row[column.name]}`);
+        select.append(checkbox);
+
+        const name = document.createElement('span');
+        name.textContent = row[column.name];
+        const icon = document.createElement('i');
+        icon.className = isFolder ? 'bi bi-folder-fill' : 'bi bi-file-earmark';
+        const link = document.createElement(isFolder ? 'a' : 'div');
+        link.className = 'directory-link';
+        link.append(icon, name);
+        const actions = document.createElement('div');
+        actions.className = 'directory-actions';
+        if (isFolder) {
+            link.href = `${container.dataset.indexUrl}?${new URLSearchParams({ path, mode: 'list' })}`;
+            actions.append(actionLink(container.dataset.downloadFolderUrl.replace('__path__', encodePath(path)), 'Download ZIP', 'bi-file-zip'));
+        } else {
+            const size = document.createElement('small');
+            size.textContent = formatFileSize(row[column.size]);
+            link.append(size);
+            actions.append(actionLink(container.dataset.downloadUrl.replace('__path__', encodePath(path)), 'Download', 'bi-download'));
+        }
+        item.append(select, link, actions);
+        return item;
+    };
+
+    const render = () => {
+        frame = 0;
+        const top = container.getBoundingClientRect().top;
+        const first = Math.max(0, Math.floor(-top / rowHeight) - overscan);
+        const last = Math.min(total, Math.ceil((window.innerHeight - top) / rowHeight) + overscan);
+        if (last > rows.length && nextCursor) {
+            loadUntil(last).then(scheduleRender).catch(() => {});
+        }
+        const visible = [];
+        for (let index = first; index < Math.min(last, rows.length); index += 1) {
+            visible.push(renderRow(rows[index], index));
+        }
+        container.replaceChildren(...visible);
+    };
+    const scheduleRender = () => {
+        if (!frame) frame = requestAnimationFrame(render);
+    };
+
+    container.style.setProperty('--directory-row-height', `${rowHeight}px`);
+    container.style.height = `${total * rowHeight}px`;
+    container.addEventListener('change', (event) => {
+        const checkbox = event.target.closest('.file-selection-checkbox');
+        if (!checkbox) return;
+        if (checkbox.checked) selected.add(checkbox.value);
+        else selected.delete(checkbox.value);
+        notify();
+    });
+    window.addEventListener('scroll', scheduleRender, { passive: true });
+    window.addEventListener('resize', scheduleRender);
+    render();
+
+    return {
+        total,
+        selectedPaths: () => Array.from(selected),
+        onSelectionChange: (listener) => listeners.push(listener),
+        async selectAll(checked) {
+            if (checked) {
+                await loadUntil(total);
+                rows.forEach((row) => selected.add(pathOf(row)));
+            } else {
+                selected.clear();
+            }
+            render();
+            notify();
+        },
+    };
+}
+
+function formatFileSize(size) {
+    const units = ['B', 'KB', 'MB', 'GB'];
+    for (const unit of units) {
+        if (size < 1024) return `${size.toFixed(1)} ${unit}`;
+        size /= 1024;
+    }
+    return `${size.toFixed(1)} TB`;
+}
+
+function setupBulkActions(directory) {
     const selectAll = document.getElementById('selectAllFiles');
     const actions = document.getElementById('fileBulkActions');
-    const checkboxes = Array.from(document.querySelectorAll('.file-selection-checkbox'));
-    if (!selectAll || !actions || !checkboxes.length) return;
+    if (!directory || !selectAll || !actions) return;
 
     const count = document.getElementById('selectedFileCount');
     const move = document.getElementById('moveSelectedFiles');
     const remove = document.getElementById('deleteSelectedFiles');
-    const selectedPaths = () => checkboxes.filter((checkbox) => checkbox.checked).map((checkbox) => checkbox.value);
     const update = () => {
-        const selected = selectedPaths();
+        const selected = directory.selectedPaths();
         actions.hidden = selected.length === 0;
         count.textContent = `${selected.length} selected`;
-        selectAll.checked = selected.length === checkboxes.length;
-        selectAll.indeterminate = selected.length > 0 && selected.length < checkboxes.length;
+        selectAll.checked = selected.length === directory.total;
+        selectAll.indeterminate = selected.length > 0 && selected.length < directory.total;
     };
     const setPaths = (container, paths) => {
         container.replaceChildren(...paths.map((path) => {
@@ -104,16 +252,16 @@ function setupBulkActions() {
     };
 
     selectAll.addEventListener('change', () => {
-        checkboxes.forEach((checkbox) => { checkbox.checked = selectAll.checked; });
-        update();
+        selectAll.disabled = true;
+        directory.selectAll(selectAll.checked).finally(() => { selectAll.disabled = false; });
     });
-    checkboxes.forEach((checkbox) => checkbox.addEventListener('change', update));
+    directory.onSelectionChange(update);
     move.addEventListener('click', () => {
-        setPaths(document.getElementById('bulkMovePaths'), selectedPaths());
+        setPaths(document.getElementById('bulkMovePaths'), directory.selectedPaths());
         bootstrap.Modal.getOrCreateInstance(document.getElementById('bulkMoveModal')).show();
     });
     remove.addEventListener('click', () => {
-        const paths = selectedPaths();
+        const paths = directory.selectedPaths();
         setPaths(document.getElementById('bulkDeletePaths'), paths);
         document.getElementById('bulkDeleteMessage').textContent = `Permanently delete ${paths.length} selected item(s)? This cannot be undone.`;
         bootstrap.Modal.getOrCreateInstance(document.getElementById('bulkDeleteModal')).show();
@@ -121,6 +269,11 @@ function setupBulkActions() {
     update();
 }
 
+function setupDirectorySort() {
+    const sort = document.getElementById('directorySort');
+    if (sort) sort.addEventListener('change', () => sort.form.submit());
+}
+
 function setupImageModal() {
     const modal = document.getElementById('imageModal');
     const shell = document.querySelector('.file-store-shell');
@@ -251,7 +404,9 @@ document.addEventListener('DOMContentLoaded', () => {
         fill.style.width = `${Number(fill.dataset.usagePercent) || 0}%`;
     });
     setupFolderUpload();
-    setupBulkActions();
+    const virtualDirectory = document.getElementById('virtualDirectory');
+    setupBulkActions(virtualDirectory && createVirtualDirectory(virtualDirectory));
+    setupDirectorySort();
     setupImageModal();
     setupStaggeredThumbnails();
     setupGalleryDensity();
@@ -14,6 +14,8 @@ from flask import request
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from functools import wraps
+from urllib.parse import quote
+from werkzeug.utils import send_file as _werkzeug_send_file
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
@@ -231,6 +233,39 @@ def cur_user() -> User:
         raise TypeError("Current user is not an instance of User")
     return flask_login.current_user
 
+def send_data_file(path: Path, *, conditional: bool = True, **kwargs) -> flask.Response:
+    """flask.send_file for files under the data root, offloaded to nginx when configured.
+
+    With X-Accel-Redirect enabled the response carries the same headers
+    (Content-Type, Content-Disposition, ETag, Last-Modified) but no body; nginx
+    serves the bytes from its internal location and handles Range itself.
+    Conditional requests are still answered here so a 304 never reaches nginx's
+    redirect. Anything outside the data root falls back to flask.send_file.
+    """
+    config = ConfigManager()
+    try:
+        relative = Path(path).resolve().relative_to(config.save_data_path.resolve())
+    except ValueError:
+        relative = None
+    if not config.x_accel_redirect_enabled or relative is None:
+        return flask.send_file(path, conditional=conditional, **kwargs)
+
+    response = _werkzeug_send_file(
+        path,
+        request.environ,
+        use_x_sendfile=True,
+        response_class=flask.current_app.response_class,
+        conditional=False,
+        **kwargs,
+    )
+    del response.headers["X-Sendfile"]
+    if conditional:
+        response = response.make_conditional(request.environ)
+    response.headers.pop("Content-Length", None)
+    if response.status_code != 304:
+        response.headers["X-Accel-Redirect"] = config.x_accel_redirect_prefix + quote(relative.as_posix())
+    return response
+
 def authenticate_user(username: str, password: str, require_admin: bool = True) -> bool:
     if not username or not password:
         return False
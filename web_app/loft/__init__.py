@@ -9,7 +9,7 @@ from io import BytesIO
 
 import flask_login
 from flask import (
-    Blueprint, abort, flash, jsonify, redirect, render_template, request, send_file, url_for,
+    Blueprint, abort, flash, jsonify, redirect, render_template, request, url_for,
 )
 from werkzeug.exceptions import RequestEntityTooLarge
 
@@ -17,7 +17,7 @@ from web_app.app import csrf
 from web_app.config import ConfigManager
 from web_app.errors import APIError
 from web_app.loft.data_interface import DataInterface, PostVisibility, slugify
-from web_app.helpers import cur_user, limiter, parse_request, register_app_name
+from web_app.helpers import cur_user, limiter, parse_request, register_app_name, send_data_file
 from web_app.logging_utils import log_event
 
 loft_api = Blueprint(
@@ -428,4 +428,4 @@ def post_asset(project: str, post: str, filename: str):
     asset_path = data_interface.get_asset_path(project, post, filename)
     if not asset_path or not asset_path.exists():
         abort(404)
-    return send_file(asset_path)
+    return send_data_file(asset_path)
@@ -15,6 +15,7 @@ import click
 from web_app.app import app
 from web_app.config import ConfigManager
 from web_app.data_interface import DataInterface
+from web_app.file_store.data_interface import DataInterface as FileStoreDataInterface
 from web_app.helpers import (
     backup_installed_app_data,
     get_all_data_interfaces,
@@ -23,6 +24,7 @@ from web_app.helpers import (
 from web_app.logging_utils import configure_logging, log_event
 from web_app.redis_client import ensure_local_redis
 from web_app.tubio.audio_downloader import AudioDownloader
+from web_app.tubio.data_interface import DataInterface as TubioDataInterface
 
 
 def run_backup() -> None:
@@ -198,6 +200,118 @@ def run_download_health_check() -> None:
     )
 
 
+def run_file_store_usage_verify() -> None:
+    job_id = ConfigManager().scheduled_file_store_usage_verify_job_id
+    log_event(
+        "file_store",
+        "usage_verify.started",
+        source="systemd",
+        job_id=job_id,
+    )
+    try:
+        ensure_local_redis()
+        corrected = FileStoreDataInterface().verify_usage_counters()
+    except Exception as error:
+        log_event(
+            "file_store",
+            "usage_verify.failed",
+            level=logging.ERROR,
+            source="systemd",
+            job_id=job_id,
+            exc_info=error,
+            error_type=type(error).__name__,
+        )
+        raise
+    log_event(
+        "file_store",
+        "usage_verify.completed",
+        source="systemd",
+        job_id=job_id,
+        corrected=corrected,
+    )
+
+
+def run_trash_reap() -> None:
+    job_id = ConfigManager().scheduled_trash_reap_job_id
+    log_event("system", "trash_reap.started", source="systemd", job_id=job_id)
+    try:
+        ensure_local_redis()
+        removed = sum(
+            data_interface_class().reap_trash()
+            for data_interface_class in (FileStoreDataInterface, TubioDataInterface)
+        )
+    except Exception as error:
+        log_event(
+            "system",
+            "trash_reap.failed",
+            level=logging.ERROR,
+            source="systemd",
+            job_id=job_id,
+            exc_info=error,
+            error_type=type(error).__name__,
+        )
+        raise
+    log_event(
+        "system",
+        "trash_reap.completed",
+        source="systemd",
+        job_id=job_id,
+        removed=removed,
+    )
+
+
+def run_thumbnail_backfill() -> None:
+    job_id = ConfigManager().scheduled_thumbnail_backfill_job_id
+    log_event("tubio", "thumbnail_backfill.started", source="systemd", job_id=job_id)
+    try:
+        ensure_local_redis()
+        completed = AudioDownloader.backfill_thumbnails()
+    except Exception as error:
+        log_event(
+            "tubio",
+            "thumbnail_backfill.failed",
+            level=logging.ERROR,
+            source="systemd",
+            job_id=job_id,
+            exc_info=error,
+            error_type=type(error).__name__,
+        )
+        raise
+    log_event(
+        "tubio",
+        "thumbnail_backfill.completed",
+        source="systemd",
+        job_id=job_id,
+        completed=completed,
+    )
+
+
+def run_tubio_refcount_verify() -> None:
+    job_id = ConfigManager().scheduled_tubio_refcount_verify_job_id
+    log_event("tubio", "refcount_verify.started", source="systemd", job_id=job_id)
+    try:
+        ensure_local_redis()
+        collected = TubioDataInterface().cleanup_unused_resources(verify=True)
+    except Exception as error:
+        log_event(
+            "tubio",
+            "refcount_verify.failed",
+            level=logging.ERROR,
+            source="systemd",
+            job_id=job_id,
+            exc_info=error,
+            error_type=type(error).__name__,
+        )
+        raise
+    log_event(
+        "tubio",
+        "refcount_verify.completed",
+        source="systemd",
+        job_id=job_id,
+        collected=collected,
+    )
+
+
 @click.command()
 @click.argument(
     "job_name",
@@ -215,6 +329,10 @@ def cli(job_name: str) -> None:
         config.scheduled_backup_job_id: run_backup,
         config.scheduled_cookie_keepalive_job_id: run_cookie_keepalive,
         config.scheduled_download_health_check_job_id: run_download_health_check,
+        config.scheduled_file_store_usage_verify_job_id: run_file_store_usage_verify,
+        config.scheduled_trash_reap_job_id: run_trash_reap,
+        config.scheduled_thumbnail_backfill_job_id: run_thumbnail_backfill,
+        config.scheduled_tubio_refcount_verify_job_id: run_tubio_refcount_verify,
     }
     jobs[job_name]()
 
@@ -9,6 +9,13 @@ const CACHE_PREFIX = __NABICAT_CACHE_PREFIX__;
 const CACHE_NAME = `${CACHE_PREFIX}${CACHE_VERSION}`;
 const VERSIONED_STATIC_PATH_PREFIXES = __NABICAT_STATIC_PATH_PREFIXES__;
 const PUBLIC_MEDIA_PATH_PREFIXES = __NABICAT_PUBLIC_MEDIA_PATH_PREFIXES__;
+// Tubio's opt-in offline mode outlives cache version bumps; logout clears it
+// with every other cache.
+const TUBIO_OFFLINE_CACHE_NAME = `${CACHE_PREFIX}tubio-offline`;
+const TUBIO_OFFLINE_MANIFEST_URL = '/tubio/offline-manifest';
+const TUBIO_INDEX_PATH = '/tubio/';
+const TUBIO_AUDIO_PATH = /^\/tubio\/audio\/(\d+)$/;
+const TUBIO_TOUCH_INTERVAL_MS = 60 * 1000;
 
 function isVersionedStaticAsset(url) {
     return VERSIONED_STATIC_PATH_PREFIXES.some(
@@ -45,7 +52,7 @@ async function clearCaches({ keepCurrent = false } = {}) {
         names
             .filter((name) => (
                 name.startsWith(CACHE_PREFIX)
-                && (!keepCurrent || name !== CACHE_NAME)
+                && (!keepCurrent || ![CACHE_NAME, TUBIO_OFFLINE_CACHE_NAME].includes(name))
             ))
             .map((name) => caches.delete(name))
     );
@@ -65,11 +72,27 @@ self.addEventListener('fetch', (event) => {
     const { request } = event;
     const url = new URL(request.url);
 
-    if (
-        url.origin !== self.location.origin
-        || request.method !== 'GET'
-        || request.headers.has('Range')
-    ) {
+    if (url.origin !== self.location.origin || request.method !== 'GET') {
+        return;
+    }
+
+    const audioMatch = TUBIO_AUDIO_PATH.exec(url.pathname);
+    if (audioMatch) {
+        event.respondWith(serveTubioAudio(event, Number(audioMatch[1])));
+        return;
+    }
+
+    if (request.mode === 'navigate' && url.pathname === TUBIO_INDEX_PATH) {
+        event.respondWith(fetch(request).catch(async (error) => {
+            const cache = await caches.open(TUBIO_OFFLINE_CACHE_NAME);
+            const cached = await cache.match(TUBIO_INDEX_PATH);
+            if (cached) return cached;
+            throw error;
+        }));
+        return;
+    }
+
+    if (request.headers.has('Range')) {
         return;
     }
 
@@ -141,6 +164,18 @@ self.addEventListener('message', (event) => {
         return;
     }
 
+    if (data.action === 'tubioOfflineSync') {
+        event.waitUntil(
+            syncTubioOffline(data)
+                .then((status) => {
+                    port?.postMessage(status);
+                    return fillTubioOffline();
+                })
+                .catch((error) => port?.postMessage({ error: error.message }))
+        );
+        return;
+    }
+
     if (data.action === 'getCacheSize') {
         event.waitUntil(
             getCacheSize().then((result) => port?.postMessage(result))
@@ -164,3 +199,271 @@ async function getCacheSize() {
     const estimate = await navigator.storage.estimate();
     return { usage, quota: estimate.quota || 0 };
 }
+
+/*
+ * Tubio offline mode.
+ *
+ * Pinned playlists' audio is kept in TUBIO_OFFLINE_CACHE_NAME under
+ * /tubio/audio/<crc>, with a JSON manifest of owner, budget, pinned track
+ * lists and per-track size and last use. While anything is pinned, tracks
+ * that are played get cached as well, and those unpinned entries are evicted
+ * least recently used first to stay within the budget. Pinned tracks that do
+ * not fit are left to the network.
+ */
+
+let tubioManifestWrite = Promise.resolve();
+let tubioFill = null;
+const tubioStoring = new Map();
+
+function tubioAudioUrl(crc) {
+    return `/tubio/audio/${crc}`;
+}
+
+function emptyTubioManifest(owner) {
+    return {
+        owner,
+        libraryVersion: null,
+        indexVersion: null,
+        budget: 0,
+        playlists: {},
+        entries: {},
+    };
+}
+
+async function readTubioManifest() {
+    const cache = await caches.open(TUBIO_OFFLINE_CACHE_NAME);
+    const response = await cache.match(TUBIO_OFFLINE_MANIFEST_URL);
+    return response ? response.json() : emptyTubioManifest(null);
+}
+
+// Revalidates the offline copy of the Tubio page against the library version.
+async function refreshTubioIndex() {
+    const manifest = await readTubioManifest();
+    if (!Object.keys(manifest.playlists).length || manifest.indexVersion === manifest.libraryVersion) {
+        return;
+    }
+    const response = await fetch(TUBIO_INDEX_PATH, { credentials: 'same-origin' });
+    if (!response.ok) return;
+    await updateTubioManifest(async (latest, cache) => {
+        if (latest.owner !== manifest.owner || latest.libraryVersion !== manifest.libraryVersion) return;
+        await cache.put(TUBIO_INDEX_PATH, response);
+        latest.indexVersion = latest.libraryVersion;
+    });
+}
+
+// Writes are serialized so playback and syncs never lose each other's edits.
+function updateTubioManifest(change) {
+    const run = tubioManifestWrite.then(async () => {
+        const cache = await caches.open(TUBIO_OFFLINE_CACHE_NAME);
+        const manifest = await readTubioManifest();
+        const result = await change(manifest, cache);
+        await cache.put(TUBIO_OFFLINE_MANIFEST_URL, new Response(JSON.stringify(manifest), {
+            headers: { 'Content-Type': 'application/json' },
+        }));
+        return result;
+    });
+    tubioManifestWrite = run.catch(() => undefined);
+    return run;
+}
+
+function pinnedTubioCrcs(manifest) {
+    return new Set(Object.values(manifest.playlists).flat().map(String));
+}
+
+function tubioUsage(manifest) {
+    return Object.values(manifest.entries).reduce((total, entry) => total + entry.size, 0);
+}
+
+function tubioStatus(manifest) {
+    const pinned = pinnedTubioCrcs(manifest);
+    return {
+        pinned: Object.keys(manifest.playlists),
+        usage: tubioUsage(manifest),
+        budget: manifest.budget,
+        tracks: pinned.size,
+        cached: [...pinned].filter((crc) => crc in manifest.entries).length,
+    };
+}
+
+async function dropTubioEntries(manifest, cache, crcs) {
+    for (const crc of crcs) {
+        await cache.delete(tubioAudioUrl(crc));
+        delete manifest.entries[crc];
+    }
+}
+
+async function syncTubioOffline({ owner, budget, libraryVersion, playlists, playlist, pin }) {
+    return updateTubioManifest(async (manifest, cache) => {
+        if (manifest.owner !== owner) {
+            await dropTubioEntries(manifest, cache, Object.keys(manifest.entries));
+            await cache.delete(TUBIO_INDEX_PATH);
+            Object.assign(manifest, emptyTubioManifest(owner));
+        }
+        manifest.budget = budget;
+        if (playlist !== undefined && pin) {
+            manifest.playlists[playlist] = [];
+        } else if (playlist !== undefined) {
+            delete manifest.playlists[playlist];
+        }
+        // Pinned track lists follow the library the page rendered, so
+        // renamed or deleted playlists fall out of the pin set.
+        for (const name of Object.keys(manifest.playlists)) {
+            if (name in playlists) {
+                manifest.playlists[name] = playlists[name];
+            } else {
+                delete manifest.playlists[name];
+            }
+        }
+        if (!Object.keys(manifest.playlists).length) {
+            await dropTubioEntries(manifest, cache, Object.keys(manifest.entries));
+            await cache.delete(TUBIO_INDEX_PATH);
+            manifest.indexVersion = null;
+        }
+        manifest.libraryVersion = libraryVersion;
+        return tubioStatus(manifest);
+    });
+}
+
+async function makeTubioRoom(manifest, cache, size) {
+    const pinned = pinnedTubioCrcs(manifest);
+    let usage = tubioUsage(manifest);
+    const evictable = Object.entries(manifest.entries)
+        .filter(([crc]) => !pinned.has(crc))
+        .sort(([, a], [, b]) => a.lastUsed - b.lastUsed);
+    for (const [crc, entry] of evictable) {
+        if (usage + size <= manifest.budget) break;
+        await dropTubioEntries(manifest, cache, [crc]);
+        usage -= entry.size;
+    }
+    return usage + size <= manifest.budget;
+}
+
+function storeTubioAudio(crc, owner) {
+    if (!tubioStoring.has(crc)) {
+        tubioStoring.set(crc, fetchTubioAudio(crc, owner).finally(() => tubioStoring.delete(crc)));
+    }
+    return tubioStoring.get(crc);
+}
+
+async function fetchTubioAudio(crc, owner) {
+    const response = await fetch(`${tubioAudioUrl(crc)}?quality=original`, {
+        credentials: 'same-origin',
+    });
+    if (!response.ok || response.status !== 200) {
+        return false;
+    }
+    // Skip the body when even evicting every unpinned entry cannot fit it.
+    const length = Number(response.headers.get('Content-Length')) || 0;
+    const manifest = await readTubioManifest();
+    const pinned = pinnedTubioCrcs(manifest);
+    const pinnedUsage = Object.entries(manifest.entries)
+        .filter(([cached]) => pinned.has(cached))
+        .reduce((total, [, entry]) => total + entry.size, 0);
+    if (pinnedUsage + length > manifest.budget) {
+        await response.body?.cancel();
+        return false;
+    }
+    const blob = await response.blob();
+    return updateTubioManifest(async (manifest, cache) => {
+        if (manifest.owner !== owner || !Object.keys(manifest.playlists).length) {
+            return false;
+        }
+        if (crc in manifest.entries || !(await makeTubioRoom(manifest, cache, blob.size))) {
+            return crc in manifest.entries;
+        }
+        await cache.put(tubioAudioUrl(crc), new Response(blob, {
+            headers: {
+                'Content-Type': response.headers.get('Content-Type') || 'audio/mp4',
+                'Content-Length': String(blob.size),
+            },
+        }));
+        manifest.entries[crc] = { size: blob.size, lastUsed: Date.now() };
+        return true;
+    });
+}
+
+function fillTubioOffline() {
+    tubioFill = tubioFill || (async () => {
+        const attempted = new Set();
+        try {
+            await refreshTubioIndex();
+            for (;;) {
+                const manifest = await readTubioManifest();
+                const crc = [...pinnedTubioCrcs(manifest)].find(
+                    (candidate) => !(candidate in manifest.entries) && !attempted.has(candidate)
+                );
+                if (crc === undefined) return;
+                attempted.add(crc);
+                if (!(await storeTubioAudio(crc, manifest.owner))) {
+                    // Out of budget or storage; the rest streams as usual.
+                    const latest = await readTubioManifest();
+                    if (tubioUsage(latest) >= latest.budget) return;
+                }
+            }
+        } catch (error) {
+            // Offline or out of quota; the next sync picks up where this left off.
+        } finally {
+            tubioFill = null;
+        }
+    })();
+    return tubioFill;
+}
+
+function tubioRangeResponse(blob, contentType, range) {
+    const match = /^bytes=(\d*)-(\d*)$/.exec(range.trim());
+    let start = match?.[1] ? Number(match[1]) : null;
+    let end = match?.[2] ? Number(match[2]) : null;
+    if (start === null && end !== null) {
+        start = Math.max(0, blob.size - end);
+        end = blob.size - 1;
+    } else if (start !== null) {
+        end = end === null ? blob.size - 1 : Math.min(end, blob.size - 1);
+    }
+    if (start === null || start >= blob.size || start > end) {
+        return new Response(null, {
+            status: 416,
+            headers: { 'Content-Range': `bytes */${blob.size}` },
+        });
+    }
+    return new Response(blob.slice(start, end + 1), {
+        status: 206,
+        headers: {
+            'Accept-Ranges': 'bytes',
+            'Content-Type': contentType,
+            'Content-Length': String(end - start + 1),
+            'Content-Range': `bytes ${start}-${end}/${blob.size}`,
+        },
+    });
+}
+
+async function serveTubioAudio(event, crc) {
+    const { request } = event;
+    const cache = await caches.open(TUBIO_OFFLINE_CACHE_NAME);
+    const cached = await cache.match(tubioAudioUrl(crc));
+    if (!cached) {
+        const manifest = await readTubioManifest();
+        if (Object.keys(manifest.playlists).length && request.headers.has('Range')) {
+            event.waitUntil(storeTubioAudio(String(crc), manifest.owner).catch(() => undefined));
+        }
+        if (!request.headers.has('Range') && isIntentionallyPublicMedia(new URL(request.url))) {
+            return cacheWithUpdate(request, true, event);
+        }
+        return fetch(request);
+    }
+
+    const entry = (await readTubioManifest()).entries[crc];
+    if (entry && Date.now() - entry.lastUsed > TUBIO_TOUCH_INTERVAL_MS) {
+        event.waitUntil(updateTubioManifest((manifest) => {
+            if (manifest.entries[crc]) manifest.entries[crc].lastUsed = Date.now();
+        }).catch(() => undefined));
+    }
+    const range = request.headers.get('Range');
+    if (!range) {
+        return cached;
+    }
+    return tubioRangeResponse(
+        await cached.blob(),
+        cached.headers.get('Content-Type') || 'audio/mp4',
+        range,
+    );
+}
@@ -9,8 +9,8 @@ from datetime import datetime, date
 from web_app.config import ConfigManager
 from web_app.helpers import limiter, cur_user, require_login_blueprint
 from web_app.users import User
-from web_app.todoist.data_interface import DataInterface, GoalState, Goal
-from web_app.todoist.visualiser import plot_velocity
+from web_app.todoist.data_interface import DataInterface, GoalIndex, GoalState, Goal, goal_index
+from web_app.todoist.visualiser import goal_velocity
 from web_app.todoist.goals import goals
 from web_app.logging_utils import log_event
 
@@ -42,10 +42,14 @@ require_login_blueprint(todoist_api)
 def get_default_redirect():
     return flask.redirect(flask.url_for('.summary_goals'))
 
+def _load_goal_index(user: User) -> GoalIndex:
+    data = DataInterface()
+    return goal_index(data.load_goals(user), data.get_goals_file(user))
+
 def _get_filtered_summary_goals(user: User) -> Tuple[List[Goal], Dict[int, Goal]]:
     """Get filtered top-level summary goals and all goals dict."""
     now = datetime.now()
-    all_goals = DataInterface().load_goals(user).goals
+    index = _load_goal_index(user)
 
     def should_render(goal: Goal) -> bool:
         if goal.parent is not None:
@@ -58,16 +62,9 @@ def _get_filtered_summary_goals(user: User) -> Tuple[List[Goal], Dict[int, Goal]
             return False
         return True
 
-    def max_last_modified(goal: Goal) -> float:
-        ts = goal.last_modified.timestamp()
-        for child_id in goal.children:
-            if child_id in all_goals:
-                ts = max(ts, max_last_modified(all_goals[child_id]))
-        return ts
-
-    goals = [goal for goal in all_goals.values() if should_render(goal)]
-    goals.sort(key=max_last_modified, reverse=True)
-    return goals, all_goals
+    goals = [goal for goal in index.goals.values() if should_render(goal)]
+    goals.sort(key=lambda goal: index.latest_modified[goal.id], reverse=True)
+    return goals, index.goals
 
 def _goals_to_blocks(goals: List[Goal]) -> List[Tuple[str, List[Goal]]]:
     """Convert a list of goals to dated goal blocks."""
@@ -84,10 +81,7 @@ def _goals_to_blocks(goals: List[Goal]) -> List[Tuple[str, List[Goal]]]:
 
 def _get_completed_goals(user: User) -> List[Goal]:
     """Get all completed goals."""
-    goals = list(DataInterface().load_goals(user).goals.values())
-    goals = [goal for goal in goals if goal.state == GoalState.COMPLETED]
-    goals.sort(key=lambda goal: goal.completion_date.timestamp(), reverse=True) # type: ignore
-    return goals
+    return list(_load_goal_index(user).completed)
 
 def _completed_goals_to_blocks(goals: List[Goal]) -> List[Tuple[str, List[Goal]]]:
     """Convert completed goals to dated blocks."""
@@ -150,14 +144,15 @@ def api_completed_goals_page():
 @todoist_api.route('/visualise/goal_velocity', methods=['GET'])
 @limiter.limit("1/second", key_func=lambda: flask_login.current_user.id)
 def visualise_goal_velocity():
-    tld = DataInterface().load_goals(cur_user())
-    goals = [goal for goal in tld.goals.values() if goal.state == GoalState.COMPLETED]
-    if len(goals) < 2:
+    data = DataInterface()
+    goals = data.load_goals(cur_user())
+    goals_file = data.get_goals_file(cur_user())
+    if len(goal_index(goals, goals_file).completed) < 2:
         flask.flash('Too few completeed goals to visualise', category='error')
         return get_default_redirect()
     
     try:
-        embeddable_plotly_html = plot_velocity(goals)
+        velocity = goal_velocity(goals, goals_file)
     except Exception as e:
         log_event(
             "todoist", "todoist.velocity_plot_failed",
@@ -166,4 +161,4 @@ def visualise_goal_velocity():
         flask.flash('Failed to plot velocity, try completing more goals and/or wait a couple days', category='error')
         return get_default_redirect()
 
-    return render_template('goal_velocity.html', plot=embeddable_plotly_html)
+    return render_template('goal_velocity.html', velocity=velocity)
@@ -9,7 +9,7 @@ from web_app.app import csrf
 from web_app.config import ConfigManager
 from web_app.oauth import bearer_user
 from web_app.redis_client import get_redis
-from web_app.todoist.data_interface import DataInterface, Goal, GoalState
+from web_app.todoist.data_interface import DataInterface, Goal, GoalState, goal_index
 from web_app.logging_utils import log_event
 
 
@@ -148,13 +148,17 @@ def list_goals():
     if limit < 1 or limit > ConfigManager().gpt_actions.max_page_size:
         return _error("invalid_pagination", "limit is outside the allowed range", 400)
 
-    all_goals = DataInterface().load_goals(flask.g.oauth_user).goals
+    data = DataInterface()
+    index = goal_index(
+        data.load_goals(flask.g.oauth_user), data.get_goals_file(flask.g.oauth_user)
+    )
+    all_goals = index.goals
     state = _STATE_NAMES[state_name]
     roots = [
         goal for goal in all_goals.values()
         if goal.state == state
-        and (goal.parent is None or goal.parent not in all_goals
-             or all_goals[goal.parent].state != state)
+        and (index.parents[goal.id] is None
+             or all_goals[index.parents[goal.id]].state != state)
     ]
     roots.sort(key=lambda goal: goal.last_modified, reverse=True)
     page = roots[offset:offset + limit]
@@ -1,13 +1,14 @@
 import shutil
 
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime
 from typing import * # type: ignore
 from enum import Enum
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from web_app.users import User
-from web_app.data_interface import DataInterface as BaseDataInterface
+from web_app.data_interface import DataInterface as BaseDataInterface, VersionCache
 from web_app.config import ConfigManager
 
 
@@ -32,7 +33,105 @@ class Goal(BaseModel):
 
 
 class Goals(BaseModel):
+    # bumped by every saved edit_goals; keys the per-worker goal index
+    version: int = 0
     goals: Dict[int, Goal] = {}
+    # mtime of the goals.json this was loaded from, 0 when not loaded from
+    # disk. Keys the goal index with `version`, which restarts when the file
+    # is recreated after delete_user_data or restored from a backup.
+    _mtime_ns: int = PrivateAttr(default=0)
+
+
+# Goal indexes, per worker. Keys include the goals version, so any edit
+# makes stale entries unreachable.
+goal_cache = VersionCache(lambda: ConfigManager().todoist.goal_index_cache_entries)
+
+
+@dataclass(frozen=True)
+class GoalIndex:
+    """Tree lookups and subtree aggregates derived from one saved version of the goals."""
+    goals: Dict[int, Goal]
+    # goal id -> id of the goal listing it as a child, None for roots
+    parents: Dict[int, Optional[int]]
+    depth: Dict[int, int]
+    # goal id -> aggregate over the goal and all its descendants
+    latest_modified: Dict[int, float]
+    descendants: Dict[int, int]
+    completed_descendants: Dict[int, int]
+    # completed goals, most recently completed first
+    completed: Tuple[Goal, ...]
+
+    @classmethod
+    def build(cls, goals: Goals) -> 'GoalIndex':
+        all_goals = goals.goals
+        parents: Dict[int, Optional[int]] = {}
+        for goal in all_goals.values():
+            for child_id in goal.children:
+                if child_id in all_goals and child_id != goal.id:
+                    parents.setdefault(child_id, goal.id)
+
+        # Preorder from the roots, then from whatever only a corrupt cycle
+        # reaches; iterative, so deep trees cannot hit the recursion limit.
+        depth: Dict[int, int] = {}
+        order: List[int] = []
+        starts = [goal_id for goal_id in all_goals if goal_id not in parents]
+        for start in starts + list(all_goals):
+            if start in depth:
+                continue
+            depth[start] = 0
+            stack = [start]
+            while stack:
+                goal_id = stack.pop()
+                order.append(goal_id)
+                for child_id in all_goals[goal_id].children:
+                    if child_id not in depth and parents.get(child_id) == goal_id:
+                        depth[child_id] = depth[goal_id] + 1
+                        stack.append(child_id)
+
+        # Reversed preorder visits every goal after its descendants.
+        latest_modified = {goal_id: goal.last_modified.timestamp() for goal_id, goal in all_goals.items()}
+        descendants = dict.fromkeys(all_goals, 0)
+        completed_descendants = dict.fromkeys(all_goals, 0)
+        for goal_id in reversed(order):
+            parent = parents.get(goal_id)
+            if parent is None or depth[goal_id] != depth[parent] + 1:
+                continue
+            if latest_modified[goal_id] > latest_modified[parent]:
+                latest_modified[parent] = latest_modified[goal_id]
+            descendants[parent] += descendants[goal_id] + 1
+            completed_descendants[parent] += completed_descendants[goal_id] + (
+                all_goals[goal_id].state == GoalState.COMPLETED
+            )
+
+        return cls(
+            goals=all_goals,
+            parents={goal_id: parents.get(goal_id) for goal_id in all_goals},
+            depth=depth,
+            latest_modified=latest_modified,
+            descendants=descendants,
+            completed_descendants=completed_descendants,
+            completed=tuple(sorted(
+                (goal for goal in all_goals.values()
+                 if goal.state == GoalState.COMPLETED and goal.completion_date),
+                key=lambda goal: goal.completion_date.timestamp(),  # type: ignore
+                reverse=True,
+            )),
+        )
+
+
+def goal_index(goals: Goals, goals_file: Path) -> GoalIndex:
+    """The GoalIndex of freshly loaded `goals`.
+
+    Do not use it on a model being edited: the version only changes when the
+    edit is saved. Version 0 (never saved through edit_goals) and goals not
+    loaded through load_goals are not cached.
+    """
+    if goals.version == 0 or goals._mtime_ns == 0:
+        return GoalIndex.build(goals)
+    return goal_cache.get(
+        (str(goals_file), goals.version, goals._mtime_ns),
+        lambda: GoalIndex.build(goals),
+    )
 
 
 class DataInterface(BaseDataInterface):
@@ -42,15 +141,27 @@ class DataInterface(BaseDataInterface):
 
     def load_goals(self, user: User) -> Goals:
         """Read-only load. For mutations use edit_goals() so the write is locked."""
-        return self.load_model(self._get_goals_file(user), Goals) or Goals(goals={})
+        goals_file = self.get_goals_file(user)
+        goals = self.load_model(goals_file, Goals)
+        if goals is None:
+            return Goals(goals={})
+        goals._mtime_ns = goals_file.stat().st_mtime_ns
+        return goals
 
     def edit_goals(self, user: User):
         """Transactional edit: `with di.edit_goals(user) as goals: goals...`.
 
         Locks the user's goals.json, loads it fresh, and saves on clean exit
         (only if changed). Callers perform just the in-memory mutation.
+        Every saved change bumps `goals.version`, which the index is keyed on.
         """
-        return self.edit_model(self._get_goals_file(user), Goals, exclude_none=True)
+        return self.edit_model(
+            self.get_goals_file(user), Goals, exclude_none=True, on_change=self._bump_version,
+        )
+
+    @staticmethod
+    def _bump_version(goals: Goals) -> None:
+        goals.version += 1
 
     def backup_data(self, backup_dir: Path) -> None:
         self._backup_subtree(self.todoist_data_directory, backup_dir, "todoist")
@@ -58,5 +169,5 @@ class DataInterface(BaseDataInterface):
     def delete_user_data(self, user: User) -> None:
         shutil.rmtree(self.todoist_data_directory / user.folder, ignore_errors=True)
 
-    def _get_goals_file(self, user: User) -> Path:
+    def get_goals_file(self, user: User) -> Path:
         return self.todoist_data_directory / user.folder / "goals.json"
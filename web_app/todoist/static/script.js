@@ -397,6 +397,44 @@ function loadMoreCompletedGoals() {
 		});
 }
 
+function renderGoalVelocity(container) {
+	const velocity = JSON.parse(container.dataset.velocity);
+	const traces = [
+		{
+			x: velocity.completions,
+			y: velocity.completions.map((_, index) => index),
+			name: 'cumulative completions',
+			line: { color: 'green' },
+		},
+		{
+			x: velocity.weeks,
+			y: velocity.smoothed,
+			name: 'smooth velocity',
+			yaxis: 'y2',
+			line: { color: 'blue', shape: 'spline', smoothing: 1.3 },
+		},
+		{
+			x: velocity.completions,
+			y: velocity.simple_rate,
+			name: 'simple average',
+			yaxis: 'y2',
+			line: { color: 'red' },
+		},
+	];
+	Plotly.newPlot(container, traces, {
+		title: { text: 'Goal Completion Velocity' },
+		xaxis: { title: { text: 'Date' } },
+		yaxis: { title: { text: 'Cumulative' } },
+		yaxis2: {
+			title: { text: 'Velocity (per week)' },
+			overlaying: 'y',
+			side: 'right',
+			range: [0, velocity.max_weekly],
+		},
+		legend: { yanchor: 'top', x: 0, y: -0.4 },
+	}, { responsive: true });
+}
+
 // Initialize pagination based on which page we're on
 document.addEventListener('DOMContentLoaded', function() {
 	document.addEventListener('change', function(event) {
@@ -422,4 +460,7 @@ document.addEventListener('DOMContentLoaded', function() {
 	}
 
 	initGoalDragAndDrop();
+
+	const velocityChart = document.querySelector('[data-velocity]');
+	if (velocityChart && window.Plotly) renderGoalVelocity(velocityChart);
 });
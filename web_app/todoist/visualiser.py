@@ -1,112 +1,75 @@
 from typing import * # type: ignore
-from plotly import express, graph_objects
-from plotly.subplots import make_subplots
-from pandas import DataFrame
 from datetime import timedelta, datetime
+from pathlib import Path
+
+import numpy as np
 from scipy.signal import savgol_filter
 
-from web_app.todoist.data_interface import Goal, GoalState
+from web_app.todoist.data_interface import Goal, Goals, goal_cache, goal_index
+
+
+DAY_S = 24 * 3600
+WEEK_S = 7 * DAY_S
 
 
 def get_immediate_monday(date: datetime) -> datetime:
     monday = date - timedelta(days=date.weekday())
     return monday
 
-# returns a tuple containing a list of the number of completions per week and a list of the dates of the end of each week
-def get_completions_per_week(completions: List[datetime]) -> Tuple[List[int], List[datetime]]:
-    first_monday = get_immediate_monday(completions[0])
-    last_monday = get_immediate_monday(completions[-1]) + timedelta(weeks=1)
-
-    weeks = []
-    completions_per_week = []
-
-    num_days_in_week = 7
+def _epoch_seconds(dates: Sequence[datetime]) -> np.ndarray:
+    return np.array(dates, dtype='datetime64[s]').astype(np.int64)
 
-    curr_monday = first_monday
-    completion_idx = 0
-    while curr_monday < last_monday:
-        next_monday = curr_monday + timedelta(days=num_days_in_week)
-        completions_in_curr_week = 0
-        while completion_idx < len(completions) and completions[completion_idx] < next_monday:
-            completion_idx += 1
-            completions_in_curr_week += 1
-        weeks.append(curr_monday)
-        completions_per_week.append(completions_in_curr_week)
-        curr_monday = next_monday
+def _iso(seconds: np.ndarray) -> List[str]:
+    return np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s').tolist()
 
+# returns the number of completions per week and the start of each week, in
+# epoch seconds; weeks run from the Monday of the first completion
+def get_completions_per_week(completions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # 1970-01-01 was a Thursday
+    mondays = completions - ((completions // DAY_S + 3) % 7) * DAY_S
+    first_monday = mondays[0]
+    num_weeks = -(-(mondays[-1] + WEEK_S - first_monday) // WEEK_S)
+    completions_per_week = np.bincount((completions - first_monday) // WEEK_S, minlength=num_weeks)
+    weeks = first_monday + np.arange(num_weeks) * WEEK_S
     return completions_per_week, weeks
 
-def calculate_moving_averages(completions_per_week: List[int]) -> List[float]:
-    averages = []
-    window_size = 3
-    for i in range(len(completions_per_week)):
-        if i < window_size:
-            averages.append(0)
-        averages.append(sum(completions_per_week[i:i+window_size]) / float(window_size))
-    return averages
-
-def apply_smoothening(completions_per_week: List[int]) -> List[float]:
+def apply_smoothening(completions_per_week: np.ndarray) -> np.ndarray:
     window_size = 7
     polynomial_order = 1
     filtered = savgol_filter(completions_per_week, window_size, polynomial_order)
     return filtered
 
-def calculate_simple_rate(completions: List[datetime]) -> List[float]:
-    if not completions:
-        return []
-    
-    rate = []
-    for completion_date in completions:
-        period = completion_date - completions[0]
-        if period.days < 1:
-            rate.append(0)
-            continue
-        rate.append(len(rate) / (period.days/7.0))
-    return rate
-
-def plot_velocity(goals: List[Goal]) -> str:
-    if not goals:
+def calculate_simple_rate(completions: np.ndarray) -> np.ndarray:
+    days = (completions - completions[0]) // DAY_S
+    return np.divide(
+        np.arange(len(completions)), days / 7.0,
+        out=np.zeros(len(completions)), where=days >= 1,
+    )
+
+def velocity_series(goals: List[Goal]) -> Dict[str, Any]:
+    """Compact chart series for the velocity page, plotted client-side.
+
+    The cumulative completion count of `completions[i]` is `i`.
+    """
+    dates = sorted(goal.completion_date for goal in goals if goal.completion_date)
+    if not dates:
         raise RuntimeError("No goals to plot")
 
-    goals = [goal for goal in goals if goal.state == GoalState.COMPLETED]
-    goals.sort(key=lambda goal: goal.completion_date.timestamp())
-    completion_dates = [goal.completion_date for goal in goals]
-
-    completions_per_week, weeks = get_completions_per_week(completion_dates)
-    # moving_averages = calculate_moving_averages(completions_per_week)
-    smoothened = apply_smoothening(completions_per_week)
-
-    df = DataFrame(data={'completion_date': completion_dates, 'completions': range(len(completion_dates))})
-    trace1 = graph_objects.Scatter(x=completion_dates, 
-                                   y=df['completions'], 
-                                   name='cumulative completions',
-                                   line=dict(color='green'))
-    # trace2 = graph_objects.Scatter(x=weeks, 
-    #                                y=completions_per_week, 
-    #                                name='completion velocity', 
-    #                                line=dict(dash='dot', color='black'))
-    # trace3 = graph_objects.Scatter(x=weeks, y=moving_averages, name='moving average')
-    trace4 = graph_objects.Scatter(x=weeks, 
-                                   y=smoothened, 
-                                   name='smooth velocity',
-                                   line=dict(color='blue', 
-                                             shape='spline',
-                                             smoothing=1.3))
-    trace5 = graph_objects.Scatter(x=completion_dates,
-                                   y=calculate_simple_rate(completion_dates),
-                                   name='simple average',
-                                   line=dict(color='red'))
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    fig.add_trace(trace1)
-    # fig.add_trace(trace2, secondary_y=True)
-    # fig.add_trace(trace3, secondary_y=True)
-    fig.add_trace(trace4, secondary_y=True)
-    fig.add_trace(trace5, secondary_y=True)
-    fig['layout'].update(title='Goal Completion Velocity')
-    fig.update_xaxes(title_text='Date')
-    fig.update_yaxes(title_text='Cumulative', secondary_y=False)
-    fig.update_yaxes(title_text='Velocity (per week)', secondary_y=True)
-    fig.update_layout(yaxis2=dict(range=[0, max(completions_per_week)]))
-    fig.update_layout(legend=dict(yanchor='top', x=0, y=-0.4))
-    
-    return fig.to_html(full_html=False)
\ No newline at end of file
+    completions = _epoch_seconds(dates)
+    completions_per_week, weeks = get_completions_per_week(completions)
+    return {
+        'completions': _iso(completions),
+        'simple_rate': np.round(calculate_simple_rate(completions), 3).tolist(),
+        'weeks': _iso(weeks),
+        'smoothed': np.round(apply_smoothening(completions_per_week), 3).tolist(),
+        'max_weekly': int(completions_per_week.max()),
+    }
+
+def goal_velocity(goals: Goals, goals_file: Path) -> Dict[str, Any]:
+    """velocity_series of the completed goals, cached like goal_index."""
+    def build() -> Dict[str, Any]:
+        return velocity_series(list(goal_index(goals, goals_file).completed))
+
+    if goals.version == 0 or goals._mtime_ns == 0:
+        return build()
+    return goal_cache.get(('velocity', str(goals_file), goals.version, goals._mtime_ns), build)
@@ -35,6 +35,12 @@ def _inject_tubio_config():
             'collapsed_storage_key': config.sidebar_collapsed_storage_key,
             'selected_storage_key': config.sidebar_selected_storage_key,
         },
+        'tubio_bulk_cache': {
+            'poll_interval_ms': config.bulk_cache_poll_interval_ms,
+        },
+        'tubio_offline': {
+            'budget_bytes': config.offline_budget_bytes,
+        },
         'tubio_surprise': {
             'buffer_size': config.surprise_buffer_size,
             'cache_poll_interval_ms': config.surprise_cache_poll_interval_ms,
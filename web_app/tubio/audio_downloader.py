@@ -4,14 +4,22 @@ import json
 import logging
 import yt_dlp
 import binascii
+import hashlib
+import math
+import threading
+import time
 
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Callable
 from datetime import timedelta
 
 from web_app.config import ConfigManager
 from web_app.redis_client import get_redis
-from web_app.tubio.data_interface import AudioMetadata, DataInterface
+from web_app.tubio.data_interface import AudioMetadata, DataInterface, normalize_search_text
+from web_app.tubio.extractor import extract_info
+from web_app.tubio.thumbnails import ThumbnailError
 from web_app.users import User
 from web_app.logging_utils import log_event
 
@@ -27,18 +35,29 @@ class VideoTooLongError(Exception):
         )
 
 
+class SearchUnavailableError(Exception):
+    """Raised when no results page of a search could be parsed (consent, bot-check or layout change)."""
+
+
 @dataclass
 class DownloadProgress:
-    """Redis-backed progress shared by all gunicorn workers."""
+    """Redis-backed progress shared by all gunicorn workers.
+
+    Every persisted state is also published on the video's progress channel.
+    Percent-only updates are coalesced to at most
+    download_progress_max_updates_per_s; status changes and errors always go
+    out immediately, carrying the latest percent with them.
+    """
 
     video_id: str
     percent: float = 0.0
     status: str = "starting"
     error: str | None = None
+    _persisted_at: float | None = field(default=None, repr=False, compare=False)
 
     @classmethod
-    def start(cls, video_id: str) -> "DownloadProgress":
-        progress = cls(video_id=video_id)
+    def start(cls, video_id: str, status: str = "starting") -> "DownloadProgress":
+        progress = cls(video_id=video_id, status=status)
         progress._persist()
         return progress
 
@@ -49,26 +68,56 @@ class DownloadProgress:
         status: str | None = None,
         error: str | None = None,
     ) -> None:
+        urgent = error is not None or (status is not None and status != self.status)
         if percent is not None:
             self.percent = percent
         if status is not None:
             self.status = status
         if error is not None:
             self.error = error
+        min_interval_s = 1 / ConfigManager().tubio.download_progress_max_updates_per_s
+        if (
+            not urgent
+            and self._persisted_at is not None
+            and time.monotonic() - self._persisted_at < min_interval_s
+        ):
+            return
         self._persist()
 
-    def _persist(self) -> None:
-        payload = json.dumps({
+    def to_json(self) -> str:
+        return json.dumps({
             "percent": self.percent,
             "status": self.status,
             "error": self.error,
         })
-        get_redis().set(
-            ConfigManager().tubio.download_progress_redis_prefix + self.video_id,
-            payload,
-            ex=ConfigManager().tubio.download_progress_ttl_s,
+
+    @classmethod
+    def from_json(cls, video_id: str, raw: str | bytes) -> "DownloadProgress":
+        data = json.loads(raw)
+        return cls(
+            video_id=video_id,
+            percent=data.get("percent", 0.0),
+            status=data.get("status", "starting"),
+            error=data.get("error"),
         )
 
+    def _persist(self) -> None:
+        config = ConfigManager().tubio
+        payload = self.to_json()
+        with get_redis().pipeline() as pipeline:
+            pipeline.set(
+                config.download_progress_redis_prefix + self.video_id,
+                payload,
+                ex=config.download_progress_ttl_s,
+            )
+            pipeline.publish(download_progress_channel(self.video_id), payload)
+            pipeline.execute()
+        self._persisted_at = time.monotonic()
+
+
+def download_progress_channel(video_id: str) -> str:
+    return ConfigManager().tubio.download_progress_channel_prefix + video_id
+
 
 def get_download_progress(video_id: str) -> DownloadProgress | None:
     raw = get_redis().get(
@@ -76,13 +125,7 @@ def get_download_progress(video_id: str) -> DownloadProgress | None:
     )
     if raw is None:
         return None
-    data = json.loads(raw)
-    return DownloadProgress(
-        video_id=video_id,
-        percent=data.get("percent", 0.0),
-        status=data.get("status", "starting"),
-        error=data.get("error"),
-    )
+    return DownloadProgress.from_json(video_id, raw)
 
 
 def clear_download_progress(video_id: str) -> None:
@@ -91,6 +134,86 @@ def clear_download_progress(video_id: str) -> None:
     )
 
 
+_http_session: requests.Session | None = None
+_http_session_lock = threading.Lock()
+
+
+def _youtube_session() -> requests.Session:
+    """Process-wide pooled keep-alive session for YouTube scrapes and suggestions."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            pool_size = ConfigManager().tubio.youtube_http_pool_size
+            session = requests.Session()
+            session.mount("https://", requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size,
+            ))
+            _http_session = session
+        return _http_session
+
+
+def _single_flight_cached(
+    cache_key: str,
+    compute: Callable[[], object],
+    *,
+    ttl_s: int,
+    wait_s: float,
+    poll_interval_s: float,
+    hit_event: str,
+):
+    """JSON value of `compute()`, cached in Redis under `cache_key` for `ttl_s`.
+
+    Identical calls already in flight on any worker are coalesced: one computes
+    while the others wait for its result, computing themselves only if it does
+    not arrive within `wait_s`. Exceptions propagate and nothing is cached.
+    """
+    client = get_redis()
+    lock_key = cache_key + ":lock"
+    cached = client.get(cache_key)
+    leader = cached is None and bool(client.set(
+        lock_key, 1, nx=True, ex=math.ceil(wait_s),
+    ))
+    if cached is None and not leader:
+        deadline = time.monotonic() + wait_s
+        while cached is None and time.monotonic() < deadline and client.exists(lock_key):
+            time.sleep(poll_interval_s)
+            cached = client.get(cache_key)
+        cached = cached or client.get(cache_key)
+    if cached is not None:
+        log_event("tubio", hit_event, coalesced=not leader)
+        return json.loads(cached)
+
+    try:
+        value = compute()
+        client.set(cache_key, json.dumps(value), ex=ttl_s)
+    finally:
+        if leader:
+            client.delete(lock_key)
+    return value
+
+
+_thumbnail_executor: ThreadPoolExecutor | None = None
+_thumbnail_executor_lock = threading.Lock()
+
+
+def _thumbnail_pool() -> ThreadPoolExecutor:
+    """Process-wide bounded pool that fetches thumbnails off the request path."""
+    global _thumbnail_executor
+    with _thumbnail_executor_lock:
+        if _thumbnail_executor is None:
+            _thumbnail_executor = ThreadPoolExecutor(
+                max_workers=ConfigManager().tubio.thumbnail_fetch_workers,
+                thread_name_prefix="nabicat-thumbnail",
+            )
+        return _thumbnail_executor
+
+
+_INITIAL_DATA_MARKERS = ('var ytInitialData = ', 'window["ytInitialData"] = ')
+_PRIMARY_RESULTS_MARKER = '"twoColumnSearchResultsRenderer"'
+_SECTIONS_MARKER = '"sectionListRenderer":{"contents":'
+_json_decoder = json.JSONDecoder()
+
+
 class AudioDownloader:
     @staticmethod
     def extract_video_id(query: str) -> str | None:
@@ -125,43 +248,42 @@ class AudioDownloader:
             ydl_opts['nocheckcertificate'] = True
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    return None
-
-                duration = info.get('duration', 0)
-                vid_length = timedelta(seconds=duration)
-                max_length = max_duration or ConfigManager().tubio.max_video_length
-
-                if vid_length > max_length:
-                    raise VideoTooLongError(video_id, vid_length, max_length)
-
-                length_txt = AudioDownloader._format_duration(duration)
-
-                cached = video_id in cached_yt_vid_ids
-                view_count = info.get('view_count', 0)
-                view_count_str = f"{view_count:,} views" if view_count else ''
-
-                # Get best thumbnail URL
-                thumbnail_url = info.get('thumbnail', '')
-                if not thumbnail_url:
-                    thumbnails = info.get('thumbnails', [])
-                    if thumbnails:
-                        # Prefer medium quality thumbnail
-                        thumbnail_url = thumbnails[-1].get('url', '')
-
-                return {
-                    "video_id": video_id,
-                    "url": url,
-                    "title": info.get('title', ''),
-                    "description": info.get('description', '')[:500] if info.get('description') else '',
-                    "view_count": view_count_str,
-                    "published": info.get('upload_date', ''),
-                    "length": length_txt,
-                    "cached": cached,
-                    "thumbnail_url": thumbnail_url,
-                }
+            info = extract_info(url, ydl_opts)
+            if not info:
+                return None
+
+            duration = info.get('duration', 0)
+            vid_length = timedelta(seconds=duration)
+            max_length = max_duration or ConfigManager().tubio.max_video_length
+
+            if vid_length > max_length:
+                raise VideoTooLongError(video_id, vid_length, max_length)
+
+            length_txt = AudioDownloader._format_duration(duration)
+
+            cached = video_id in cached_yt_vid_ids
+            view_count = info.get('view_count', 0)
+            view_count_str = f"{view_count:,} views" if view_count else ''
+
+            # Get best thumbnail URL
+            thumbnail_url = info.get('thumbnail', '')
+            if not thumbnail_url:
+                thumbnails = info.get('thumbnails', [])
+                if thumbnails:
+                    # Prefer medium quality thumbnail
+                    thumbnail_url = thumbnails[-1].get('url', '')
+
+            return {
+                "video_id": video_id,
+                "url": url,
+                "title": info.get('title', ''),
+                "description": info.get('description', '')[:500] if info.get('description') else '',
+                "view_count": view_count_str,
+                "published": info.get('upload_date', ''),
+                "length": length_txt,
+                "cached": cached,
+                "thumbnail_url": thumbnail_url,
+            }
         except VideoTooLongError:
             raise
         except Exception as error:
@@ -190,8 +312,24 @@ class AudioDownloader:
         Best-effort: returns [] on failure so Surprise generation can exhaust
         cleanly instead of breaking the page.
         Each result carries an integer `duration_s` so the caller can apply the
-        length cap.
+        length cap. Successful lookups are cached in Redis per seed; failures
+        are not, so the next grow retries them.
         """
+        cfg = ConfigManager().tubio
+        client = get_redis()
+        cache_key = cfg.surprise_mix_cache_redis_prefix + video_id
+        cached = client.get(cache_key)
+        if cached is not None:
+            log_event("tubio", "tubio.youtube_mix_cache_hit", seed_video_id=video_id)
+            return json.loads(cached)
+        results = AudioDownloader._extract_mix(video_id)
+        if results is None:
+            return []
+        client.set(cache_key, json.dumps(results), ex=cfg.surprise_mix_cache_ttl_s)
+        return results
+
+    @staticmethod
+    def _extract_mix(video_id: str) -> list[dict] | None:
         cfg = ConfigManager().tubio
         log_event(
             "tubio", "tubio.youtube_mix_started",
@@ -212,8 +350,7 @@ class AudioDownloader:
             ydl_opts['nocheckcertificate'] = True
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+            info = extract_info(url, ydl_opts)
             entries = (info or {}).get('entries') or []
         except Exception as error:
             log_event(
@@ -221,7 +358,7 @@ class AudioDownloader:
                 level=logging.ERROR, seed_video_id=video_id,
                 exc_info=error, error_type=type(error).__name__,
             )
-            return []
+            return None
 
         results = []
         for entry in entries:
@@ -265,18 +402,33 @@ class AudioDownloader:
         """Best-effort YouTube search-term suggestions for autocomplete.
 
         Uses Google's public suggest endpoint (returns JSON `[query, [suggestions...]]`).
+        Results are shared by every user through a Redis cache keyed on the
+        normalized prefix, with identical in-flight prefixes coalesced.
         Never raises — returns [] on any network/parse failure so typing stays responsive.
         """
         cfg = ConfigManager().tubio
-        try:
-            response = requests.get(
+        prefix = normalize_search_text(query)
+
+        def fetch() -> list[str]:
+            response = _youtube_session().get(
                 cfg.autocomplete_suggest_url,
-                params={"client": "firefox", "ds": "yt", "q": query},
+                params={"client": "firefox", "ds": "yt", "q": prefix},
                 timeout=cfg.autocomplete_request_timeout_s,
             )
             response.raise_for_status()
             suggestions = json.loads(response.text)[1]
             return [str(s) for s in suggestions][: cfg.autocomplete_max_suggestions]
+
+        try:
+            return _single_flight_cached(
+                cfg.autocomplete_cache_redis_prefix
+                + hashlib.sha256(prefix.encode()).hexdigest(),
+                fetch,
+                ttl_s=cfg.autocomplete_cache_ttl_s,
+                wait_s=cfg.autocomplete_request_timeout_s,
+                poll_interval_s=cfg.autocomplete_coalesce_poll_interval_s,
+                hit_event="tubio.suggestions_cache_hit",
+            )
         except Exception as error:
             log_event(
                 "tubio", "tubio.suggestions_failed",
@@ -293,45 +445,75 @@ class AudioDownloader:
     ) -> dict:
         """Scrape a single YouTube results page, applying the max-length cap.
 
-        Returns {"results": [survivors], "filtered_too_long": [long_video_ids], "raw_count": int}
-        where raw_count is the number of parseable videoRenderer items on the page (before the
-        length cap). `sp` is the raw base64 duration-filter param, added only when truthy.
+        Returns {"results": [survivors], "filtered_too_long": [long_video_ids], "raw_count": int,
+        "parsed": bool} where raw_count is the number of parseable videoRenderer items on the page
+        (before the length cap) and parsed is False when the page held no readable ytInitialData.
+        `sp` is the raw base64 duration-filter param, added only when truthy.
         """
         params = {"search_query": query}
         if sp:
             params["sp"] = sp
         config = ConfigManager().tubio
-        response = requests.get(
+        response = _youtube_session().get(
             config.youtube_search_url,
             params=params,
             timeout=config.youtube_search_request_timeout_s,
         )
         response.raise_for_status()
-        html = response.text
-        # Extract ytInitialData JSON
-        initial_data_match = re.search(r'var ytInitialData = (\{.*?\});', html, re.DOTALL)
-        if not initial_data_match:
-            log_event(
-                "tubio", "tubio.search_scrape_failed",
-                level=logging.WARNING, filter=sp,
-                html_length=len(html), reason="initial_data_missing",
-            )
-            return {"results": [], "filtered_too_long": [], "raw_count": 0}
+        return AudioDownloader._parse_search_page(response.text, cached_yt_vid_ids, sp=sp)
+
+    @staticmethod
+    def _search_result_sections(html: str) -> list | None:
+        """The primary sectionListRenderer contents of a results page, or None if absent.
+
+        Anchors on the ytInitialData assignment with str.find and decodes only
+        the sections array with raw_decode, leaving the rest of the page (and of
+        ytInitialData) unparsed. Falls back to decoding the whole object when
+        the compact marker is missing. Raises ValueError on malformed JSON.
+        """
+        start = -1
+        for marker in _INITIAL_DATA_MARKERS:
+            start = html.find(marker)
+            if start != -1:
+                start += len(marker)
+                break
+        if start == -1:
+            return None
+        primary = html.find(_PRIMARY_RESULTS_MARKER, start)
+        sections_at = html.find(_SECTIONS_MARKER, primary) if primary != -1 else -1
+        if sections_at != -1:
+            sections, _ = _json_decoder.raw_decode(html, sections_at + len(_SECTIONS_MARKER))
+            return sections
+        data, _ = _json_decoder.raw_decode(html, start)
+        return data.get('contents', {}) \
+            .get('twoColumnSearchResultsRenderer', {}) \
+            .get('primaryContents', {}) \
+            .get('sectionListRenderer', {}) \
+            .get('contents', [])
+
+    @staticmethod
+    def _parse_search_page(
+        html: str,
+        cached_yt_vid_ids: set[str],
+        sp: str | None = None,
+    ) -> dict:
+        """Parse a results page into the _scrape_search_page result shape."""
         try:
-            data = json.loads(initial_data_match.group(1))
-        except Exception as error:
+            sections = AudioDownloader._search_result_sections(html)
+        except ValueError as error:
             log_event(
                 "tubio", "tubio.search_parse_failed",
                 level=logging.WARNING, filter=sp, exc_info=error,
                 error_type=type(error).__name__,
             )
-            return {"results": [], "filtered_too_long": [], "raw_count": 0}
-        # Traverse the JSON to get videoRenderer items
-        sections = data.get('contents', {}) \
-            .get('twoColumnSearchResultsRenderer', {}) \
-            .get('primaryContents', {}) \
-            .get('sectionListRenderer', {}) \
-            .get('contents', [])
+            return {"results": [], "filtered_too_long": [], "raw_count": 0, "parsed": False}
+        if sections is None:
+            log_event(
+                "tubio", "tubio.search_scrape_failed",
+                level=logging.WARNING, filter=sp,
+                html_length=len(html), reason="initial_data_missing",
+            )
+            return {"results": [], "filtered_too_long": [], "raw_count": 0, "parsed": False}
 
         results = []
         filtered_too_long = []
@@ -377,7 +559,72 @@ class AudioDownloader:
                     "cached": cached,
                     "thumbnail_url": thumbnail_url,
                 })
-        return {"results": results, "filtered_too_long": filtered_too_long, "raw_count": raw_count}
+        return {
+            "results": results, "filtered_too_long": filtered_too_long,
+            "raw_count": raw_count, "parsed": True,
+        }
+
+    @staticmethod
+    def _scrape_all_tiers(query: str) -> dict:
+        """Scrape every length-filter tier concurrently and merge them in tier order.
+
+        YouTube's duration buckets are non-deterministic, so every tier always
+        runs and total_pages is computed from what was actually found: no
+        speculative "next page" that could vanish on the follow-up request.
+        Raises SearchUnavailableError when no tier parsed, so a transient
+        block is not cached as an empty result.
+        """
+        tiers = ConfigManager().tubio.search_length_filter_sps
+        with ThreadPoolExecutor(max_workers=len(tiers)) as executor:
+            scrapes = list(executor.map(
+                lambda sp: AudioDownloader._scrape_search_page(query, set(), sp=sp),
+                tiers,
+            ))
+        if not any(scraped["parsed"] for scraped in scrapes):
+            raise SearchUnavailableError(f"No results page for {query!r} could be parsed")
+
+        combined = []
+        seen = set()
+        filtered_ids = set()
+        for tier_idx, (sp, scraped) in enumerate(zip(tiers, scrapes), start=1):
+            new_this_tier = 0
+            for vid in scraped["results"]:
+                if vid["video_id"] in seen:
+                    continue
+                seen.add(vid["video_id"])
+                combined.append(vid)
+                new_this_tier += 1
+            filtered_ids.update(scraped["filtered_too_long"])
+            log_event(
+                "tubio", "tubio.search_tier_completed",
+                tier=tier_idx, filter=sp, raw=scraped["raw_count"],
+                survivors=len(scraped["results"]), new=new_this_tier,
+                too_long=len(scraped["filtered_too_long"]),
+                combined=len(combined),
+            )
+        return {"results": combined, "filtered_too_long": len(filtered_ids - seen)}
+
+    @staticmethod
+    def _search_all_tiers(query: str) -> dict:
+        """Combined tier results for `query`, cached in Redis for a short TTL.
+
+        Search is stateless, so without the cache every page click re-scrapes
+        all tiers. Identical queries already in flight on any worker are
+        coalesced: one request scrapes while the others wait for its result,
+        scraping themselves only if it does not arrive in time.
+        """
+        cfg = ConfigManager().tubio
+        digest = hashlib.sha256(
+            json.dumps([query, list(cfg.search_length_filter_sps)]).encode()
+        ).hexdigest()
+        return _single_flight_cached(
+            cfg.search_cache_redis_prefix + digest,
+            lambda: AudioDownloader._scrape_all_tiers(query),
+            ttl_s=cfg.search_cache_ttl_s,
+            wait_s=cfg.search_coalesce_wait_s,
+            poll_interval_s=cfg.search_coalesce_poll_interval_s,
+            hit_event="tubio.search_cache_hit",
+        )
 
     @staticmethod
     def search_youtube(
@@ -391,8 +638,9 @@ class AudioDownloader:
         If query is a direct YouTube URL, returns only that video with no pagination.
 
         Applies ordered length-filter fallback tiers (config.search_length_filter_sps): starts
-        unfiltered, then falls back to short/medium duration buckets, accumulating deduped results
-        until the requested page is filled or a tier returns nothing.
+        unfiltered, then falls back to short/medium duration buckets, accumulating deduped
+        results. The combined set is cached briefly, so later pages of the same query are
+        served without scraping.
 
         Raises:
             VideoTooLongError: If a direct URL video exceeds its configured length limit.
@@ -417,42 +665,17 @@ class AudioDownloader:
         page_size = cfg.max_results
         max_pages = cfg.max_search_pages
 
-        # Search is stateless (each page click re-scrapes) and YouTube's duration
-        # buckets are non-deterministic, so we always run every tier and build the
-        # full deduped set. total_pages is then computed from what we actually have
-        # — no speculative "next page" that could vanish on the follow-up request.
-        combined = []
-        seen = set()
-        filtered_ids = set()
-        tiers = cfg.search_length_filter_sps
-        for tier_idx, sp in enumerate(tiers, start=1):
-            log_event(
-                "tubio", "tubio.search_tier_started",
-                page=page, tier=tier_idx, tiers=len(tiers), filter=sp,
-            )
-            scraped = AudioDownloader._scrape_search_page(query, cached_yt_vid_ids, sp=sp)
-            new_this_tier = 0
-            for vid in scraped["results"]:
-                if vid["video_id"] in seen:
-                    continue
-                seen.add(vid["video_id"])
-                combined.append(vid)
-                new_this_tier += 1
-            filtered_ids.update(scraped["filtered_too_long"])
-            log_event(
-                "tubio", "tubio.search_tier_completed",
-                tier=tier_idx, raw=scraped["raw_count"],
-                survivors=len(scraped["results"]), new=new_this_tier,
-                too_long=len(scraped["filtered_too_long"]),
-                combined=len(combined),
-            )
-
-        tiers_tried = len(tiers)
+        combined_search = AudioDownloader._search_all_tiers(query)
+        combined = [
+            {**vid, "cached": vid["video_id"] in cached_yt_vid_ids}
+            for vid in combined_search["results"]
+        ]
+        tiers_tried = len(cfg.search_length_filter_sps)
         total_pages = min(max_pages, max(1, (len(combined) + page_size - 1) // page_size))
         page = max(0, min(page, total_pages - 1))
         start = page * page_size
         end = start + page_size
-        filtered_too_long = len(filtered_ids - seen)
+        filtered_too_long = combined_search["filtered_too_long"]
         log_event(
             "tubio", "tubio.search_source_completed",
             tiers_tried=tiers_tried, total_results=len(combined),
@@ -475,7 +698,10 @@ class AudioDownloader:
         *,
         data: DataInterface | None = None,
     ) -> Path | None:
-        """Download and cache the video thumbnail. Returns the local path or None on failure."""
+        """Download the video thumbnail and store its WebP sizes.
+
+        Returns the default-size path, or None on failure.
+        """
         config = ConfigManager().tubio
         thumbnail_url = config.youtube_thumbnail_url_template.format(
             video_id=video_id
@@ -502,7 +728,65 @@ class AudioDownloader:
             return None
 
     @staticmethod
-    def _build_ydl_opts(outtmpl: str, progress_hooks: list | None = None) -> dict:
+    def schedule_thumbnail(
+        video_id: str,
+        crc: int,
+        *,
+        data: DataInterface | None = None,
+    ) -> None:
+        _thumbnail_pool().submit(AudioDownloader.download_thumbnail, video_id, crc, data=data)
+
+    @staticmethod
+    def backfill_thumbnails(*, data: DataInterface | None = None) -> int:
+        """Give every catalog track its WebP sizes, returning how many were made.
+
+        Legacy full-size JPEGs are converted locally; tracks with neither are
+        fetched from YouTube. At most `thumbnail_backfill_concurrency` run at once.
+        """
+        config = ConfigManager().tubio
+        data = data or DataInterface()
+        pending = [
+            audio
+            for audio in data.get_metadata().audios.values()
+            if not all(
+                data.get_thumbnail_path(audio.crc, size).exists()
+                for size, _ in config.thumbnail_sizes
+            )
+        ]
+
+        def backfill(audio: AudioMetadata) -> bool:
+            legacy_path = data.get_legacy_thumbnail_path(audio.crc)
+            if legacy_path.exists():
+                try:
+                    data.save_thumbnail(audio.crc, legacy_path.read_bytes())
+                    return True
+                except (ThumbnailError, OSError) as error:
+                    log_event(
+                        "tubio", "tubio.thumbnail_conversion_failed",
+                        level=logging.WARNING, crc=audio.crc,
+                        exc_info=error, error_type=type(error).__name__,
+                    )
+            if not audio.yt_video_id:
+                return False
+            return AudioDownloader.download_thumbnail(audio.yt_video_id, audio.crc, data=data) is not None
+
+        with ThreadPoolExecutor(
+            max_workers=config.thumbnail_backfill_concurrency,
+            thread_name_prefix="nabicat-thumbnail-backfill",
+        ) as pool:
+            completed = sum(pool.map(backfill, pending))
+        log_event(
+            "tubio", "tubio.thumbnail_backfill_completed",
+            pending=len(pending), completed=completed,
+        )
+        return completed
+
+    @staticmethod
+    def _build_ydl_opts(
+        outtmpl: str,
+        progress_hooks: list | None = None,
+        ratelimit: int | None = None,
+    ) -> dict:
         config = ConfigManager().tubio
         opts = {
             'format': config.youtube_download_format,
@@ -521,6 +805,8 @@ class AudioDownloader:
         }
         if progress_hooks:
             opts['progress_hooks'] = progress_hooks
+        if ratelimit:
+            opts['ratelimit'] = ratelimit
         if ConfigManager().tubio.cookie_path.exists() and not ConfigManager().debug_mode:
             log_event("tubio", "tubio.cookie_file_enabled")
             opts['cookiefile'] = str(ConfigManager().tubio.cookie_path)
@@ -564,8 +850,26 @@ class AudioDownloader:
                 ydl.download([url])
 
     @staticmethod
-    def _progress_hook(progress: DownloadProgress):
+    def _progress_hook(
+        progress: DownloadProgress,
+        should_cancel: Callable[[], bool] | None = None,
+    ):
+        # should_cancel reads Redis, so it is polled at the same rate that
+        # DownloadProgress persists percent updates
+        checked_at: float | None = None
+
         def update(download: dict) -> None:
+            nonlocal checked_at
+            min_interval_s = 1 / ConfigManager().tubio.download_progress_max_updates_per_s
+            now = time.monotonic()
+            if should_cancel is not None and (
+                checked_at is None or now - checked_at >= min_interval_s
+            ):
+                checked_at = now
+                if should_cancel():
+                    raise yt_dlp.utils.DownloadCancelled(
+                        f"Download of {progress.video_id} was cancelled"
+                    )
             if download['status'] == 'downloading':
                 total = (
                     download.get('total_bytes')
@@ -583,12 +887,15 @@ class AudioDownloader:
         data: DataInterface,
         video_id: str,
         progress: DownloadProgress,
+        should_cancel: Callable[[], bool] | None = None,
+        ratelimit: int | None = None,
     ) -> Path:
         temp_template = data.find_avail_temp_file_path(ext=".%(ext)s")
         temp_template.parent.mkdir(parents=True, exist_ok=True)
         options = AudioDownloader._build_ydl_opts(
             temp_template.as_posix(),
-            [AudioDownloader._progress_hook(progress)],
+            [AudioDownloader._progress_hook(progress, should_cancel)],
+            ratelimit,
         )
         AudioDownloader.download_audio_file(video_id, options)
         return temp_template.with_suffix('.m4a')
@@ -597,9 +904,21 @@ class AudioDownloader:
     def download_youtube_audio(
         video_id: str,
         title: str,
-        user: User,
+        user: User | None,
         crc: int | None = None,
+        *,
+        should_cancel: Callable[[], bool] | None = None,
+        final_attempt: bool = True,
+        ratelimit: int | None = None,
     ) -> AudioMetadata:
+        """Download, convert and publish one video's audio.
+
+        With no `user` the audio is published without touching any playlist;
+        the download queue adds it for every attached user afterwards.
+        `should_cancel` is polled from the progress hook, and a failure that is
+        not the `final_attempt` is reported as "retrying" rather than "error".
+        `ratelimit` caps the download in bytes per second.
+        """
         log_event(
             "tubio", "tubio.audio_download_started",
             user=user, video_id=video_id, requested_crc=crc,
@@ -614,6 +933,8 @@ class AudioDownloader:
                 data,
                 video_id,
                 progress,
+                should_cancel,
+                ratelimit,
             )
             if crc is None:
                 crc = binascii.crc32(converted_file.read_bytes())
@@ -628,15 +949,22 @@ class AudioDownloader:
             )
             output_file = data.app_audio_dir / f"{crc}.m4a"
             output_file.parent.mkdir(parents=True, exist_ok=True)
-            converted_file.replace(output_file)
+            # Publish inside the lock so a concurrent reap_trash cannot move it.
             with data.edit_metadata() as metadata:
+                converted_file.replace(output_file)
                 metadata.audios[crc] = audio
-                metadata.get_user(user.id).add_to_playlist(crc)
+                if user is not None:
+                    with data.edit_user_metadata(user.id) as user_metadata:
+                        user_metadata.add_to_playlist(crc)
             metadata_saved = True
-            AudioDownloader.download_thumbnail(video_id, crc, data=data)
+            AudioDownloader.schedule_thumbnail(video_id, crc, data=data)
             progress.update(status="complete", percent=100)
         except Exception as error:
-            progress.update(status="error", error=str(error))
+            if isinstance(error, yt_dlp.utils.DownloadCancelled):
+                status = "cancelled"
+            else:
+                status = "error" if final_attempt else "retrying"
+            progress.update(status=status, error=str(error))
             if converted_file is not None:
                 converted_file.unlink(missing_ok=True)
             if output_file is not None and not metadata_saved:
@@ -673,14 +1001,14 @@ class AudioDownloader:
         try:
             converted = AudioDownloader._download_to_temp(data, video_id, progress)
             output_file.parent.mkdir(parents=True, exist_ok=True)
-            converted.replace(output_file)
             with data.edit_metadata() as metadata:
                 current = metadata.audios.get(audio_metadata.crc)
                 if current is None:
                     raise ValueError("Audio metadata was removed while caching")
+                converted.replace(output_file)
                 current.is_cached = True
             metadata_saved = True
-            AudioDownloader.download_thumbnail(
+            AudioDownloader.schedule_thumbnail(
                 video_id,
                 audio_metadata.crc,
                 data=data,
@@ -1,18 +1,42 @@
 import binascii
+import hashlib
+import json
 import logging
+import os
 import shutil
-
+import subprocess
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 from copy import deepcopy
-from pydub import AudioSegment
+from itertools import islice
+from typing import IO, Callable, Iterable, Iterator
 
-from web_app.data_interface import DataInterface as BaseDataInterface
+from web_app.data_interface import DataInterface as BaseDataInterface, VersionCache
 from web_app.users import User
 from web_app.config import ConfigManager
 from web_app.logging_utils import log_event
+from web_app.tubio.thumbnails import render_thumbnails
+
+
+# Opus streaming variants live beside the m4a as <crc>.<bitrate>.webm.
+AUDIO_VARIANT_SUFFIX = ".webm"
+
+# Catalog indexes, per worker. Keys include the versions of the documents
+# they are derived from, so any edit makes stale entries unreachable.
+catalog_cache = VersionCache(lambda: ConfigManager().tubio.metadata_cache_entries)
+
+
+class UploadRejectedError(ValueError):
+    """An uploaded track exceeds a limit or is not decodable audio."""
 
 
 class Playlist(BaseModel):
@@ -27,8 +51,14 @@ class PlaybackTrim(BaseModel):
 
 class UserMetadata(BaseModel):
     user_id: str
+    # bumped by every saved edit_user_metadata; keys the per-worker user index
+    version: int = 0
     playlists: dict[str, Playlist] = Field(default_factory=dict)
     playback_trims: dict[int, PlaybackTrim] = Field(default_factory=dict)
+    # mtime of the document this was loaded from, 0 when not loaded from
+    # disk. Keys the user index with `version`, which restarts when a deleted
+    # document is recreated or a backup is restored.
+    _mtime_ns: int = PrivateAttr(default=0)
 
     def add_to_playlist(
         self,
@@ -102,17 +132,176 @@ class AudioMetadata(BaseModel):
     source_url: str = ''  # original source URL (e.g. YouTube URL)
 
 class Metadata(BaseModel):
-    # username -> UserMetadata
+    """The shared audio catalog; per-user state lives in UserMetadata documents."""
+    # bumped by every saved edit; keys the per-worker index caches
+    version: int = 0
+    # legacy combined format (username -> UserMetadata), split into per-user
+    # documents on first access and written back only by backups
     users: dict[str, UserMetadata] = Field(default_factory=dict)
     # audio crc -> AudioMetadata
     audios: dict[int, AudioMetadata] = Field(default_factory=dict)
+    # audio crc -> tombstone time; media awaiting physical deletion by reap_trash
+    trash: dict[int, datetime] = Field(default_factory=dict)
+    # audio crc -> number of users whose playlists hold it, kept by
+    # edit_user_metadata and recounted by cleanup_unused_resources(verify=True)
+    refcounts: dict[int, int] = Field(default_factory=dict)
+    # audio crc -> time its last reference went away; collected once the
+    # grace period is over unless it is referenced again
+    unreferenced: dict[int, datetime] = Field(default_factory=dict)
+
+@dataclass(frozen=True)
+class CatalogIndex:
+    """O(1) lookups derived from one saved version of the catalog."""
+    crc_by_video_id: dict[str, int]
+
+    @classmethod
+    def build(cls, metadata: Metadata) -> 'CatalogIndex':
+        crc_by_video_id: dict[str, int] = {}
+        for audio in metadata.audios.values():
+            if audio.yt_video_id:
+                crc_by_video_id.setdefault(audio.yt_video_id, audio.crc)
+        return cls(crc_by_video_id)
+
+
+@dataclass(frozen=True)
+class UserIndex:
+    """One user's ownership and playlist membership, as O(1) lookups."""
+    # crcs / YouTube ids across the user's regular playlists
+    owned_crcs: frozenset[int]
+    owned_video_ids: frozenset[str]
+    # playlist storage key -> crcs, including the Surprise playlist
+    playlist_crcs: dict[str, frozenset[int]]
+
+    @classmethod
+    def build(cls, user_metadata: UserMetadata, metadata: Metadata) -> 'UserIndex':
+        owned_crcs = frozenset(
+            crc
+            for playlist in user_metadata.get_playlists()
+            for crc in playlist.audio_crcs
+            if crc in metadata.audios
+        )
+        return cls(
+            owned_crcs=owned_crcs,
+            owned_video_ids=frozenset(
+                metadata.audios[crc].yt_video_id
+                for crc in owned_crcs
+                if metadata.audios[crc].yt_video_id
+            ),
+            playlist_crcs={
+                key: frozenset(playlist.audio_crcs)
+                for key, playlist in user_metadata.playlists.items()
+            },
+        )
+
+
+def catalog_index(metadata: Metadata, metadata_file: Path) -> CatalogIndex:
+    """The CatalogIndex of a freshly loaded `metadata`.
+
+    Do not use it on a model being edited: the version only changes when the
+    edit is saved. Version 0 (never saved through edit_metadata) is not cached.
+    """
+    if metadata.version == 0:
+        return CatalogIndex.build(metadata)
+    return catalog_cache.get(
+        ('catalog', str(metadata_file), metadata.version),
+        lambda: CatalogIndex.build(metadata),
+    )
+
+
+def user_index(user_metadata: UserMetadata, metadata: Metadata, metadata_file: Path) -> UserIndex:
+    """The UserIndex of freshly loaded documents; same caveats as catalog_index."""
+    if user_metadata.version == 0 or user_metadata._mtime_ns == 0 or metadata.version == 0:
+        return UserIndex.build(user_metadata, metadata)
+    return catalog_cache.get(
+        (
+            'user', str(metadata_file), metadata.version,
+            user_metadata.user_id, user_metadata.version, user_metadata._mtime_ns,
+        ),
+        lambda: UserIndex.build(user_metadata, metadata),
+    )
+
+
+def normalize_search_text(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class TitleIndex:
+    """Prefix lookups over track titles, matching from the start of any word.
+
+    Only the first autocomplete_library_index_chars of each word are indexed;
+    longer queries filter those candidates with startswith, so the index stays
+    proportional to the number of words rather than their length.
+    """
+
+    def __init__(self, titles: Iterable[str]) -> None:
+        depth = ConfigManager().tubio.autocomplete_library_index_chars
+        self._titles: list[str] = []
+        # title id -> (normalized title, offsets of its word starts)
+        self._words: list[tuple[str, tuple[int, ...]]] = []
+        self._candidates: dict[str, dict[int, None]] = {}
+        seen: set[str] = set()
+        for title in titles:
+            normalized = normalize_search_text(title)
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            index = len(self._titles)
+            self._titles.append(title)
+            starts = (0, *(i + 1 for i, char in enumerate(normalized) if char == " "))
+            self._words.append((normalized, starts))
+            for start in starts:
+                for length in range(1, depth + 1):
+                    key = normalized[start:start + length]
+                    self._candidates.setdefault(key, {})[index] = None
+                    if start + length >= len(normalized):
+                        break
+
+    def lookup(self, prefix: str, limit: int) -> list[str]:
+        normalized = normalize_search_text(prefix)
+        if not normalized:
+            return []
+        depth = ConfigManager().tubio.autocomplete_library_index_chars
+        candidates = self._candidates.get(normalized[:depth], ())
+        matches = (
+            self._titles[index]
+            for index in candidates
+            if any(
+                self._words[index][0].startswith(normalized, start)
+                for start in self._words[index][1]
+            )
+        )
+        return list(islice(matches, limit))
+
+
+def library_titles(user_metadata: UserMetadata, metadata: Metadata) -> TitleIndex:
+    """A TitleIndex of the user's own tracks, cached per set of titles.
+
+    Keyed on the user's document and its titles rather than the catalog
+    version, so other users' downloads do not force a rebuild.
+    """
+    titles = [
+        metadata.audios[crc].title
+        for playlist in user_metadata.get_playlists()
+        for crc in playlist.audio_crcs
+        if crc in metadata.audios
+    ]
+    if user_metadata.version == 0 or user_metadata._mtime_ns == 0:
+        return TitleIndex(titles)
+    digest = hashlib.blake2b("\0".join(titles).encode(), digest_size=16).hexdigest()
+    return catalog_cache.get(
+        ('titles', user_metadata.user_id, user_metadata.version, user_metadata._mtime_ns, digest),
+        lambda: TitleIndex(titles),
+    )
+
+
+# metadata file -> (mtime, size, inode) of the catalog this process last found
+# free of legacy users; any other file, such as a restored backup, is re-checked.
+_checked_catalogs: dict[str, tuple[int, int, int]] = {}
+
+# metadata file -> catalog model being edited by this thread, so user edits
+# nested in edit_metadata() apply their reference changes to it.
+_open_catalogs = threading.local()
 
-    def get_user(self, user_id: str) -> UserMetadata:
-        """Get-or-create this user's slice. Use inside an edit_metadata() block
-        so the mutation is persisted under the lock."""
-        if user_id not in self.users:
-            self.users[user_id] = UserMetadata(user_id=user_id)
-        return self.users[user_id]
 
 class DataInterface(BaseDataInterface):
     def __init__(self) -> None:
@@ -120,25 +309,156 @@ class DataInterface(BaseDataInterface):
         self.app_dir = ConfigManager().save_data_path / "tubio"
         self.app_audio_dir = self.app_dir / "audio"
         self.app_thumbnails_dir = self.app_dir / "thumbnails"
+        self.app_trash_dir = self.app_dir / "trash"
         self.app_metadata_file = self.app_dir / "metadata.json"
+        self.app_users_dir = self.app_dir / "users"
 
     def get_metadata(self) -> Metadata:
         """Read-only load. For mutations use edit_metadata() so the write is locked."""
+        self._ensure_user_documents()
         return self.load_model(self.app_metadata_file, Metadata, sync=False) or Metadata()
 
+    @contextmanager
     def edit_metadata(self):
-        """Transactional edit of the shared tubio metadata blob.
+        """Transactional edit of the shared audio catalog.
+
+        `with di.edit_metadata() as metadata: metadata.audios[crc] = ...` —
+        locks the file, loads fresh, saves on clean exit (only if changed).
+        Because the catalog is shared across all users, this is a global lock.
+        Every saved change bumps `metadata.version`, which the indexes are keyed on.
 
-        `with di.edit_metadata() as metadata: metadata.get_user(uid)...` — locks
-        the file, loads fresh, saves on clean exit (only if changed). Because
-        the blob is shared across all users, this is a global lock.
+        Adding a crc to any user's playlists must happen while this lock is
+        held (edit the user document inside the block), so that
+        cleanup_unused_resources never collects a track that is being linked.
+        Removing references, reordering and trims only need the user's lock.
         """
-        return self.edit_model(self.app_metadata_file, Metadata)
+        self._ensure_user_documents()
+        key = str(self.app_metadata_file)
+        with self.edit_model(self.app_metadata_file, Metadata, on_change=self._bump_version) as metadata:
+            _open_catalogs.__dict__[key] = metadata
+            try:
+                yield metadata
+            finally:
+                _open_catalogs.__dict__.pop(key, None)
+
+    @staticmethod
+    def _bump_version(metadata: Metadata | UserMetadata) -> None:
+        metadata.version += 1
+
+    def _user_metadata_file(self, user_id: str) -> Path:
+        # usernames may contain any visible ASCII, including path separators
+        return self.app_users_dir / f"{hashlib.sha256(user_id.encode()).hexdigest()}.json"
+
+    def load_user_metadata(self, user_id: str) -> UserMetadata:
+        """Read-only load of one user's document. For mutations use edit_user_metadata()."""
+        self._ensure_user_documents()
+        return (
+            self._load_user_document(self._user_metadata_file(user_id))
+            or UserMetadata(user_id=user_id)
+        )
+
+    def _load_user_document(self, path: Path) -> UserMetadata | None:
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        user_metadata = self.load_model(path, UserMetadata, sync=False)
+        if user_metadata is not None:
+            user_metadata._mtime_ns = mtime_ns
+        return user_metadata
 
     def get_user_metadata(self, user: User) -> UserMetadata:
-        """Read-only per-user slice. For mutations use edit_metadata() +
-        metadata.get_user(user.id)."""
-        return self.get_metadata().get_user(user.id)
+        return self.load_user_metadata(user.id)
+
+    @contextmanager
+    def edit_user_metadata(self, user_id: str):
+        """Transactional edit of one user's playlists, trims and Surprise state.
+
+        Locks only this user's document. See edit_metadata() for when the
+        catalog lock must be held as well (always taken first). Tracks the
+        edit links or unlinks are counted into the catalog's refcounts once
+        the document is saved: in the enclosing catalog edit if there is one,
+        otherwise in a catalog edit of their own.
+        """
+        self._ensure_user_documents()
+        with self.edit_model(
+            self._user_metadata_file(user_id),
+            UserMetadata,
+            on_change=self._bump_version,
+            default=lambda: UserMetadata(user_id=user_id),
+        ) as user_metadata:
+            before = self._held_crcs(user_metadata)
+            yield user_metadata
+            after = self._held_crcs(user_metadata)
+        self._count_references(after - before, before - after)
+
+    @staticmethod
+    def _held_crcs(user_metadata: UserMetadata) -> set[int]:
+        return {crc for playlist in user_metadata.playlists.values() for crc in playlist.audio_crcs}
+
+    def _count_references(self, linked: set[int], unlinked: set[int]) -> None:
+        if not linked and not unlinked:
+            return
+        metadata = _open_catalogs.__dict__.get(str(self.app_metadata_file))
+        if metadata is not None:
+            self._apply_reference_counts(metadata, linked, unlinked)
+            return
+        with self.edit_metadata() as metadata:
+            self._apply_reference_counts(metadata, linked, unlinked)
+
+    @staticmethod
+    def _apply_reference_counts(metadata: Metadata, linked: set[int], unlinked: set[int]) -> None:
+        now = datetime.now(timezone.utc)
+        for crc in linked:
+            metadata.refcounts[crc] = metadata.refcounts.get(crc, 0) + 1
+            metadata.unreferenced.pop(crc, None)
+        for crc in unlinked:
+            count = metadata.refcounts.get(crc, 0)
+            if count > 1:
+                metadata.refcounts[crc] = count - 1
+            elif count == 1:
+                metadata.refcounts.pop(crc)
+                if crc in metadata.audios:
+                    metadata.unreferenced.setdefault(crc, now)
+            # A missing count is drift (or a catalog never counted yet): the
+            # track is left alone until verification recounts it.
+
+    def iter_user_metadata(self) -> Iterator[UserMetadata]:
+        """Read-only load of every user document."""
+        self._ensure_user_documents()
+        if not self.app_users_dir.exists():
+            return
+        for path in sorted(self.app_users_dir.glob("*.json")):
+            user_metadata = self._load_user_document(path)
+            if user_metadata is not None:
+                yield user_metadata
+
+    def _ensure_user_documents(self) -> None:
+        """Split a legacy combined metadata.json into per-user documents.
+
+        Only a catalog file this process has not checked yet is loaded, so a
+        restored backup is migrated again. User documents are written before
+        the catalog drops `users`, so a crashed migration is simply redone.
+        """
+        key = str(self.app_metadata_file)
+        try:
+            stat = self.app_metadata_file.stat()
+        except FileNotFoundError:
+            return
+        if _checked_catalogs.get(key) == (stat.st_mtime_ns, stat.st_size, stat.st_ino):
+            return
+        legacy = self.load_model(self.app_metadata_file, Metadata, sync=False)
+        if legacy is not None and legacy.users:
+            with self.edit_model(
+                self.app_metadata_file, Metadata, on_change=self._bump_version,
+            ) as metadata:
+                for user_id, user_metadata in metadata.users.items():
+                    self._save_model(self._user_metadata_file(user_id), user_metadata)
+                migrated = len(metadata.users)
+                metadata.users = {}
+            log_event("tubio", "tubio.user_documents_migrated", users=migrated)
+            stat = self.app_metadata_file.stat()
+        _checked_catalogs[key] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
 
     def get_audio_metadata(self, crc: int|None = None, yt_video_id: str|None = None) -> AudioMetadata:
         if not ((crc is None) ^ (yt_video_id is None)):
@@ -150,42 +470,111 @@ class DataInterface(BaseDataInterface):
                 raise ValueError(f"Audio with crc {crc} does not exist.")
             return metadata.audios[crc]
         else:
-            for audio in metadata.audios.values():
-                if audio.yt_video_id == yt_video_id:
-                    return audio
-            raise ValueError(f"Audio with yt_video_id {yt_video_id} does not exist.")
+            crc = catalog_index(metadata, self.app_metadata_file).crc_by_video_id.get(yt_video_id)
+            if crc is None:
+                raise ValueError(f"Audio with yt_video_id {yt_video_id} does not exist.")
+            return metadata.audios[crc]
         
-    def save_audio(self, title: str, audio_data: bytes, ext: str) -> int:
-        crc = binascii.crc32(audio_data)
+    def save_audio(self, title: str, stream: IO[bytes], ext: str) -> int:
+        """Ingest an uploaded track, returning its crc.
 
-        if crc in self.get_metadata().audios:
-            log_event(
-                "tubio", "tubio.audio_save_skipped",
-                level=logging.WARNING, crc=crc, reason="already_exists",
+        The upload is spooled to disk while its crc is computed, then ffmpeg
+        converts it file-to-file (a stream copy when it is already AAC), so
+        memory use does not grow with track length. `ext` is only the spooled
+        file's suffix; ffprobe decides how the content is handled.
+        """
+        config = ConfigManager().tubio
+        # Stage next to the final path (slow transcode kept outside the metadata
+        # lock), then publish with a rename inside it so a concurrent
+        # reap_trash can never move the new file away.
+        self.app_audio_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=self.app_audio_dir) as staging_dir:
+            audio_path = Path(staging_dir) / f"upload.{ext}"
+            crc = 0
+            written = 0
+            with audio_path.open("wb") as output:
+                while chunk := stream.read(config.upload_stream_chunk_bytes):
+                    written += len(chunk)
+                    if written > config.upload_max_bytes:
+                        raise UploadRejectedError("Uploaded file is too large")
+                    crc = binascii.crc32(chunk, crc)
+                    output.write(chunk)
+
+            if crc in self.get_metadata().audios:
+                log_event(
+                    "tubio", "tubio.audio_save_skipped",
+                    level=logging.WARNING, crc=crc, reason="already_exists",
+                )
+                return crc  # already exists
+
+            codec, duration_s = self._probe_upload(audio_path)
+            if duration_s > config.upload_max_duration_s:
+                raise UploadRejectedError("Uploaded track is too long")
+            output_path = Path(staging_dir) / f"{crc}.m4a"
+            codec_args = (
+                ["-c:a", "copy"]
+                if codec == "aac"
+                else ["-c:a", "aac", "-b:a", config.upload_transcode_bitrate]
             )
-            return crc  # already exists
-
-        audio_path = self.app_audio_dir / f"{crc}.{ext}"
-        audio_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(audio_path, 'wb') as f:
-            f.write(audio_data)
-
-        if ext != 'm4a':
-            # convert to m4a (slow transcode — kept outside the metadata lock)
-            audio = AudioSegment.from_file(audio_path, format=ext)
-            output_path = self.app_audio_dir / f"{crc}.m4a"
-            config = ConfigManager().tubio
-            audio.export(
-                output_path,
-                format=config.upload_transcode_format,
-                bitrate=config.upload_transcode_bitrate,
+            self._run_upload_command(
+                [
+                    "ffmpeg", "-nostdin", "-hide_banner", "-v", "error",
+                    "-i", str(audio_path),
+                    "-map", "0:a:0",
+                    *codec_args,
+                    "-movflags", "+faststart",
+                    "-f", config.upload_transcode_format,
+                    str(output_path),
+                ],
+                config.upload_transcode_timeout_s,
             )
-            audio_path.unlink()  # remove original file
-
-        self.upsert_audio_metadata(AudioMetadata(crc=crc, title=title, is_cached=True))
+            log_event(
+                "tubio", "tubio.upload_transcoded",
+                crc=crc, size_bytes=written, codec=codec,
+                duration_s=duration_s, stream_copy=codec == "aac",
+            )
+            with self.edit_metadata() as metadata:
+                os.replace(output_path, self.app_audio_dir / f"{crc}.m4a")
+                metadata.audios[crc] = AudioMetadata(crc=crc, title=title, is_cached=True)
 
         return crc
 
+    @staticmethod
+    def _run_upload_command(cmd: list[str], timeout_s: int) -> subprocess.CompletedProcess:
+        try:
+            return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout_s, check=True)
+        except subprocess.TimeoutExpired as e:
+            raise UploadRejectedError("Uploaded track took too long to process") from e
+        except subprocess.CalledProcessError as e:
+            log_event(
+                "tubio", "tubio.upload_command_failed",
+                level=logging.WARNING, executable=Path(cmd[0]).name,
+                returncode=e.returncode,
+            )
+            raise UploadRejectedError("Uploaded file is not a readable audio track") from e
+
+    def _probe_upload(self, path: Path) -> tuple[str, float]:
+        """Codec name and duration in seconds of the first audio stream."""
+        result = self._run_upload_command(
+            [
+                "ffprobe", "-hide_banner", "-v", "error",
+                "-select_streams", "a:0",
+                "-show_entries", "stream=codec_name:format=duration",
+                "-of", "json",
+                str(path),
+            ],
+            ConfigManager().tubio.upload_probe_timeout_s,
+        )
+        try:
+            payload = json.loads(result.stdout or "{}")
+            streams = payload.get("streams") or []
+            duration_s = float(payload.get("format", {}).get("duration") or 0)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            raise UploadRejectedError("Uploaded file is not a readable audio track") from e
+        if not streams:
+            raise UploadRejectedError("Uploaded file has no audio track")
+        return streams[0].get("codec_name", ""), duration_s
+
     def upsert_audio_metadata(self, audio_metadata: AudioMetadata) -> None:
         """Single-shot upsert of one audio record (locked read-modify-write)."""
         with self.edit_metadata() as metadata:
@@ -198,81 +587,233 @@ class DataInterface(BaseDataInterface):
 
         return self.app_audio_dir / f"{crc}.m4a"
 
-    def get_thumbnail_path(self, crc: int) -> Path:
+    def get_peaks_path(self, crc: int) -> Path:
+        return self.app_audio_dir / f"{crc}.peaks"
+
+    def get_variant_path(self, crc: int, quality: str) -> Path:
+        bitrate = dict(ConfigManager().tubio.audio_variant_bitrates)[quality]
+        return self.app_audio_dir / f"{crc}.{bitrate}{AUDIO_VARIANT_SUFFIX}"
+
+    def get_derived_paths(self, crc: int) -> list[Path]:
+        """Files regenerated from the cached m4a: waveform peaks and variants."""
+        return [
+            self.get_peaks_path(crc),
+            *(
+                self.get_variant_path(crc, quality)
+                for quality, _ in ConfigManager().tubio.audio_variant_bitrates
+            ),
+        ]
+
+    def get_thumbnail_path(self, crc: int, size: str | None = None) -> Path:
+        size = size or ConfigManager().tubio.thumbnail_default_size
+        return self.app_thumbnails_dir / f"{crc}.{size}.webp"
+
+    def get_legacy_thumbnail_path(self, crc: int) -> Path:
+        """Full-size JPEG stored before thumbnails were normalized to WebP."""
         return self.app_thumbnails_dir / f"{crc}.jpg"
 
+    def get_thumbnail_paths(self, crc: int) -> list[Path]:
+        return [
+            *(self.get_thumbnail_path(crc, size) for size, _ in ConfigManager().tubio.thumbnail_sizes),
+            self.get_legacy_thumbnail_path(crc),
+        ]
+
     def save_thumbnail(self, crc: int, thumbnail_data: bytes) -> None:
-        self.app_thumbnails_dir.mkdir(parents=True, exist_ok=True)
-        thumbnail_path = self.get_thumbnail_path(crc)
-        with open(thumbnail_path, 'wb') as f:
-            f.write(thumbnail_data)
+        """Store any decodable image as WebP at every configured size."""
+        for size, webp in render_thumbnails(thumbnail_data).items():
+            self.atomic_write(self.get_thumbnail_path(crc, size), data=webp, mode="wb")
+        self.get_legacy_thumbnail_path(crc).unlink(missing_ok=True)
 
     def has_thumbnail(self, crc: int) -> bool:
-        return self.get_thumbnail_path(crc).exists()
+        return self.get_thumbnail_path(crc).exists() or self.get_legacy_thumbnail_path(crc).exists()
+
+    def thumbnail_crcs(self) -> frozenset[int]:
+        """Crcs with a local thumbnail, listed once per change of the directory.
+
+        Adding or removing a thumbnail bumps the directory mtime, so a library
+        render costs one stat() instead of one per track. Filesystem timestamps
+        are coarse, so a directory changed within the last second is listed
+        afresh rather than trusted.
+        """
+        try:
+            mtime_ns = self.app_thumbnails_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return frozenset()
+
+        suffixes = (f".{ConfigManager().tubio.thumbnail_default_size}.webp", ".jpg")
+
+        def build() -> frozenset[int]:
+            crcs = set()
+            for entry in os.scandir(self.app_thumbnails_dir):
+                for suffix in suffixes:
+                    stem = entry.name.removesuffix(suffix)
+                    if stem != entry.name and stem.isdigit():
+                        crcs.add(int(stem))
+            return frozenset(crcs)
+
+        if time.time_ns() - mtime_ns < 1_000_000_000:
+            return build()
+        return catalog_cache.get(('thumbnails', str(self.app_thumbnails_dir), mtime_ns), build)
 
     def delete_user_data(self, user: User) -> None:
-        with self.edit_metadata() as metadata:
-            if user.id not in metadata.users:
-                return
-            metadata.users.pop(user.id)
-        self.cleanup_unused_resources()
+        path = self._user_metadata_file(user.id)
+        if not path.exists():
+            return
+        from web_app.redis_client import rmw_lock
+
+        with rmw_lock(self._model_lock_name(path)):
+            user_metadata = self.load_model(path, UserMetadata, sync=False)
+            self.atomic_delete(path)
+        if user_metadata is not None:
+            self._count_references(set(), self._held_crcs(user_metadata))
+
+    @staticmethod
+    def _surprise_expired(playlist: Playlist, cutoff: datetime) -> bool:
+        last_active = playlist.last_active
+        if last_active is not None and last_active.tzinfo is None:
+            last_active = last_active.replace(tzinfo=timezone.utc)
+        return last_active is not None and last_active < cutoff
 
     def cleanup_unused_resources(
         self,
         now: datetime | None = None,
-    ) -> None:
-        """Expire temporary playlists and remove their unreferenced media."""
+        *,
+        verify: bool = False,
+    ) -> int:
+        """Expire temporary playlists and collect media whose grace period is over.
+
+        Users are swept one document at a time; expiring a Surprise playlist
+        unlinks its tracks like any other edit. `verify` is the periodic full
+        check: it recounts every reference under the catalog lock, correcting
+        drift and scheduling tracks that nothing links to, and trashes stale
+        variants. Returns the number of tracks collected.
+        """
         now = now or datetime.now(timezone.utc)
         cutoff = now - timedelta(
             seconds=ConfigManager().tubio.surprise_playlist_inactivity_ttl_s
         )
         expired_playlists = 0
-        unused_crcs: set[int] = set()
-        remaining_crcs: set[int] = set()
 
-        with self.edit_metadata() as metadata:
-            for user_metadata in metadata.users.values():
+        for snapshot in list(self.iter_user_metadata()):
+            held = self._held_crcs(snapshot)
+            if not any(
+                self._surprise_expired(playlist, cutoff) for playlist in snapshot.playlists.values()
+            ) and held.issuperset(snapshot.playback_trims):
+                continue
+            with self.edit_user_metadata(snapshot.user_id) as user_metadata:
                 for key, playlist in list(user_metadata.playlists.items()):
-                    last_active = playlist.last_active
-                    if last_active is not None and last_active.tzinfo is None:
-                        last_active = last_active.replace(tzinfo=timezone.utc)
-                    if last_active is not None and last_active < cutoff:
+                    if self._surprise_expired(playlist, cutoff):
                         user_metadata.playlists.pop(key)
                         expired_playlists += 1
-
-            used_crcs = {
-                crc
-                for user_metadata in metadata.users.values()
-                for playlist in user_metadata.playlists.values()
-                for crc in playlist.audio_crcs
-            }
-            unused_crcs = set(metadata.audios) - used_crcs
-            for crc in unused_crcs:
-                metadata.audios.pop(crc)
-            for user_metadata in metadata.users.values():
-                for crc in unused_crcs:
-                    user_metadata.playback_trims.pop(crc, None)
-            remaining_crcs = set(metadata.audios)
-
-        for crc in unused_crcs:
-            self.atomic_delete(self.app_audio_dir / f"{crc}.m4a")
-            log_event("tubio", "tubio.unused_audio_deleted", crc=crc)
-        if self.app_thumbnails_dir.exists():
-            remaining_stems = {str(crc) for crc in remaining_crcs}
-            for thumbnail_path in self.app_thumbnails_dir.glob("*.jpg"):
-                if thumbnail_path.stem not in remaining_stems:
-                    self.atomic_delete(thumbnail_path)
+                held = self._held_crcs(user_metadata)
+                for crc in set(user_metadata.playback_trims) - held:
+                    user_metadata.playback_trims.pop(crc)
 
         log_event(
             "tubio",
             "tubio.surprise_cleanup_completed",
             removed=expired_playlists,
         )
+        if verify:
+            with self.edit_metadata() as metadata:
+                self._verify_reference_counts(metadata, now)
+                stale_variants = self._trash_stale_variants(metadata)
+            log_event("tubio", "tubio.stale_variant_cleanup_completed", removed=stale_variants)
+        return self.sweep_unreferenced(now)
+
+    def _verify_reference_counts(self, metadata: Metadata, now: datetime) -> None:
+        """Recount references from every user document. Runs under the catalog lock.
+
+        A removal saved while this runs can leave its track counted one short;
+        the grace period outlasts the verification interval, so the next
+        recount repairs that before the track comes due.
+        """
+        refcounts = Counter(
+            crc
+            for user_metadata in self.iter_user_metadata()
+            for crc in self._held_crcs(user_metadata)
+        )
+        drifted = {
+            crc
+            for crc in set(refcounts) | set(metadata.refcounts)
+            if refcounts[crc] != metadata.refcounts.get(crc, 0)
+        }
+        if drifted:
+            log_event(
+                "tubio", "tubio.refcount_drift",
+                level=logging.WARNING, tracks=len(drifted),
+            )
+        metadata.refcounts = dict(refcounts)
+        for crc in metadata.audios:
+            if crc in refcounts:
+                metadata.unreferenced.pop(crc, None)
+            else:
+                metadata.unreferenced.setdefault(crc, now)
+
+    def sweep_unreferenced(self, now: datetime | None = None) -> int:
+        """Tombstone unreferenced tracks whose grace period is over, returning how many."""
+        now = now or datetime.now(timezone.utc)
+        due = now - timedelta(seconds=ConfigManager().tubio.unreferenced_grace_period_s)
+        with self.edit_metadata() as metadata:
+            collected = []
+            for crc, since in list(metadata.unreferenced.items()):
+                if since.tzinfo is None:
+                    since = since.replace(tzinfo=timezone.utc)
+                if since > due:
+                    continue
+                metadata.unreferenced.pop(crc)
+                if metadata.refcounts.get(crc, 0) or metadata.audios.pop(crc, None) is None:
+                    continue
+                metadata.trash[crc] = now
+                collected.append(crc)
         log_event(
             "tubio",
             "tubio.unused_track_cleanup_completed",
-            removed=len(unused_crcs),
+            removed=len(collected),
         )
+        return len(collected)
+
+    def _trash_stale_variants(self, metadata: Metadata) -> int:
+        """Move variants of dropped tracks or retired bitrates into the trash dir.
+
+        Runs under the catalog lock, which variants are published under too.
+        """
+        if not self.app_audio_dir.exists():
+            return 0
+        bitrates = {bitrate for _, bitrate in ConfigManager().tubio.audio_variant_bitrates}
+        moved = 0
+        for path in self.app_audio_dir.glob(f"*{AUDIO_VARIANT_SUFFIX}"):
+            crc, _, bitrate = path.name.removesuffix(AUDIO_VARIANT_SUFFIX).partition(".")
+            if bitrate in bitrates and crc.isdigit() and int(crc) in metadata.audios:
+                continue
+            self.app_trash_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(path, self.app_trash_dir / path.name)
+            moved += 1
+        return moved
+
+    def reap_trash(self) -> int:
+        """Physically delete tombstoned audio and thumbnails, one locked batch at a time.
+
+        Unreferenced tracks whose grace period is over are tombstoned first.
+        """
+        self.sweep_unreferenced()
+        removed = 0
+        while True:
+            with self.edit_metadata() as metadata:
+                claimed = self._trash_blobs(
+                    metadata.trash, metadata.audios,
+                    lambda crc: [
+                        self.app_audio_dir / f"{crc}.m4a",
+                        *self.get_derived_paths(crc),
+                        *self.get_thumbnail_paths(crc),
+                    ],
+                    self.app_trash_dir,
+                )
+            removed += self._purge_trash_dir(self.app_trash_dir)
+            if not claimed:
+                break
+        log_event("tubio", "tubio.trash_reaped", removed=removed)
+        return removed
 
     def backup_data(self, backup_dir: Path) -> None:
         tubio_backup_dir = backup_dir / "tubio"
@@ -280,13 +821,16 @@ class DataInterface(BaseDataInterface):
         audio_backup_dir = tubio_backup_dir / "audio"
         audio_backup_dir.mkdir(parents=True, exist_ok=True)
         
+        # Written in the combined legacy format; restoring it is migrated
+        # back into per-user documents on first access.
         metadata = deepcopy(self.get_metadata())
-        for user_metadata in metadata.users.values():
+        for user_metadata in self.iter_user_metadata():
             user_metadata.playlists = {
                 key: playlist
                 for key, playlist in user_metadata.playlists.items()
                 if playlist.last_active is None
             }
+            metadata.users[user_metadata.user_id] = user_metadata
         durable_crcs = {
             crc
             for user_metadata in metadata.users.values()
@@ -0,0 +1,517 @@
+"""Redis-backed YouTube download queue and its dedicated worker processes.
+
+Web workers only enqueue: `enqueue_download` registers the requesting user on
+a per-video job (creating and queueing it if none exists) and returns at once,
+leaving progress reporting to DownloadProgress. Worker processes started by
+`python -m web_app.tubio.download_queue` claim jobs into a processing list,
+hold a renewed lease while downloading, and add the finished audio to the
+playlist of every user still attached. A job whose lease lapsed belongs to a
+crashed worker and is requeued by `recover_stalled_jobs`. Bulk "cache
+playlist" jobs are fed into the same queue a few tracks at a time by the
+workers themselves. The same supervisor keeps the warm yt-dlp extractor
+processes of `web_app.tubio.extractor` alive.
+"""
+
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+import uuid
+
+import yt_dlp
+from redis.exceptions import WatchError
+
+from web_app.config import ConfigManager
+from web_app.logging_utils import configure_logging, log_event
+from web_app.redis_client import ensure_local_redis, get_redis
+from web_app.tubio.audio_downloader import AudioDownloader, DownloadProgress, get_download_progress
+from web_app.tubio.data_interface import AudioMetadata, DataInterface, catalog_index
+from web_app.tubio.extractor import peak_rss_bytes, run_extractor, should_recycle
+from web_app.tubio.waveform import compute_peaks
+from web_app.users import User
+
+
+def _job_key(video_id: str) -> str:
+    return ConfigManager().tubio.download_job_redis_prefix + video_id
+
+
+def _users_key(video_id: str) -> str:
+    return _job_key(video_id) + ":users"
+
+
+def _lease_key(video_id: str) -> str:
+    return ConfigManager().tubio.download_lease_redis_prefix + video_id
+
+
+def enqueue_download(
+    video_id: str,
+    title: str,
+    user: User | None,
+    *,
+    ratelimit: int = 0,
+) -> bool:
+    """Attach `user` to the download of `video_id`, queueing it if needed.
+
+    Returns True when a job for the video already existed (single flight).
+    Re-attaching to a job whose users all cancelled revives it. Queueing with
+    no `user` caches the audio for its own sake, so the job is marked
+    cache_only and users detaching never cancel it. `ratelimit` (bytes per
+    second, 0 for none) applies to a job not yet started, and a request
+    without one lifts it.
+    """
+    config = ConfigManager().tubio
+    client = get_redis()
+    job_key, users_key = _job_key(video_id), _users_key(video_id)
+    while True:
+        with client.pipeline() as pipeline:
+            try:
+                pipeline.watch(job_key)
+                attached = bool(pipeline.exists(job_key))
+                pipeline.multi()
+                if attached:
+                    pipeline.hset(job_key, "cancelled", 0)
+                    if not ratelimit:
+                        pipeline.hset(job_key, "ratelimit", 0)
+                else:
+                    pipeline.hset(job_key, mapping={
+                        "title": title, "attempts": 0, "cancelled": 0, "ratelimit": ratelimit,
+                    })
+                    pipeline.rpush(config.download_queue_redis_key, video_id)
+                if user is not None:
+                    pipeline.sadd(users_key, user.id)
+                else:
+                    pipeline.hset(job_key, "cache_only", 1)
+                pipeline.expire(job_key, config.download_job_ttl_s)
+                pipeline.expire(users_key, config.download_job_ttl_s)
+                pipeline.execute()
+                break
+            except WatchError:
+                continue
+    if not attached:
+        DownloadProgress.start(video_id, status="queued")
+    log_event(
+        "tubio", "tubio.download_queued",
+        user=user, video_id=video_id, attached=attached,
+    )
+    return attached
+
+
+def cancel_download(video_id: str, user: User) -> bool:
+    """Detach `user` from a pending download; the last user out cancels it.
+
+    A cache_only job (see enqueue_download) keeps downloading regardless.
+    """
+    client = get_redis()
+    job_key, users_key = _job_key(video_id), _users_key(video_id)
+    while True:
+        with client.pipeline() as pipeline:
+            try:
+                pipeline.watch(job_key, users_key)
+                if not pipeline.exists(job_key) or not pipeline.sismember(users_key, user.id):
+                    pipeline.unwatch()
+                    return False
+                last_user = (
+                    pipeline.scard(users_key) == 1
+                    and pipeline.hget(job_key, "cache_only") != b"1"
+                )
+                pipeline.multi()
+                pipeline.srem(users_key, user.id)
+                if last_user:
+                    pipeline.hset(job_key, "cancelled", 1)
+                pipeline.execute()
+                break
+            except WatchError:
+                continue
+    log_event(
+        "tubio", "tubio.download_cancel_requested",
+        user=user, video_id=video_id, cancelled=last_user,
+    )
+    return True
+
+
+def is_cancelled(video_id: str) -> bool:
+    return get_redis().hget(_job_key(video_id), "cancelled") == b"1"
+
+
+def claim_next_job(token: str) -> str | None:
+    """Block briefly for the next queued video id and lease it to `token`."""
+    config = ConfigManager().tubio
+    client = get_redis()
+    raw = client.blmove(
+        config.download_queue_redis_key,
+        config.download_processing_redis_key,
+        config.download_claim_timeout_s,
+        "LEFT",
+        "RIGHT",
+    )
+    if raw is None:
+        return None
+    video_id = raw.decode()
+    with client.pipeline() as pipeline:
+        pipeline.set(
+            _lease_key(video_id), token,
+            px=int(config.download_lease_ttl_s * 1000),
+        )
+        pipeline.hset(_job_key(video_id), "claimed_at", time.time())
+        pipeline.execute()
+    return video_id
+
+
+def _close_job(video_id: str) -> list[str]:
+    """Delete the job and return the users attached at that moment.
+
+    Users arriving afterwards find the audio already in the library, or
+    create a fresh job if it was never published.
+    """
+    config = ConfigManager().tubio
+    client = get_redis()
+    job_key, users_key = _job_key(video_id), _users_key(video_id)
+    while True:
+        with client.pipeline() as pipeline:
+            try:
+                pipeline.watch(job_key, users_key)
+                user_ids = sorted(user_id.decode() for user_id in pipeline.smembers(users_key))
+                pipeline.multi()
+                pipeline.delete(job_key, users_key, _lease_key(video_id))
+                pipeline.lrem(config.download_processing_redis_key, 0, video_id)
+                pipeline.execute()
+                return user_ids
+            except WatchError:
+                continue
+
+
+def _requeue_job(video_id: str) -> None:
+    config = ConfigManager().tubio
+    with get_redis().pipeline() as pipeline:
+        pipeline.delete(_lease_key(video_id))
+        pipeline.lrem(config.download_processing_redis_key, 0, video_id)
+        pipeline.rpush(config.download_queue_redis_key, video_id)
+        pipeline.execute()
+
+
+def _add_to_playlists(data: DataInterface, crc: int, user_ids: list[str]) -> None:
+    if not user_ids:
+        return
+    with data.edit_metadata():
+        for user_id in user_ids:
+            with data.edit_user_metadata(user_id) as user_metadata:
+                user_metadata.add_to_playlist(crc)
+
+
+def _renew_lease(video_id: str, token: str, stop: threading.Event) -> None:
+    config = ConfigManager().tubio
+    client = get_redis()
+    while not stop.wait(config.download_lease_renewal_interval_s):
+        if client.get(_lease_key(video_id)) != token.encode():
+            return
+        client.pexpire(_lease_key(video_id), int(config.download_lease_ttl_s * 1000))
+
+
+def process_job(video_id: str, token: str) -> None:
+    config = ConfigManager().tubio
+    client = get_redis()
+    job = client.hgetall(_job_key(video_id))
+    if not job:
+        client.lrem(config.download_processing_redis_key, 0, video_id)
+        return
+    if job.get(b"cancelled") == b"1":
+        _close_job(video_id)
+        DownloadProgress.start(video_id, status="cancelled")
+        log_event("tubio", "tubio.download_cancelled", video_id=video_id, stage="queued")
+        return
+
+    data = DataInterface()
+    metadata = data.get_metadata()
+    existing_crc = catalog_index(metadata, data.app_metadata_file).crc_by_video_id.get(video_id)
+    existing = metadata.audios[existing_crc] if existing_crc is not None else None
+    if existing is not None and existing.is_cached:
+        _add_to_playlists(data, existing.crc, _close_job(video_id))
+        DownloadProgress.start(video_id, status="complete")
+        log_event(
+            "tubio", "tubio.download_completed",
+            video_id=video_id, crc=existing.crc, source="existing_cache",
+        )
+        return
+
+    attempt = client.hincrby(_job_key(video_id), "attempts", 1)
+    final_attempt = attempt >= config.download_max_attempts
+    stop_renewal = threading.Event()
+    renewal = threading.Thread(
+        target=_renew_lease, args=(video_id, token, stop_renewal),
+        name=f"nabicat-download-lease-{video_id}", daemon=True,
+    )
+    renewal.start()
+    try:
+        # An uncached catalog entry (a lazy Surprise track, say) is filled
+        # in under its existing crc rather than added again.
+        audio = AudioDownloader.download_youtube_audio(
+            video_id,
+            job[b"title"].decode(),
+            None,
+            crc=existing.crc if existing is not None else None,
+            should_cancel=lambda: is_cancelled(video_id),
+            final_attempt=final_attempt,
+            ratelimit=int(job.get(b"ratelimit", 0)),
+        )
+    except yt_dlp.utils.DownloadCancelled:
+        _close_job(video_id)
+        log_event("tubio", "tubio.download_cancelled", video_id=video_id, stage="downloading")
+        return
+    except Exception as error:
+        if final_attempt:
+            _close_job(video_id)
+        else:
+            _requeue_job(video_id)
+        log_event(
+            "tubio", "tubio.download_failed",
+            level=logging.ERROR, video_id=video_id, attempt=attempt,
+            retrying=not final_attempt, exc_info=error,
+            error_type=type(error).__name__,
+        )
+        return
+    finally:
+        stop_renewal.set()
+        renewal.join()
+
+    _add_to_playlists(data, audio.crc, _close_job(video_id))
+    log_event(
+        "tubio", "tubio.download_completed",
+        video_id=video_id, crc=audio.crc, source="download", attempt=attempt,
+    )
+    # Already off the request path, so the trim editor's waveform is ready
+    # before anyone opens it; the peaks route covers every other way in.
+    try:
+        compute_peaks(audio.crc, data=data)
+    except Exception as error:
+        log_event(
+            "tubio", "tubio.waveform_failed",
+            level=logging.WARNING, crc=audio.crc,
+            exc_info=error, error_type=type(error).__name__,
+        )
+
+
+def _bulk_key(job_id: str) -> str:
+    return ConfigManager().tubio.bulk_cache_redis_prefix + job_id
+
+
+def start_bulk_cache(user: User, playlist_name: str, tracks: list[AudioMetadata]) -> str:
+    """Cache every uncached YouTube track of a playlist; returns the job id.
+
+    Tracks are handed to the download queue a few at a time by
+    `feed_bulk_caches`, so the job never holds more than its concurrency cap
+    of download workers. `bulk_cache_progress` reports on it.
+    """
+    config = ConfigManager().tubio
+    job_id = uuid.uuid4().hex
+    key = _bulk_key(job_id)
+    pending = [
+        json.dumps([audio.yt_video_id, audio.title])
+        for audio in tracks
+        if audio.yt_video_id and not audio.is_cached
+    ]
+    with get_redis().pipeline() as pipeline:
+        pipeline.hset(key, mapping={
+            "user": user.id,
+            "playlist": playlist_name,
+            "crcs": json.dumps([audio.crc for audio in tracks]),
+        })
+        pipeline.expire(key, config.bulk_cache_job_ttl_s)
+        if pending:
+            pipeline.rpush(key + ":pending", *pending)
+            pipeline.expire(key + ":pending", config.bulk_cache_job_ttl_s)
+            pipeline.sadd(config.bulk_cache_active_redis_key, job_id)
+        pipeline.execute()
+    log_event(
+        "tubio", "tubio.bulk_cache_started",
+        user=user, job_id=job_id, tracks=len(tracks), queued=len(pending),
+    )
+    feed_bulk_caches()
+    return job_id
+
+
+def _in_flight(key: str) -> list[str]:
+    client = get_redis()
+    video_ids = sorted(video_id.decode() for video_id in client.smembers(key + ":in_flight"))
+    return [video_id for video_id in video_ids if client.exists(_job_key(video_id))]
+
+
+def feed_bulk_caches() -> int:
+    """Top every active bulk cache up to its concurrency cap; returns tracks queued."""
+    config = ConfigManager().tubio
+    client = get_redis()
+    if not client.scard(config.bulk_cache_active_redis_key):
+        return 0
+    if not client.set(config.bulk_cache_feed_lock_redis_key, 1, nx=True, ex=config.bulk_cache_feed_lock_ttl_s):
+        return 0
+    ratelimit = config.bulk_cache_bandwidth_bytes_per_s // config.bulk_cache_concurrency
+    fed = 0
+    try:
+        for raw_job_id in client.smembers(config.bulk_cache_active_redis_key):
+            job_id = raw_job_id.decode()
+            key = _bulk_key(job_id)
+            if not client.exists(key):
+                client.srem(config.bulk_cache_active_redis_key, job_id)
+                continue
+            in_flight = _in_flight(key)
+            while len(in_flight) < config.bulk_cache_concurrency:
+                raw = client.lpop(key + ":pending")
+                if raw is None:
+                    break
+                video_id, title = json.loads(raw)
+                enqueue_download(video_id, title, None, ratelimit=ratelimit)
+                in_flight.append(video_id)
+                fed += 1
+            with client.pipeline() as pipeline:
+                pipeline.delete(key + ":in_flight")
+                if in_flight:
+                    pipeline.sadd(key + ":in_flight", *in_flight)
+                    pipeline.expire(key + ":in_flight", config.bulk_cache_job_ttl_s)
+                else:
+                    pipeline.srem(config.bulk_cache_active_redis_key, job_id)
+                pipeline.execute()
+            if not in_flight:
+                log_event("tubio", "tubio.bulk_cache_finished", job_id=job_id)
+    finally:
+        client.delete(config.bulk_cache_feed_lock_redis_key)
+    return fed
+
+
+def bulk_cache_progress(job_id: str, data: DataInterface | None = None) -> dict | None:
+    """Aggregate progress of a bulk cache, or None once it has expired."""
+    client = get_redis()
+    key = _bulk_key(job_id)
+    job = client.hgetall(key)
+    if not job:
+        return None
+    audios = (data or DataInterface()).get_metadata().audios
+    crcs = json.loads(job[b"crcs"])
+    cached = sum(1 for crc in crcs if crc in audios and audios[crc].is_cached)
+    pending = client.llen(key + ":pending")
+    in_flight = _in_flight(key)
+    downloading = sum(
+        progress.percent / 100
+        for progress in map(get_download_progress, in_flight)
+        if progress is not None and progress.status != "complete"
+    )
+    total = len(crcs)
+    return {
+        "user": job[b"user"].decode(),
+        "playlist": job[b"playlist"].decode(),
+        "total": total,
+        "cached": cached,
+        "in_flight": len(in_flight),
+        "pending": pending,
+        "failed": max(0, total - cached - pending - len(in_flight)),
+        "percent": round(100 * (cached + downloading) / total, 1) if total else 100.0,
+        "done": not pending and not in_flight,
+    }
+
+
+def recover_stalled_jobs() -> int:
+    """Requeue processing jobs whose worker stopped renewing the lease."""
+    config = ConfigManager().tubio
+    client = get_redis()
+    recovered = 0
+    for raw in client.lrange(config.download_processing_redis_key, 0, -1):
+        video_id = raw.decode()
+        if not client.exists(_job_key(video_id)):
+            client.lrem(config.download_processing_redis_key, 0, video_id)
+            continue
+        if client.exists(_lease_key(video_id)):
+            continue
+        # No claimed_at yet means the claim itself is still in flight.
+        claimed_at = client.hget(_job_key(video_id), "claimed_at")
+        if claimed_at is None or time.time() - float(claimed_at) < config.download_lease_ttl_s:
+            continue
+        # LREM is atomic, so only one recovering worker wins the requeue.
+        if not client.lrem(config.download_processing_redis_key, 1, video_id):
+            continue
+        client.rpush(config.download_queue_redis_key, video_id)
+        DownloadProgress.start(video_id, status="queued")
+        recovered += 1
+        log_event(
+            "tubio", "tubio.download_recovered",
+            level=logging.WARNING, video_id=video_id,
+        )
+    return recovered
+
+
+def run_worker(stop: threading.Event | None = None, *, recycle: bool = False) -> None:
+    """Process jobs until stopped or, with `recycle`, due for recycling.
+
+    Only the supervisor's processes recycle: it replaces them, while nothing
+    restarts the worker thread of a local dev server.
+    """
+    config = ConfigManager().tubio
+    stop = stop or threading.Event()
+    token = uuid.uuid4().hex
+    next_recovery = 0.0
+    jobs = 0
+    log_event("tubio", "tubio.download_worker_started", token=token)
+    while not stop.is_set():
+        if recycle and should_recycle(jobs):
+            log_event(
+                "tubio", "tubio.download_worker_recycled",
+                token=token, jobs=jobs, peak_rss_bytes=peak_rss_bytes(),
+            )
+            return
+        if time.monotonic() >= next_recovery:
+            recover_stalled_jobs()
+            next_recovery = time.monotonic() + config.download_recovery_interval_s
+        feed_bulk_caches()
+        video_id = claim_next_job(token)
+        if video_id is not None:
+            process_job(video_id, token)
+            jobs += 1
+
+
+def _worker_entry(target=run_worker) -> None:
+    config = ConfigManager()
+    config.debug_mode = False
+    configure_logging(debug=False)
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    target(stop, recycle=True)
+
+
+def main() -> None:
+    """Keep the download workers and extractor processes running until terminated.
+
+    Both kinds exit on their own once due for recycling and are replaced here.
+    """
+    config = ConfigManager()
+    config.debug_mode = False
+    configure_logging(debug=False)
+    ensure_local_redis()
+    pools = {
+        run_worker: (config.tubio.download_worker_processes, []),
+        run_extractor: (config.tubio.extractor_processes, []),
+    }
+    stopping = threading.Event()
+
+    def terminate(*_) -> None:
+        stopping.set()
+        for _, processes in pools.values():
+            for process in processes:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    while not stopping.is_set():
+        for target, (size, processes) in pools.items():
+            processes[:] = [process for process in processes if process.is_alive()]
+            while len(processes) < size:
+                process = multiprocessing.Process(target=_worker_entry, args=(target,), daemon=True)
+                process.start()
+                processes.append(process)
+        stopping.wait(1)
+    for _, processes in pools.values():
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""yt-dlp metadata lookups served by warm, long-lived extractor processes.
+
+`extract_info` pushes a request onto a Redis list and blocks on a per-request
+reply key. Extractor processes started by the download supervisor pop
+requests and answer them from YoutubeDL instances kept per option set, so
+extractors, cookies and the yt-dlp import are loaded once per process instead
+of once per call, and yt-dlp memory growth stays out of the web workers.
+Without a live extractor the lookup runs in the calling process.
+"""
+
+import json
+import logging
+import math
+import os
+import resource
+import signal
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from typing import Iterator
+
+import yt_dlp
+
+from web_app.config import ConfigManager
+from web_app.logging_utils import log_event
+from web_app.redis_client import get_redis
+
+
+class ExtractorError(RuntimeError):
+    """An extractor process reported a failure or did not answer in time."""
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def should_recycle(jobs: int) -> bool:
+    """Whether a worker process has done enough jobs or grown enough to restart."""
+    config = ConfigManager().tubio
+    return jobs >= config.extractor_max_jobs or peak_rss_bytes() > config.extractor_max_rss_bytes
+
+
+def extract_info(url: str, options: dict, *, timeout_s: float | None = None) -> dict | None:
+    """`YoutubeDL(options).extract_info(url, download=False)`, on a warm process if one is free.
+
+    Runs in the calling process when no extractor is alive, when requests are
+    already queued behind busy extractors, or when the extractor that claimed
+    the request stops extending its claim before it answers.
+    """
+    config = ConfigManager().tubio
+    client = get_redis()
+    if not client.exists(config.extractor_alive_redis_key):
+        return _extract_in_process(url, options)
+
+    timeout_s = timeout_s or config.extractor_call_timeout_s
+    deadline = time.monotonic() + timeout_s
+    request_id = uuid.uuid4().hex
+    request = json.dumps({
+        "id": request_id,
+        "url": url,
+        "options": options,
+        "deadline": time.time() + timeout_s,
+    })
+    queued = client.rpush(config.extractor_requests_redis_key, request)
+    if queued > config.extractor_max_queued_requests and client.lrem(
+        config.extractor_requests_redis_key, 1, request,
+    ):
+        return _extract_in_process(url, options)
+    reply_key = config.extractor_reply_redis_prefix + request_id
+    claim_key = config.extractor_claim_redis_prefix + request_id
+    claimed = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ExtractorError(f"No extractor answered within {timeout_s}s")
+        reply = client.blpop([reply_key], timeout=min(remaining, config.extractor_alive_ttl_s))
+        if reply is not None:
+            raw = reply[1]
+            break
+        if client.exists(claim_key):
+            claimed = True
+            continue
+        # A claim that lapsed without a reply means its extractor died; an
+        # unclaimed request is only abandoned once no extractor is alive.
+        if not claimed and (
+            client.exists(config.extractor_alive_redis_key)
+            or not client.lrem(config.extractor_requests_redis_key, 1, request)
+        ):
+            continue
+        raw = client.lpop(reply_key)
+        if raw is not None:
+            break
+        log_event(
+            "tubio", "tubio.extractor_lost",
+            level=logging.WARNING, url=url, claimed=claimed,
+        )
+        return _extract_in_process(url, options)
+    payload = json.loads(raw)
+    if "error" in payload:
+        raise ExtractorError(f"{payload['error_type']}: {payload['error']}")
+    return payload["info"]
+
+
+def _extract_in_process(url: str, options: dict) -> dict | None:
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def _options_key(options: dict) -> str:
+    cookie_file = options.get("cookiefile")
+    cookie_mtime = os.stat(cookie_file).st_mtime_ns if cookie_file and os.path.exists(cookie_file) else None
+    return json.dumps([options, cookie_mtime], sort_keys=True)
+
+
+@contextmanager
+def _deadline(timeout_s: float) -> Iterator[None]:
+    # SIGALRM only works on the main thread, which is where extractor
+    # processes run the loop; elsewhere the caller's timeout still applies.
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(*_) -> None:
+        raise ExtractorError(f"Extraction took longer than {timeout_s:.1f}s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout_s)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@contextmanager
+def _claim(request_id: str) -> Iterator[None]:
+    """Hold the request's claim, and this process's alive key, while it is answered.
+
+    A heartbeat thread extends both, so a long lookup is neither mistaken for
+    a dead extractor nor run again by its caller.
+    """
+    config = ConfigManager().tubio
+    client = get_redis()
+    claim_key = config.extractor_claim_redis_prefix + request_id
+    done = threading.Event()
+
+    def beat() -> None:
+        while True:
+            with client.pipeline() as pipeline:
+                pipeline.set(claim_key, os.getpid(), ex=config.extractor_alive_ttl_s)
+                pipeline.set(config.extractor_alive_redis_key, os.getpid(), ex=config.extractor_alive_ttl_s)
+                pipeline.execute()
+            if done.wait(config.extractor_alive_ttl_s / 3):
+                return
+
+    heartbeat = threading.Thread(target=beat, name="nabicat-extractor-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        done.set()
+        heartbeat.join()
+        client.delete(claim_key)
+
+
+def _answer(request: dict, instances: dict[str, yt_dlp.YoutubeDL]) -> None:
+    remaining = request["deadline"] - time.time()
+    if remaining <= 0:
+        log_event(
+            "tubio", "tubio.extractor_request_expired",
+            level=logging.WARNING, url=request["url"],
+        )
+        return
+    with _claim(request["id"]):
+        _answer_claimed(request, instances, remaining)
+
+
+def _answer_claimed(request: dict, instances: dict[str, yt_dlp.YoutubeDL], remaining: float) -> None:
+    config = ConfigManager().tubio
+    key = _options_key(request["options"])
+    started = time.monotonic()
+    try:
+        with _deadline(remaining):
+            if key not in instances:
+                instances[key] = yt_dlp.YoutubeDL(request["options"])
+            info = instances[key].extract_info(request["url"], download=False)
+        reply = {"info": yt_dlp.YoutubeDL.sanitize_info(info)}
+    except Exception as error:
+        # An interrupted instance may be mid-request; start the next one fresh.
+        stale = instances.pop(key, None)
+        if stale is not None:
+            stale.close()
+        reply = {"error": str(error), "error_type": type(error).__name__}
+    reply_key = config.extractor_reply_redis_prefix + request["id"]
+    with get_redis().pipeline() as pipeline:
+        pipeline.rpush(reply_key, json.dumps(reply))
+        pipeline.expire(reply_key, math.ceil(remaining) + config.extractor_alive_ttl_s)
+        pipeline.execute()
+    log_event(
+        "tubio", "tubio.extractor_request_completed",
+        url=request["url"], failed="error" in reply,
+        duration_ms=round((time.monotonic() - started) * 1000),
+    )
+
+
+def run_extractor(stop: threading.Event | None = None, *, recycle: bool = False) -> None:
+    """Answer extraction requests until stopped or, with `recycle`, due for recycling."""
+    config = ConfigManager().tubio
+    stop = stop or threading.Event()
+    client = get_redis()
+    instances: dict[str, yt_dlp.YoutubeDL] = {}
+    jobs = 0
+    log_event("tubio", "tubio.extractor_started")
+    try:
+        while not stop.is_set() and not (recycle and should_recycle(jobs)):
+            client.set(config.extractor_alive_redis_key, os.getpid(), ex=config.extractor_alive_ttl_s)
+            raw = client.blpop(
+                [config.extractor_requests_redis_key],
+                timeout=config.extractor_claim_timeout_s,
+            )
+            if raw is None:
+                continue
+            _answer(json.loads(raw[1]), instances)
+            jobs += 1
+    finally:
+        for ydl in instances.values():
+            ydl.close()
+        log_event(
+            "tubio", "tubio.extractor_stopped",
+            jobs=jobs, peak_rss_bytes=peak_rss_bytes(),
+        )
@@ -1,34 +1,26 @@
 import json
 import logging
-import time
 
-from flask import Response, flash, redirect, render_template, request, url_for
+from flask import Response, flash, redirect, request, url_for
 
 from web_app.config import ConfigManager
-from web_app.helpers import cur_user, parse_request
+from web_app.helpers import cur_user, limiter, parse_request
 from web_app.logging_utils import log_event
 from web_app.tubio import tubio_api
+from web_app.redis_client import get_redis
 from web_app.tubio.audio_downloader import (
-    AudioDownloader,
-    clear_download_progress,
+    DownloadProgress,
+    download_progress_channel,
     get_download_progress,
 )
-from web_app.tubio.data_interface import DataInterface
-from web_app.tubio.routes.playlists import (
-    get_cached_yt_vid_ids,
-    get_playlists_data,
+from web_app.tubio.data_interface import DataInterface, catalog_index, user_index
+from web_app.tubio.download_queue import (
+    bulk_cache_progress,
+    cancel_download,
+    enqueue_download,
+    start_bulk_cache,
 )
-
-
-def _library_response(message: str) -> dict:
-    return {
-        'success': True,
-        'message': message,
-        'library_html': render_template(
-            'playlists.html',
-            playlists=get_playlists_data(cur_user()),
-        ),
-    }
+from web_app.tubio.routes.playlists import library_update, render_library
 
 
 @tubio_api.route('/youtube_download', methods=['POST'])
@@ -61,7 +53,11 @@ def youtube_download():
         return {'error': 'No video ID or title provided'}, 400
 
     user = cur_user()
-    if video_id in get_cached_yt_vid_ids(user):
+    data = DataInterface()
+    metadata = data.get_metadata()
+    before = data.load_user_metadata(user.id)
+    owned = user_index(before, metadata, data.app_metadata_file)
+    if video_id in owned.owned_video_ids:
         log_event(
             "tubio",
             "tubio.download_rejected",
@@ -71,11 +67,11 @@ def youtube_download():
         )
         return {'error': 'Already in playlist', 'type': 'info'}, 400
 
-    data = DataInterface()
-    if video_id in get_cached_yt_vid_ids(data=data):
-        existing = data.get_audio_metadata(yt_video_id=video_id)
-        with data.edit_metadata() as metadata:
-            metadata.get_user(user.id).add_to_playlist(existing.crc)
+    existing_crc = catalog_index(metadata, data.app_metadata_file).crc_by_video_id.get(video_id)
+    if existing_crc is not None:
+        existing = metadata.audios[existing_crc]
+        with data.edit_metadata(), data.edit_user_metadata(user.id) as user_metadata:
+            user_metadata.add_to_playlist(existing.crc)
         log_event(
             "tubio",
             "tubio.download_completed",
@@ -83,10 +79,14 @@ def youtube_download():
             crc=existing.crc,
             source="existing_cache",
         )
-        return _library_response(f'Added {existing.title} to playlist')
+        return {
+            'success': True,
+            'message': f'Added {existing.title} to playlist',
+            **library_update(before, data=data),
+        }
 
     try:
-        audio = AudioDownloader.download_youtube_audio(video_id, title, user)
+        attached = enqueue_download(video_id, title, user)
     except Exception as error:
         log_event(
             "tubio",
@@ -96,36 +96,94 @@ def youtube_download():
             exc_info=error,
             error_type=type(error).__name__,
         )
-        return {'error': 'Error converting audio'}, 500
-
-    log_event(
-        "tubio",
-        "tubio.download_completed",
-        video_id=video_id,
-        crc=getattr(audio, "crc", None),
-        source="download",
-    )
-    return _library_response(f'Audio converted for: {title}')
+        return {'error': 'Could not queue download'}, 500
+
+    return {
+        'success': True,
+        'queued': True,
+        'attached': attached,
+        'message': f'Queued download for: {title}',
+    }, 202
+
+
+@tubio_api.route('/youtube_download/<video_id>/cancel', methods=['POST'])
+def cancel_youtube_download(video_id: str):
+    if not cancel_download(video_id, cur_user()):
+        return {'error': 'No pending download', 'type': 'info'}, 404
+    return {'success': True, 'message': 'Download cancelled'}
+
+
+@tubio_api.route('/cache_playlist', methods=['POST'])
+@limiter.limit(lambda: ConfigManager().tubio.bulk_cache_rate_limit)
+def cache_playlist():
+    playlist_name = request.form.get('playlist_name', '').strip()
+    user = cur_user()
+    data = DataInterface()
+    playlist = data.load_user_metadata(user.id).playlists.get(playlist_name)
+    if playlist is None or playlist.last_active is not None:
+        log_event(
+            "tubio",
+            "tubio.bulk_cache_rejected",
+            level=logging.WARNING,
+            reason="not_found",
+        )
+        return {'error': 'Playlist not found'}, 404
+
+    audios = data.get_metadata().audios
+    tracks = [audios[crc] for crc in playlist.audio_crcs if crc in audios]
+    job_id = start_bulk_cache(user, playlist_name, tracks)
+    progress = bulk_cache_progress(job_id, data)
+    progress.pop('user')
+    return {'success': True, 'job_id': job_id, **progress}, 202
+
+
+@tubio_api.route('/cache_playlist/<job_id>')
+def cache_playlist_progress(job_id: str):
+    progress = bulk_cache_progress(job_id)
+    if progress is None or progress.pop('user') != cur_user().id:
+        return {'error': 'No such caching job'}, 404
+    return {'success': True, **progress}
+
+
+@tubio_api.route('/library')
+def library():
+    return {'success': True, 'message': '', **render_library(cur_user())}
 
 
 @tubio_api.route('/download_progress/<video_id>')
 def download_progress(video_id: str):
     def generate():
-        while True:
+        config = ConfigManager().tubio
+        pubsub = get_redis().pubsub()
+        pubsub.subscribe(download_progress_channel(video_id))
+        try:
+            # Read the snapshot only once the subscription is confirmed so no
+            # update is missed between the two.
+            pubsub.get_message(timeout=config.download_progress_keepalive_s)
             progress = get_download_progress(video_id)
-            if progress is None:
-                yield f"data: {json.dumps({'status': 'not_found'})}\n\n"
-                break
-
-            yield f"data: {json.dumps({
-                'status': progress.status,
-                'percent': round(progress.percent, 1),
-                'error': progress.error,
-            })}\n\n"
-            if progress.status in ('complete', 'error'):
-                clear_download_progress(video_id)
-                break
-            time.sleep(ConfigManager().tubio.download_progress_poll_interval_s)
+            while True:
+                if progress is None:
+                    yield f"data: {json.dumps({'status': 'not_found'})}\n\n"
+                    break
+                yield f"data: {json.dumps({
+                    'status': progress.status,
+                    'percent': round(progress.percent, 1),
+                    'error': progress.error,
+                })}\n\n"
+                # The record is shared by every user attached to the download,
+                # so it is left to expire rather than cleared by the first reader.
+                if progress.status in ('complete', 'error', 'cancelled'):
+                    break
+                message = pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=config.download_progress_keepalive_s,
+                )
+                if message is None:
+                    progress = get_download_progress(video_id)
+                else:
+                    progress = DownloadProgress.from_json(video_id, message['data'])
+        finally:
+            pubsub.close()
 
     return Response(
         generate(),
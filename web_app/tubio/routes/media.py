@@ -4,24 +4,21 @@ import secrets
 
 from datetime import datetime, timezone
 from pathlib import Path
-from flask import Response, flash, redirect, render_template, request, send_file, url_for
+from flask import Response, flash, redirect, request, url_for
 
 from web_app.config import ConfigManager
-from web_app.helpers import cur_user, limiter
+from web_app.helpers import cur_user, limiter, send_data_file
 from web_app.logging_utils import log_event
 from web_app.redis_client import get_redis
 from web_app.tubio import tubio_api
 from web_app.tubio.audio_downloader import AudioDownloader
-from web_app.tubio.data_interface import AudioMetadata, DataInterface
-from web_app.tubio.routes.playlists import get_playlists_data
+from web_app.tubio.data_interface import AudioMetadata, DataInterface, UploadRejectedError
+from web_app.tubio.routes.playlists import library_update
 from web_app.tubio.routes.surprise import _surprise_is_expired
-
-
-def _library_html(data: DataInterface) -> str:
-    return render_template(
-        'playlists.html',
-        playlists=get_playlists_data(cur_user(), data=data),
-    )
+from web_app.tubio.variants import (
+    ORIGINAL_QUALITY, VARIANT_MIMETYPE, known_qualities, schedule_variant, select_quality,
+)
+from web_app.tubio.waveform import schedule_peaks
 
 
 def _redownload_audio(data: DataInterface, audio: AudioMetadata) -> None:
@@ -97,9 +94,19 @@ def upload_audio():
     ).stem
     try:
         data = DataInterface()
-        crc = data.save_audio(title, uploaded_file.read(), file_ext)
-        with data.edit_metadata() as metadata:
-            metadata.get_user(cur_user().id).add_to_playlist(crc)
+        crc = data.save_audio(title, uploaded_file.stream, file_ext)
+        with data.edit_metadata(), data.edit_user_metadata(cur_user().id) as user_metadata:
+            user_metadata.add_to_playlist(crc)
+    except UploadRejectedError as error:
+        log_event(
+            "tubio",
+            "tubio.upload_rejected",
+            level=logging.WARNING,
+            reason=str(error),
+            file_ext=file_ext,
+        )
+        flash(f'{error}.', 'error')
+        return redirect(url_for('.index'))
     except Exception as error:
         log_event(
             "tubio",
@@ -133,16 +140,62 @@ def serve_audio(crc: int):
         )
         return {'error': 'Audio not found'}, 404
 
+    requested = request.args.get('quality')
+    if requested is not None and requested not in known_qualities():
+        return {'error': f'Unknown quality: {requested}'}, 400
     if not audio.is_cached:
         _redownload_audio(data, audio)
+
+    quality = select_quality(requested, request.headers)
+    variant_path = data.get_variant_path(crc, quality) if quality else None
+    if variant_path is not None and variant_path.exists() and _starts_stream():
+        # A variant gets its own URL, so the ranges a player sends for the
+        # rest of the track never land in a different file than it started on.
+        response = redirect(url_for('.serve_audio_variant', crc=crc, quality=quality))
+        response.cache_control.no_cache = True
+    else:
+        # Range requests keep arriving while it transcodes; log the first only.
+        if quality is not None and not variant_path.exists() and schedule_variant(crc, quality):
+            log_event("tubio", "tubio.audio_variant_scheduled", crc=crc, quality=quality)
+        response = _range_response(
+            data.get_audio_path(crc),
+            etag=str(crc),
+            download_name=f"{crc}.m4a",
+        )
+    if requested is None:
+        response.vary.update(("Save-Data", "ECT"))
+    return response
+
+
+def _starts_stream() -> bool:
+    """Whether this is a player's first request for a track rather than a later range."""
+    byte_range = request.headers.get("Range", "").replace(" ", "")
+    return not byte_range or byte_range == "bytes=0-"
+
+
+@tubio_api.route('/audio/<int:crc>/variant/<quality>')
+@limiter.limit(lambda: ConfigManager().tubio.audio_serve_rate_limit)
+def serve_audio_variant(crc: int, quality: str):
+    if quality not in known_qualities() - {ORIGINAL_QUALITY}:
+        return {'error': f'Unknown quality: {quality}'}, 400
+    variant_path = DataInterface().get_variant_path(crc, quality)
+    if not variant_path.exists():
+        return {'error': 'Audio not found'}, 404
     return _range_response(
-        data.get_audio_path(crc),
-        etag=str(crc),
-        download_name=f"{crc}.m4a",
+        variant_path,
+        # Transcoded again if a collected crc is downloaded again.
+        etag=f"{crc}-{quality}-{variant_path.stat().st_mtime_ns}",
+        download_name=variant_path.name,
+        mimetype=VARIANT_MIMETYPE,
     )
 
 
-def _range_response(file_path: Path, etag: str, download_name: str) -> Response:
+def _range_response(
+    file_path: Path,
+    etag: str,
+    download_name: str,
+    mimetype: str = "audio/mp4",
+) -> Response:
     file_size = file_path.stat().st_size
     log_event(
         "tubio",
@@ -151,9 +204,9 @@ def _range_response(file_path: Path, etag: str, download_name: str) -> Response:
         bytes=file_size,
         range_requested=request.headers.get("Range") is not None,
     )
-    response = send_file(
+    response = send_data_file(
         file_path,
-        mimetype="audio/mp4",
+        mimetype=mimetype,
         as_attachment=False,
         download_name=download_name,
         conditional=True,
@@ -165,6 +218,33 @@ def _range_response(file_path: Path, etag: str, download_name: str) -> Response:
     return response
 
 
+@tubio_api.route('/audio/<int:crc>/peaks')
+@limiter.limit(lambda: ConfigManager().tubio.waveform_serve_rate_limit)
+def serve_peaks(crc: int):
+    data = DataInterface()
+    peaks_path = data.get_peaks_path(crc)
+    if not peaks_path.exists():
+        audio = data.get_metadata().audios.get(crc)
+        if audio is None or not audio.is_cached:
+            return {'error': 'Waveform not available'}, 404
+        scheduled = schedule_peaks(crc)
+        log_event("tubio", "tubio.waveform_pending", crc=crc, scheduled=scheduled)
+        response = Response(status=202)
+        response.headers['Retry-After'] = '3'
+        return response
+    response = send_data_file(
+        peaks_path,
+        mimetype='application/octet-stream',
+        as_attachment=False,
+        download_name=f"{crc}.peaks",
+        # A collected crc can be downloaded again, so the ETag follows the file.
+        etag=f"{crc}-{peaks_path.stat().st_mtime_ns}",
+    )
+    response.cache_control.max_age = ConfigManager().cache_max_age
+    response.cache_control.public = True
+    return response
+
+
 @tubio_api.route('/audio/<int:crc>/download')
 def download_audio(crc: int):
     data = DataInterface()
@@ -179,7 +259,7 @@ def download_audio(crc: int):
     safe_title = "".join(
         char for char in audio.title if char.isalnum() or char in " _-"
     ).strip() or str(crc)
-    return send_file(
+    return send_data_file(
         data.get_audio_path(crc),
         mimetype='audio/mp4',
         as_attachment=True,
@@ -212,17 +292,17 @@ def trim_audio(crc: int):
         return {'error': 'Trim values cannot be negative'}, 400
 
     data = DataInterface()
+    before = data.load_user_metadata(cur_user().id)
     try:
-        with data.edit_metadata() as metadata:
-            audio = metadata.audios.get(crc)
-            if audio is None:
-                log_event(
-                    "tubio", "tubio.trim_rejected", level=logging.WARNING,
-                    crc=crc, reason="audio_not_found",
-                )
-                return {'error': 'Audio not found'}, 404
-            user_metadata = metadata.users.get(cur_user().id)
-            if user_metadata is None or not any(
+        audio = data.get_metadata().audios.get(crc)
+        if audio is None:
+            log_event(
+                "tubio", "tubio.trim_rejected", level=logging.WARNING,
+                crc=crc, reason="audio_not_found",
+            )
+            return {'error': 'Audio not found'}, 404
+        with data.edit_user_metadata(cur_user().id) as user_metadata:
+            if not any(
                 crc in playlist.audio_crcs
                 for playlist in user_metadata.playlists.values()
             ):
@@ -249,19 +329,31 @@ def trim_audio(crc: int):
         'trim_start_s': trim_start_s,
         'trim_end_s': trim_end_s,
         'message': f'Updated playback range: {audio.title}',
-        'library_html': _library_html(data),
+        **library_update(before, data=data, updated_crcs=frozenset({crc})),
     }
 
 
 @tubio_api.route('/thumbnail/<int:crc>')
 def serve_thumbnail(crc: int):
-    thumbnail_path = DataInterface().get_thumbnail_path(crc)
-    if not thumbnail_path.exists():
+    config = ConfigManager()
+    data = DataInterface()
+    size = request.args.get('size', config.tubio.thumbnail_default_size)
+    if size not in dict(config.tubio.thumbnail_sizes):
         return '', 404
-    response = send_file(thumbnail_path, mimetype='image/jpeg')
-    response.cache_control.max_age = ConfigManager().cache_max_age
+    thumbnail_path = data.get_thumbnail_path(crc, size)
+    if thumbnail_path.exists():
+        # A crc's rendition never changes, so browsers need not revalidate.
+        response = send_data_file(thumbnail_path, mimetype='image/webp', etag=f"{crc}-{size}")
+        response.cache_control.max_age = config.tubio.thumbnail_cache_max_age_s
+        response.cache_control.immutable = True
+    else:
+        # Not yet converted by the thumbnail backfill.
+        legacy_path = data.get_legacy_thumbnail_path(crc)
+        if not legacy_path.exists():
+            return '', 404
+        response = send_data_file(legacy_path, mimetype='image/jpeg', etag=str(crc))
+        response.cache_control.max_age = config.cache_max_age
     response.cache_control.public = True
-    response.set_etag(str(crc))
     return response
 
 
@@ -296,10 +388,13 @@ def resync_audio(crc: int):
         )
         return {'error': 'Track was not converted from YouTube'}, 400
 
+    before = data.load_user_metadata(cur_user().id)
     try:
         file_path = data.get_audio_path(crc)
         if file_path.exists():
             file_path.unlink()
+        for derived_path in data.get_derived_paths(crc):
+            derived_path.unlink(missing_ok=True)
         audio.is_cached = False
         data.upsert_audio_metadata(audio)
         AudioDownloader.download_youtube_audio(
@@ -323,22 +418,17 @@ def resync_audio(crc: int):
     return {
         'success': True,
         'message': f'Resynced: {audio.title}',
-        'library_html': _library_html(data),
+        **library_update(before, data=data, updated_crcs=frozenset({crc})),
     }
 
 
 @tubio_api.route('/delete_audio/<int:crc>', methods=['POST'])
 def delete_audio(crc: int):
     data = DataInterface()
+    before = data.load_user_metadata(cur_user().id)
     try:
-        with data.edit_metadata() as metadata:
-            user_metadata = metadata.users.get(cur_user().id)
-            regular_playlists = (
-                user_metadata.get_playlists()
-                if user_metadata is not None
-                else []
-            )
-            if not any(crc in playlist.audio_crcs for playlist in regular_playlists):
+        with data.edit_user_metadata(cur_user().id) as user_metadata:
+            if not any(crc in playlist.audio_crcs for playlist in user_metadata.get_playlists()):
                 log_event(
                     "tubio",
                     "tubio.audio_delete_rejected",
@@ -350,13 +440,6 @@ def delete_audio(crc: int):
 
             user_metadata.remove_from_regular_playlists(crc)
             user_metadata.playback_trims.pop(crc, None)
-            resource_retained = any(
-                crc in playlist.audio_crcs
-                for other_user in metadata.users.values()
-                for playlist in other_user.playlists.values()
-            )
-        if not resource_retained:
-            data.cleanup_unused_resources()
     except Exception as error:
         log_event(
             "tubio",
@@ -372,34 +455,26 @@ def delete_audio(crc: int):
         "tubio",
         "tubio.audio_deleted",
         crc=crc,
-        resource_retained=resource_retained,
     )
-    return {'success': True, 'library_html': _library_html(data)}
+    return {'success': True, **library_update(before, data=data)}
 
 
 @tubio_api.route("/audio/<int:crc>/cache", methods=["POST"])
 @limiter.limit(lambda: ConfigManager().tubio.surprise_media_rate_limit)
 def cache_audio(crc: int):
     data = DataInterface()
-    with data.edit_metadata() as metadata:
-        user_metadata = metadata.users.get(cur_user().id)
-        if user_metadata is None:
+    with data.edit_user_metadata(cur_user().id) as user_metadata:
+        surprise = user_metadata.get_surprise_playlist()
+        if surprise is not None and _surprise_is_expired(surprise):
             surprise = None
-            can_access = False
-        else:
-            surprise = user_metadata.get_surprise_playlist()
-            if surprise is not None and _surprise_is_expired(surprise):
-                surprise = None
-            can_access = any(
-                crc in playlist.audio_crcs
-                for playlist in user_metadata.get_playlists()
-            )
+        can_access = any(
+            crc in playlist.audio_crcs
+            for playlist in user_metadata.get_playlists()
+        )
         if surprise is not None and crc in surprise.audio_crcs:
             surprise.last_active = datetime.now(timezone.utc)
             can_access = True
-        audio = metadata.audios.get(crc)
-        if audio is not None:
-            audio = audio.model_copy(deep=True)
+    audio = data.get_metadata().audios.get(crc)
 
     if not can_access:
         log_event(
@@ -1,12 +1,20 @@
 import logging
 
-from flask import flash, redirect, request, url_for
+from flask import flash, get_template_attribute, redirect, render_template, request, url_for
 
 from web_app.config import ConfigManager
 from web_app.helpers import cur_user, limiter
 from web_app.logging_utils import log_event
 from web_app.tubio import tubio_api
-from web_app.tubio.data_interface import AudioMetadata, DataInterface, UserMetadata
+from web_app.tubio.data_interface import (
+    AudioMetadata,
+    DataInterface,
+    Metadata,
+    Playlist,
+    UserMetadata,
+    catalog_index,
+    user_index,
+)
 from web_app.users import User
 
 
@@ -14,51 +22,37 @@ def get_cached_yt_vid_ids(
     user: User | None = None,
     *,
     data: DataInterface | None = None,
-) -> set[str]:
-    metadata = (data or DataInterface()).get_metadata()
+) -> frozenset[str]:
+    data = data or DataInterface()
+    metadata = data.get_metadata()
     if user is None:
-        return {
-            audio.yt_video_id
-            for audio in metadata.audios.values()
-            if audio.yt_video_id
-        }
-
-    user_metadata = metadata.users.get(user.id)
-    if user_metadata is None:
-        return set()
-
-    owned_crcs = {
-        crc
-        for playlist in user_metadata.get_playlists()
-        for crc in playlist.audio_crcs
-    }
-    return {
-        metadata.audios[crc].yt_video_id
-        for crc in owned_crcs
-        if crc in metadata.audios and metadata.audios[crc].yt_video_id
-    }
+        return frozenset(catalog_index(metadata, data.app_metadata_file).crc_by_video_id)
+    user_metadata = data.load_user_metadata(user.id)
+    return user_index(user_metadata, metadata, data.app_metadata_file).owned_video_ids
 
 
 def _track_data(
-    data: DataInterface,
     audio: AudioMetadata,
     user_metadata: UserMetadata,
+    thumbnail_crcs: frozenset[int],
     *,
     is_favourite: bool = False,
 ) -> dict:
     playback_trim = user_metadata.get_playback_trim(audio.crc)
-    if data.has_thumbnail(audio.crc):
+    if audio.crc in thumbnail_crcs:
         thumbnail_url = url_for(".serve_thumbnail", crc=audio.crc)
+        thumbnail_small_url = url_for(".serve_thumbnail", crc=audio.crc, size="small")
     elif audio.yt_video_id:
-        thumbnail_url = ConfigManager().tubio.youtube_thumbnail_url_template.format(
+        thumbnail_url = thumbnail_small_url = ConfigManager().tubio.youtube_thumbnail_url_template.format(
             video_id=audio.yt_video_id
         )
     else:
-        thumbnail_url = ""
+        thumbnail_url = thumbnail_small_url = ""
     return {
         "crc": audio.crc,
         "title": audio.title,
         "thumbnail_url": thumbnail_url,
+        "thumbnail_small_url": thumbnail_small_url,
         "source_url": audio.source_url,
         "video_id": audio.yt_video_id,
         "trim_start_s": playback_trim.start_s,
@@ -78,26 +72,113 @@ def add_track_occurrences(tracks: list[dict]) -> list[dict]:
     return tracks
 
 
+def _playlist_tracks(
+    playlist: Playlist,
+    metadata: Metadata,
+    user_metadata: UserMetadata,
+    thumbnail_crcs: frozenset[int],
+) -> list[dict]:
+    return add_track_occurrences([
+        _track_data(metadata.audios[crc], user_metadata, thumbnail_crcs)
+        for crc in reversed(playlist.audio_crcs)
+        if crc in metadata.audios
+    ])
+
+
 def get_playlists_data(
     user: User,
     *,
     data: DataInterface | None = None,
 ) -> list[tuple[str, list[dict]]]:
     data = data or DataInterface()
+    return _playlists_data(data.load_user_metadata(user.id), data)
+
+
+def _playlists_data(user_metadata: UserMetadata, data: DataInterface) -> list[tuple[str, list[dict]]]:
     metadata = data.get_metadata()
-    user_metadata = metadata.users.get(user.id)
-    if user_metadata is None:
-        return []
-
-    playlists = []
-    for playlist in user_metadata.get_playlists():
-        tracks = [
-            _track_data(data, metadata.audios[crc], user_metadata)
-            for crc in reversed(playlist.audio_crcs)
-            if crc in metadata.audios
+    thumbnail_crcs = data.thumbnail_crcs()
+    return [
+        (playlist.name, _playlist_tracks(playlist, metadata, user_metadata, thumbnail_crcs))
+        for playlist in user_metadata.get_playlists()
+    ]
+
+
+def render_library(user: User, *, data: DataInterface | None = None) -> dict:
+    """The whole library fragment, stamped with the user's document version."""
+    data = data or DataInterface()
+    return _render_library(data.load_user_metadata(user.id), data)
+
+
+def _render_library(user_metadata: UserMetadata, data: DataInterface) -> dict:
+    return {
+        'library_html': render_template(
+            'playlists.html',
+            playlists=_playlists_data(user_metadata, data),
+            library_version=user_metadata.version,
+        ),
+        'library_version': user_metadata.version,
+    }
+
+
+def library_update(
+    before: UserMetadata,
+    *,
+    data: DataInterface | None = None,
+    updated_crcs: frozenset[int] = frozenset(),
+) -> dict:
+    """What a mutation response sends to bring the rendered library up to date.
+
+    `before` is the user's document as loaded ahead of the mutation. When the
+    set of regular playlists is unchanged, only the playlists whose tracks
+    changed are sent: their new track order plus markup for tracks that were
+    added or are listed in `updated_crcs`, applied by the client to a library
+    rendered at `before.version`. A playlist that becomes or stops being empty
+    is re-sent whole; any other structural change falls back to render_library.
+    """
+    data = data or DataInterface()
+    after = data.load_user_metadata(before.user_id)
+    before_playlists = {playlist.name: playlist for playlist in before.get_playlists()}
+    after_playlists = after.get_playlists()
+    if list(before_playlists) != [playlist.name for playlist in after_playlists]:
+        return _render_library(after, data)
+
+    metadata = data.get_metadata()
+    thumbnail_crcs = data.thumbnail_crcs()
+    changed = {}
+    for playlist in after_playlists:
+        # Not filtered by the catalog: a removal may already have collected it.
+        old_keys = [
+            f"{track['crc']}:{track['occurrence']}"
+            for track in add_track_occurrences([
+                {'crc': crc} for crc in reversed(before_playlists[playlist.name].audio_crcs)
+            ])
         ]
-        playlists.append((playlist.name, add_track_occurrences(tracks)))
-    return playlists
+        tracks = _playlist_tracks(playlist, metadata, after, thumbnail_crcs)
+        keys = [f"{track['crc']}:{track['occurrence']}" for track in tracks]
+        if keys == old_keys and not updated_crcs.intersection(
+            track['crc'] for track in tracks
+        ):
+            continue
+        if not keys or not old_keys:
+            panel = get_template_attribute('playlist_components.html', 'playlist_panel')
+            changed[playlist.name] = {'panel_html': str(panel(playlist.name, tracks))}
+            continue
+        render_track = get_template_attribute('playlist_components.html', 'playlist_track')
+        changed[playlist.name] = {
+            'order': keys,
+            'tracks': {
+                key: str(render_track(track, playlist.name))
+                for key, track in zip(keys, tracks)
+                if key not in old_keys or track['crc'] in updated_crcs
+            },
+        }
+    return {
+        'library': {
+            'base_version': before.version,
+            'version': after.version,
+            'playlists': changed,
+        },
+    }
 
 
 def _parse_track_crcs(raw_crcs: str) -> list[int]:
@@ -129,8 +210,7 @@ def create_playlist():
         return redirect(url_for('.index'))
 
     try:
-        with DataInterface().edit_metadata() as metadata:
-            user_metadata = metadata.get_user(cur_user().id)
+        with DataInterface().edit_user_metadata(cur_user().id) as user_metadata:
             if playlist_name in user_metadata.playlists:
                 log_event(
                     "tubio",
@@ -196,19 +276,7 @@ def move_tracks_to_playlist():
         return redirect(url_for('.index'))
 
     try:
-        with DataInterface().edit_metadata() as metadata:
-            user_metadata = metadata.users.get(cur_user().id)
-            if user_metadata is None:
-                log_event(
-                    "tubio",
-                    "tubio.tracks_move_rejected",
-                    level=logging.WARNING,
-                    reason="not_owned",
-                    tracks=len(song_crcs),
-                    rejected=len(song_crcs),
-                )
-                flash('One or more songs are not in your playlists.', 'error')
-                return redirect(url_for('.index'))
+        with DataInterface().edit_user_metadata(cur_user().id) as user_metadata:
             target = user_metadata.playlists.get(target_playlist)
             if target is not None and target.last_active is not None:
                 log_event(
@@ -277,13 +345,8 @@ def delete_playlist():
         return redirect(url_for('.index'))
 
     try:
-        with DataInterface().edit_metadata() as metadata:
-            user_metadata = metadata.users.get(cur_user().id)
-            playlist = (
-                user_metadata.playlists.get(playlist_name)
-                if user_metadata is not None
-                else None
-            )
+        with DataInterface().edit_user_metadata(cur_user().id) as user_metadata:
+            playlist = user_metadata.playlists.get(playlist_name)
             if playlist is None or playlist.last_active is not None:
                 log_event(
                     "tubio",
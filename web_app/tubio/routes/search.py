@@ -1,12 +1,13 @@
 import logging
 
-from flask import redirect, render_template, request, url_for
+from flask import make_response, redirect, render_template, request, url_for
 
 from web_app.config import ConfigManager
 from web_app.helpers import cur_user, limiter
 from web_app.logging_utils import log_event
 from web_app.tubio import tubio_api
 from web_app.tubio.audio_downloader import AudioDownloader, VideoTooLongError
+from web_app.tubio.data_interface import DataInterface, library_titles, normalize_search_text
 from web_app.tubio.routes.playlists import (
     get_cached_yt_vid_ids,
     get_playlists_data,
@@ -15,7 +16,16 @@ from web_app.tubio.routes.playlists import (
 
 @tubio_api.route('/')
 def index():
-    return render_template("index.html", playlists=get_playlists_data(cur_user()))
+    data = DataInterface()
+    library_version = data.load_user_metadata(cur_user().id).version
+    response = make_response(render_template(
+        "index.html",
+        playlists=get_playlists_data(cur_user(), data=data),
+        library_version=library_version,
+    ))
+    # Ask Chromium to send connection hints on the audio requests that follow.
+    response.headers['Accept-CH'] = ConfigManager().tubio.audio_variant_client_hints
+    return response
 
 
 @tubio_api.route('/search', methods=['GET', 'POST'])
@@ -92,11 +102,27 @@ def search():
 
 @tubio_api.route('/suggest', methods=['POST'])
 def suggest():
+    config = ConfigManager().tubio
     query = request.form.get('youtube_query', '').strip()
-    if len(query) < ConfigManager().tubio.autocomplete_min_query_len:
+    if len(query) < config.autocomplete_min_query_len:
         return {'suggestions': []}
-    suggestions = AudioDownloader.suggest_queries(query)
-    log_event("tubio", "tubio.suggestions_completed", suggestions=len(suggestions))
+    data = DataInterface()
+    metadata = data.get_metadata()
+    titles = library_titles(data.load_user_metadata(cur_user().id), metadata)
+    suggestions = titles.lookup(query, config.autocomplete_library_max_suggestions)
+    library_count = len(suggestions)
+    # Library matches need no outbound call and still answer when it fails.
+    if library_count < config.autocomplete_max_suggestions:
+        seen = {normalize_search_text(suggestion) for suggestion in suggestions}
+        for suggestion in AudioDownloader.suggest_queries(query):
+            if normalize_search_text(suggestion) not in seen:
+                seen.add(normalize_search_text(suggestion))
+                suggestions.append(suggestion)
+        suggestions = suggestions[:config.autocomplete_max_suggestions]
+    log_event(
+        "tubio", "tubio.suggestions_completed",
+        suggestions=len(suggestions), library=library_count,
+    )
     return {'suggestions': suggestions}
 
 
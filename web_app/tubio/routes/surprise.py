@@ -1,13 +1,19 @@
 import binascii
+import hashlib
+import json
 import logging
 import random
+import threading
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from flask import render_template, request
 
 from web_app.config import ConfigManager
 from web_app.helpers import cur_user, limiter
 from web_app.logging_utils import log_event
+from web_app.redis_client import get_redis
 from web_app.tubio import tubio_api
 from web_app.tubio.audio_downloader import AudioDownloader
 from web_app.tubio.data_interface import (
@@ -15,13 +21,16 @@ from web_app.tubio.data_interface import (
     DataInterface,
     Metadata,
     Playlist,
+    user_index,
 )
 from web_app.tubio.routes.playlists import (
     _track_data,
     add_track_occurrences,
     get_cached_yt_vid_ids,
-    get_playlists_data,
+    library_update,
+    render_library,
 )
+from web_app.users import User
 
 
 def reserve_audio_metadata(metadata: Metadata, candidate: dict) -> int:
@@ -85,10 +94,7 @@ def _active_surprise(
 ) -> Playlist | None:
     data = data or DataInterface()
     now = datetime.now(timezone.utc)
-    with data.edit_metadata() as metadata:
-        user_metadata = metadata.users.get(cur_user().id)
-        if user_metadata is None:
-            return None
+    with data.edit_user_metadata(cur_user().id) as user_metadata:
         playlist = user_metadata.get_surprise_playlist()
         if playlist is None or _surprise_is_expired(playlist, now):
             return None
@@ -104,25 +110,23 @@ def _surprise_payload(
 ) -> dict:
     data = data or DataInterface()
     metadata = data.get_metadata()
-    user_metadata = metadata.users.get(cur_user().id)
-    if user_metadata is None:
-        tracks = []
-    else:
-        favourites = set(
-            user_metadata.get_playlist(
-                ConfigManager().tubio.default_playlist_name
-            ).audio_crcs
+    user_metadata = data.load_user_metadata(cur_user().id)
+    thumbnail_crcs = data.thumbnail_crcs()
+    favourites = set(
+        user_metadata.get_playlist(
+            ConfigManager().tubio.default_playlist_name
+        ).audio_crcs
+    )
+    tracks = add_track_occurrences([
+        _track_data(
+            metadata.audios[crc],
+            user_metadata,
+            thumbnail_crcs,
+            is_favourite=crc in favourites,
         )
-        tracks = add_track_occurrences([
-            _track_data(
-                data,
-                metadata.audios[crc],
-                user_metadata,
-                is_favourite=crc in favourites,
-            )
-            for crc in playlist.audio_crcs
-            if crc in metadata.audios
-        ])
+        for crc in playlist.audio_crcs
+        if crc in metadata.audios
+    ])
 
     missing_count = len(playlist.audio_crcs) - len(tracks)
     log_event(
@@ -154,20 +158,18 @@ def _resolve_surprise_seed(
     data: DataInterface,
 ) -> tuple[str | None, str | None, int | None]:
     metadata = data.get_metadata()
-    user_metadata = metadata.users.get(cur_user().id)
     audio = metadata.audios.get(seed_crc)
-    if user_metadata is None or audio is None:
+    if audio is None:
         return None, "Track not found", 404
 
-    accessible = any(
-        seed_crc in playlist.audio_crcs
-        for playlist in user_metadata.get_playlists()
-    )
+    user_metadata = data.load_user_metadata(cur_user().id)
+    index = user_index(user_metadata, metadata, data.app_metadata_file)
+    accessible = seed_crc in index.owned_crcs
     surprise = user_metadata.get_surprise_playlist()
     if (
         surprise is not None
         and not _surprise_is_expired(surprise)
-        and seed_crc in surprise.audio_crcs
+        and seed_crc in index.playlist_crcs[ConfigManager().tubio.surprise_playlist_storage_key]
     ):
         accessible = True
     if not accessible:
@@ -206,9 +208,10 @@ def _pick_surprise_candidates(
     *,
     data: DataInterface,
     seed_video_id: str | None = None,
+    user: User | None = None,
 ) -> list[dict]:
     cfg = ConfigManager().tubio
-    owned_ids = get_cached_yt_vid_ids(cur_user(), data=data)
+    owned_ids = get_cached_yt_vid_ids(user or cur_user(), data=data)
     if not owned_ids and seed_video_id is None:
         log_event("tubio", "tubio.surprise_candidates_empty_library")
         return []
@@ -224,7 +227,7 @@ def _pick_surprise_candidates(
         for crc in reversed(playlist.audio_crcs)
         if crc in metadata.audios and metadata.audios[crc].yt_video_id
     ), "")
-    skip = owned_ids | seen_video_ids
+    skip = seen_video_ids | owned_ids
     if seed_video_id is not None:
         seeds = [seed_video_id]
         skip.add(seed_video_id)
@@ -243,29 +246,45 @@ def _pick_surprise_candidates(
         seen=len(seen_video_ids),
         seeds=len(seeds),
     )
-    for seed in seeds:
-        candidates = AudioDownloader.get_mix_related(seed)
-        log_event(
-            "tubio",
-            "tubio.surprise_mix_loaded",
-            seed=seed,
-            candidates=len(candidates),
-        )
-        random.shuffle(candidates)
-        for candidate in candidates:
-            if candidate["video_id"] in skip:
-                continue
-            if timedelta(seconds=candidate.get("duration_s", 0)) > cfg.max_video_length:
-                continue
-            selected.append(candidate)
-            skip.add(candidate["video_id"])
-            if len(selected) >= count:
-                log_event(
-                    "tubio",
-                    "tubio.surprise_candidate_selection_completed",
-                    selected=len(selected),
-                )
-                return selected
+    # Mix lookups run a bounded window ahead of the seed being consumed, so
+    # seed order (last played first) is kept while fetches overlap. The window
+    # matches the worker count, so submitted lookups are normally already
+    # running; once enough candidates are found they finish in the background
+    # and still warm the Mix cache.
+    executor = ThreadPoolExecutor(max_workers=cfg.surprise_mix_fetch_workers)
+    pending = deque()
+    next_seed = 0
+    try:
+        while pending or next_seed < len(seeds):
+            while next_seed < len(seeds) and len(pending) < cfg.surprise_mix_fetch_workers:
+                seed = seeds[next_seed]
+                pending.append((seed, executor.submit(AudioDownloader.get_mix_related, seed)))
+                next_seed += 1
+            seed, future = pending.popleft()
+            candidates = list(future.result())
+            log_event(
+                "tubio",
+                "tubio.surprise_mix_loaded",
+                seed=seed,
+                candidates=len(candidates),
+            )
+            random.shuffle(candidates)
+            for candidate in candidates:
+                if candidate["video_id"] in skip:
+                    continue
+                if timedelta(seconds=candidate.get("duration_s", 0)) > cfg.max_video_length:
+                    continue
+                selected.append(candidate)
+                skip.add(candidate["video_id"])
+                if len(selected) >= count:
+                    log_event(
+                        "tubio",
+                        "tubio.surprise_candidate_selection_completed",
+                        selected=len(selected),
+                    )
+                    return selected
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
     log_event(
         "tubio",
         "tubio.surprise_candidate_selection_exhausted",
@@ -275,6 +294,93 @@ def _pick_surprise_candidates(
     return selected
 
 
+def _surprise_fingerprint(playlist: Playlist, owned_ids: set[str]) -> str:
+    """Identifies the library and playlist state a prefetched batch was picked for."""
+    return hashlib.sha256(
+        json.dumps([sorted(owned_ids), playlist.audio_crcs]).encode()
+    ).hexdigest()
+
+
+def _prefetch_surprise_batch(user: User, playlist: Playlist, data: DataInterface) -> None:
+    cfg = ConfigManager().tubio
+    try:
+        candidates = _pick_surprise_candidates(
+            playlist, cfg.surprise_grow_batch_size, data=data, user=user,
+        )
+        if not candidates:
+            return
+        # Only publish if nothing changed while the Mixes were fetched, so a
+        # slow prefetch cannot overwrite a newer one.
+        current = data.load_user_metadata(user.id).get_surprise_playlist()
+        if current is None or current.audio_crcs != playlist.audio_crcs:
+            return
+        get_redis().set(
+            cfg.surprise_prefetch_redis_prefix + user.id,
+            json.dumps({
+                "fingerprint": _surprise_fingerprint(
+                    playlist, get_cached_yt_vid_ids(user, data=data),
+                ),
+                "candidates": candidates,
+            }),
+            ex=cfg.surprise_playlist_inactivity_ttl_s,
+        )
+        log_event(
+            "tubio",
+            "tubio.surprise_prefetch_completed",
+            user=user,
+            candidates=len(candidates),
+        )
+    except Exception as error:
+        log_event(
+            "tubio",
+            "tubio.surprise_prefetch_failed",
+            level=logging.WARNING,
+            user=user,
+            exc_info=error,
+            error_type=type(error).__name__,
+        )
+
+
+def _schedule_surprise_prefetch(
+    playlist: Playlist,
+    data: DataInterface,
+) -> threading.Thread | None:
+    if not ConfigManager().tubio.surprise_prefetch_enabled:
+        return None
+    thread = threading.Thread(
+        target=_prefetch_surprise_batch,
+        args=(cur_user()._get_current_object(), playlist.model_copy(deep=True), data),
+        name="nabicat-surprise-prefetch",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def _take_prefetched_candidates(
+    playlist: Playlist,
+    count: int,
+    *,
+    data: DataInterface,
+) -> list[dict] | None:
+    """Claim the prefetched batch if it was picked for the current state.
+
+    Any library or playlist change since the prefetch alters the fingerprint,
+    which invalidates the batch.
+    """
+    user = cur_user()
+    raw = get_redis().getdel(ConfigManager().tubio.surprise_prefetch_redis_prefix + user.id)
+    if raw is None:
+        return None
+    prefetched = json.loads(raw)
+    fingerprint = _surprise_fingerprint(playlist, get_cached_yt_vid_ids(user, data=data))
+    if prefetched["fingerprint"] != fingerprint or len(prefetched["candidates"]) < count:
+        log_event("tubio", "tubio.surprise_prefetch_discarded", reason="stale")
+        return None
+    log_event("tubio", "tubio.surprise_prefetch_used", candidates=count)
+    return prefetched["candidates"][:count]
+
+
 def _grow_surprise(
     playlist: Playlist,
     count: int | None = None,
@@ -289,7 +395,9 @@ def _grow_surprise(
         requested=count,
         existing=len(playlist.audio_crcs),
     )
-    candidates = _pick_surprise_candidates(playlist, count, data=data)
+    candidates = _take_prefetched_candidates(playlist, count, data=data)
+    if candidates is None:
+        candidates = _pick_surprise_candidates(playlist, count, data=data)
     if not candidates:
         empty_reason = (
             "no_library"
@@ -304,8 +412,11 @@ def _grow_surprise(
         return {"exhausted": True, "empty_reason": empty_reason}, 200
 
     try:
-        with data.edit_metadata() as metadata:
-            current = metadata.get_user(cur_user().id).get_surprise_playlist()
+        with (
+            data.edit_metadata() as metadata,
+            data.edit_user_metadata(cur_user().id) as user_metadata,
+        ):
+            current = user_metadata.get_surprise_playlist()
             if current is None or _surprise_is_expired(current):
                 log_event(
                     "tubio",
@@ -336,6 +447,7 @@ def _grow_surprise(
         added=len(candidates),
         total=len(playlist.audio_crcs),
     )
+    _schedule_surprise_prefetch(playlist, data)
     return {"playlist": _surprise_payload(playlist, data=data)}, 200
 
 
@@ -394,8 +506,8 @@ def create_surprise_playlist():
         seed_video_id=seed_video_id,
     )
     try:
-        with data.edit_metadata() as metadata:
-            existing = metadata.get_user(cur_user().id).get_surprise_playlist()
+        with data.edit_user_metadata(cur_user().id) as user_metadata:
+            existing = user_metadata.get_surprise_playlist()
             if existing is not None and not _surprise_is_expired(existing):
                 existing.last_active = datetime.now(timezone.utc)
 
@@ -420,19 +532,23 @@ def create_surprise_playlist():
             )
             return {"exhausted": True, "empty_reason": empty_reason}, 200
 
-        with data.edit_metadata() as metadata:
+        with (
+            data.edit_metadata() as metadata,
+            data.edit_user_metadata(cur_user().id) as user_metadata,
+        ):
             playlist.last_active = datetime.now(timezone.utc)
             for candidate in candidates:
                 crc = reserve_audio_metadata(metadata, candidate)
                 if crc not in playlist.audio_crcs:
                     playlist.audio_crcs.append(crc)
-            metadata.get_user(cur_user().id).set_surprise_playlist(playlist)
+            user_metadata.set_surprise_playlist(playlist)
         playlist = playlist.model_copy(deep=True)
         log_event(
             "tubio",
             "tubio.surprise_created",
             tracks=len(playlist.audio_crcs),
         )
+        _schedule_surprise_prefetch(playlist, data)
         return {"playlist": _surprise_payload(playlist, data=data)}, 200
     except Exception as error:
         log_event(
@@ -476,13 +592,10 @@ def grow_surprise_playlist():
 @limiter.limit(lambda: ConfigManager().tubio.surprise_media_rate_limit)
 def favourite_surprise_track(crc: int):
     data = DataInterface()
-    with data.edit_metadata() as metadata:
-        user_metadata = metadata.users.get(cur_user().id)
-        playlist = (
-            user_metadata.get_surprise_playlist()
-            if user_metadata is not None
-            else None
-        )
+    audios = data.get_metadata().audios
+    before = data.load_user_metadata(cur_user().id)
+    with data.edit_user_metadata(cur_user().id) as user_metadata:
+        playlist = user_metadata.get_surprise_playlist()
         if playlist is None or _surprise_is_expired(playlist):
             log_event(
                 "tubio",
@@ -492,7 +605,7 @@ def favourite_surprise_track(crc: int):
                 reason="playlist_not_found",
             )
             return {"error": "Surprise playlist not found"}, 404
-        if crc not in playlist.audio_crcs or crc not in metadata.audios:
+        if crc not in playlist.audio_crcs or crc not in audios:
             log_event(
                 "tubio",
                 "tubio.surprise_favourite_rejected",
@@ -513,10 +626,7 @@ def favourite_surprise_track(crc: int):
         "success": True,
         "crc": crc,
         "playlist": _surprise_payload(playlist, data=data),
-        "library_html": render_template(
-            "playlists.html",
-            playlists=get_playlists_data(cur_user(), data=data),
-        ),
+        **library_update(before, data=data),
     }
 
 
@@ -545,8 +655,7 @@ def save_surprise_playlist():
         return {"error": "Playlist name cannot be empty"}, 400
 
     try:
-        with data.edit_metadata() as metadata:
-            user_metadata = metadata.get_user(cur_user().id)
+        with data.edit_user_metadata(cur_user().id) as user_metadata:
             if playlist_name in user_metadata.playlists:
                 log_event(
                     "tubio",
@@ -586,8 +695,5 @@ def save_surprise_playlist():
         "playlist_name": playlist_name,
         "saved_count": saved_count,
         "skipped": [],
-        "library_html": render_template(
-            "playlists.html",
-            playlists=get_playlists_data(cur_user(), data=data),
-        ),
+        **render_library(cur_user(), data=data),
     }
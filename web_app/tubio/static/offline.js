@@ -0,0 +1,97 @@
+(() => {
+    'use strict';
+
+    // Opt-in offline mode. The service worker owns the offline cache; this
+    // page tells it which playlists are pinned and what they contain.
+    const Tubio = window.Tubio = window.Tubio || {};
+    let status = null;
+    let syncedVersion = null;
+    let syncing = null;
+
+    function available() {
+        return Boolean(window.cacheManager?.isAvailable());
+    }
+
+    function libraryVersion() {
+        return document.querySelector('.tubio-layout[data-library-version]')
+            ?.dataset.libraryVersion || null;
+    }
+
+    function playlistCrcs() {
+        const playlists = {};
+        document.querySelectorAll(
+            '.playlist-panel[data-playlist-kind="regular"]'
+        ).forEach(panel => {
+            playlists[panel.dataset.playlistName] = Array.from(new Set(Array.from(
+                panel.querySelectorAll('.playlist-track[data-audio-crc]'),
+                item => Number(item.dataset.audioCrc),
+            )));
+        });
+        return playlists;
+    }
+
+    async function sync(change = {}) {
+        const settings = document.getElementById('playlists')?.dataset || {};
+        const version = libraryVersion();
+        status = await window.cacheManager.sendMessage({
+            action: 'tubioOfflineSync',
+            owner: settings.offlineOwner,
+            budget: Number(settings.offlineBudgetBytes) || 0,
+            libraryVersion: version,
+            playlists: playlistCrcs(),
+            ...change,
+        }, new MessageChannel());
+        syncedVersion = version;
+        render(document);
+        return status;
+    }
+
+    function render(root) {
+        const size = window.cacheManager?.constructor.formatSize || (bytes => `${bytes} B`);
+        root.querySelectorAll('[data-tubio-action="pin-offline"]').forEach(button => {
+            const name = button.closest('.playlist-panel')?.dataset.playlistName;
+            const pinned = Boolean(status?.pinned.includes(name));
+            button.hidden = !status;
+            button.classList.toggle('active', pinned);
+            button.setAttribute('aria-pressed', String(pinned));
+            button.title = pinned
+                ? `Kept offline (${size(status.usage)} of ${size(status.budget)} used)`
+                : 'Keep available offline';
+        });
+    }
+
+    // Revalidates the pinned track lists whenever the rendered library
+    // version moves on.
+    function refresh(root = document) {
+        render(root);
+        if (!available() || syncing || libraryVersion() === syncedVersion) return;
+        syncing = sync()
+            .catch(error => console.warn('[Tubio] Offline sync failed:', error))
+            .finally(() => { syncing = null; });
+    }
+
+    async function togglePin(button) {
+        const playlist = button.closest('.playlist-panel')?.dataset.playlistName;
+        if (!playlist || !available()) return;
+        const pin = !status?.pinned.includes(playlist);
+        button.disabled = true;
+        try {
+            await syncing;
+            await sync({ playlist, pin });
+            Tubio.ui?.notify(
+                pin
+                    ? `"${playlist}" will be kept available offline`
+                    : `"${playlist}" is no longer kept offline`,
+                'success',
+            );
+        } catch (error) {
+            Tubio.ui?.notify(error.message, 'error');
+        } finally {
+            button.disabled = false;
+        }
+    }
+
+    window.addEventListener('cacheManagerReady', () => refresh());
+
+    Tubio.offline = { refresh, togglePin };
+})();
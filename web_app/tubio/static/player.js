@@ -911,7 +911,7 @@
                 'favourite',
             );
             renderSurprise();
-            if (payload.library_html) ui().replaceLibrary?.(payload.library_html);
+            await ui().applyLibrary?.(payload);
             notify('Added to Favourites', 'success');
             return true;
         } catch (error) {
@@ -932,7 +932,7 @@
             exitSurpriseMode();
             playerState.surprise.payload = null;
             renderSurprise();
-            if (payload.library_html) ui().replaceLibrary?.(payload.library_html);
+            await ui().applyLibrary?.(payload);
             ui().switchTab?.('playlists');
             ui().selectPlaylist?.(
                 payload.playlist_name.replace(/ /g, '-').replace(/'/g, '')
@@ -1288,8 +1288,8 @@
             navigator.mediaSession.metadata = new MediaMetadata({
                 title: item.dataset.title || 'Unknown Track',
                 album: item.dataset.playlist || '',
-                artwork: item.dataset.thumbnailUrl
-                    ? [{ src: item.dataset.thumbnailUrl, sizes: '512x512', type: 'image/jpeg' }]
+                artwork: item.dataset.artworkUrl
+                    ? [{ src: item.dataset.artworkUrl }]
                     : [],
             });
         } catch (error) {
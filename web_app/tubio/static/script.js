@@ -6,6 +6,7 @@
     const player = () => Tubio.player;
     let suggestionSequence = 0;
     let suggestionTimer = null;
+    const waveformState = { crc: null, peaks: null };
 
     function notify(message, type = 'info') {
         const notification = document.createElement('div');
@@ -45,6 +46,7 @@
                 if (image && !image.src) image.src = image.dataset.src;
             });
         });
+        Tubio.offline?.refresh(root);
     }
 
     function switchTab(tabName, { initializeDiscover = true } = {}) {
@@ -187,6 +189,78 @@
         player()?.reconcileDom();
     }
 
+    async function refreshLibrary() {
+        const payload = await api().get('/tubio/library');
+        replaceLibrary(payload.library_html);
+    }
+
+    function parseFragment(html) {
+        const template = document.createElement('template');
+        template.innerHTML = html.trim();
+        return template.content.firstElementChild;
+    }
+
+    function patchPlaylist(name, change) {
+        const panel = Array.from(document.querySelectorAll(
+            '.playlist-panel[data-playlist-kind="regular"]'
+        )).find(candidate => candidate.dataset.playlistName === name);
+        if (!panel) return false;
+        let count;
+        if (typeof change.panel_html === 'string') {
+            const replacement = parseFragment(change.panel_html);
+            replacement.classList.toggle('active', panel.classList.contains('active'));
+            panel.replaceWith(replacement);
+            count = replacement.querySelectorAll('.playlist-track').length;
+        } else {
+            const accordion = panel.querySelector('.playlist-accordion');
+            if (!accordion) return false;
+            const existing = new Map(Array.from(
+                accordion.querySelectorAll('.playlist-track[data-track-key]')
+            ).map(item => [item.dataset.trackKey, item]));
+            const items = change.order.map(key => {
+                const html = change.tracks[key];
+                return typeof html === 'string'
+                    ? parseFragment(html)
+                    : existing.get(`regular:${name}:${key}`);
+            });
+            if (items.some(item => !item)) return false;
+            existing.forEach(item => item.remove());
+            accordion.append(...items);
+            count = items.length;
+            panel.querySelector('.playlist-count').textContent = `${count} songs`;
+        }
+        const meta = Array.from(document.querySelectorAll(
+            '.sidebar-item[data-playlist-name]'
+        )).find(item => item.dataset.playlistName === name)
+            ?.querySelector('.sidebar-item-meta');
+        if (meta) meta.textContent = `${count} song${count === 1 ? '' : 's'}`;
+        return true;
+    }
+
+    // Applies a mutation response: a full library render, or a per-playlist
+    // diff that only fits a library rendered at its base version.
+    async function applyLibrary(payload) {
+        if (typeof payload?.library_html === 'string') {
+            replaceLibrary(payload.library_html);
+            return;
+        }
+        const diff = payload?.library;
+        if (!diff) return;
+        const layout = document.querySelector('#playlists [data-library-version]');
+        const patched = layout
+            && layout.dataset.libraryVersion === String(diff.base_version)
+            && Object.entries(diff.playlists).every(
+                ([name, change]) => patchPlaylist(name, change)
+            );
+        if (!patched) {
+            await refreshLibrary();
+            return;
+        }
+        layout.dataset.libraryVersion = String(diff.version);
+        decorate(layout);
+        player()?.reconcileDom();
+    }
+
     function renderSearchError(message) {
         const container = document.getElementById('search-results');
         if (!container) return;
@@ -340,48 +414,195 @@
         input.addEventListener('blur', () => window.setTimeout(hideSuggestions, 150));
     }
 
+    const pendingDownloads = new Map();
+
+    function watchDownload(videoId, onUpdate) {
+        let finish;
+        const done = new Promise(resolve => { finish = resolve; });
+        const events = new EventSource(
+            `/tubio/download_progress/${encodeURIComponent(videoId)}`
+        );
+        const stop = result => {
+            events.close();
+            pendingDownloads.delete(videoId);
+            finish(result);
+        };
+        events.onmessage = event => {
+            const update = JSON.parse(event.data);
+            onUpdate(update);
+            if (['complete', 'error', 'cancelled', 'not_found'].includes(update.status)) {
+                stop(update);
+            }
+        };
+        events.onerror = () => stop({ status: 'error', error: 'Lost track of the download' });
+        pendingDownloads.set(videoId, stop);
+        return done;
+    }
+
+    async function cancelDownload(button) {
+        const videoId = button.dataset.videoId;
+        button.disabled = true;
+        try {
+            await api().post(`/tubio/youtube_download/${encodeURIComponent(videoId)}/cancel`);
+            pendingDownloads.get(videoId)?.({ status: 'cancelled' });
+        } catch (error) {
+            button.disabled = false;
+            notify(error.message, 'error');
+        }
+    }
+
     async function downloadVideo(button) {
         const videoId = button.dataset.videoId;
+        if (pendingDownloads.has(videoId)) {
+            cancelDownload(button);
+            return;
+        }
         const original = button.innerHTML;
         const container = button.closest('.search-result-download');
         const progress = container?.querySelector('.progress');
         const bar = progress?.querySelector('.progress-bar');
         const status = container?.querySelector('small');
+        const markConverted = message => {
+            button.disabled = true;
+            button.innerHTML = '<i class="bi bi-check-circle me-1"></i>Converted';
+            button.classList.add('search-result-cached');
+            notify(message, 'success');
+        };
+        const reset = () => {
+            button.disabled = false;
+            button.innerHTML = original;
+            progress?.classList.add('d-none');
+            status?.classList.add('d-none');
+        };
         button.disabled = true;
         button.innerHTML = '<i class="bi bi-hourglass-split me-1"></i>Starting…';
         progress?.classList.remove('d-none');
         status?.classList.remove('d-none');
-        let events = null;
         try {
-            events = new EventSource(
-                `/tubio/download_progress/${encodeURIComponent(videoId)}`
-            );
-            events.onmessage = event => {
-                const update = JSON.parse(event.data);
+            const payload = await api().post('/tubio/youtube_download', {
+                video_id: videoId,
+                title: button.dataset.title,
+            });
+            if (!payload.queued) {
+                await applyLibrary(payload);
+                markConverted(payload.message);
+                return;
+            }
+            const finished = watchDownload(videoId, update => {
                 if (typeof update.percent === 'number' && bar) {
                     bar.style.width = `${update.percent}%`;
                     bar.textContent = `${Math.round(update.percent)}%`;
                     bar.setAttribute('aria-valuenow', String(update.percent));
                 }
                 if (status) status.textContent = update.status || '';
-                if (['complete', 'error', 'not_found'].includes(update.status)) {
-                    events.close();
-                }
-            };
-            const payload = await api().post('/tubio/youtube_download', {
-                video_id: videoId,
-                title: button.dataset.title,
             });
-            replaceLibrary(payload.library_html);
-            button.innerHTML = '<i class="bi bi-check-circle me-1"></i>Converted';
-            button.classList.add('search-result-cached');
-            notify(payload.message, 'success');
-        } catch (error) {
             button.disabled = false;
-            button.innerHTML = original;
+            button.innerHTML = '<i class="bi bi-x-circle me-1"></i>Cancel';
+            const result = await finished;
+            if (result.status === 'complete') {
+                await refreshLibrary();
+                markConverted(`Audio converted for: ${button.dataset.title}`);
+            } else if (result.status === 'cancelled') {
+                reset();
+                notify('Download cancelled', 'info');
+            } else {
+                throw new Error(result.error || 'Error converting audio');
+            }
+        } catch (error) {
+            reset();
             notify(error.message, 'error');
-        } finally {
-            events?.close();
+        }
+    }
+
+    // Layout of the blob written by web_app/tubio/waveform.py.
+    function parsePeaks(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'NCPK' || view.getUint8(4) !== 1) return null;
+        const levelCount = view.getUint8(5);
+        const sampleRate = view.getUint32(8, true);
+        const bucketSamples = view.getUint32(12, true);
+        const levels = [];
+        let offset = 16 + 4 * levelCount;
+        for (let index = 0; index < levelCount; index += 1) {
+            const count = view.getUint32(16 + 4 * index, true);
+            levels.push(new Int8Array(buffer, offset, count * 2));
+            offset += count * 2;
+        }
+        if (!levels.length || !levels[0].length) return null;
+        return {
+            levels,
+            durationS: levels[0].length / 2 * bucketSamples / sampleRate,
+        };
+    }
+
+    function drawWaveform() {
+        const canvas = document.getElementById('trim-waveform');
+        if (!canvas) return;
+        const peaks = waveformState.peaks;
+        canvas.classList.toggle('d-none', !peaks);
+        if (!peaks || !canvas.clientWidth) return;
+        const width = Math.round(canvas.clientWidth * window.devicePixelRatio);
+        const height = Math.round(canvas.clientHeight * window.devicePixelRatio);
+        canvas.width = width;
+        canvas.height = height;
+        // The coarsest level that still has a bucket for every pixel.
+        const level = [...peaks.levels].reverse()
+            .find(pairs => pairs.length / 2 >= width) || peaks.levels[0];
+        const buckets = level.length / 2;
+        const style = window.getComputedStyle(canvas);
+        const context = canvas.getContext('2d');
+        const middle = height / 2;
+        context.clearRect(0, 0, width, height);
+        context.fillStyle = style.color;
+        for (let x = 0; x < width; x += 1) {
+            const first = Math.floor(x * buckets / width);
+            const last = Math.min(buckets, Math.max(first + 1, Math.floor((x + 1) * buckets / width)));
+            let low = 0;
+            let high = 0;
+            for (let bucket = first; bucket < last; bucket += 1) {
+                low = Math.min(low, level[2 * bucket]);
+                high = Math.max(high, level[2 * bucket + 1]);
+            }
+            const top = middle - high / 127 * middle;
+            context.fillRect(x, top, 1, Math.max(1, middle - low / 127 * middle - top));
+        }
+        const start = Number(document.getElementById('trim-start-seconds').value) || 0;
+        const end = Number(document.getElementById('trim-end-seconds').value) || 0;
+        const startX = Math.min(width, start / peaks.durationS * width);
+        const endX = Math.max(startX, width - end / peaks.durationS * width);
+        context.globalAlpha = 0.7;
+        context.fillStyle = style.borderTopColor;
+        context.fillRect(0, 0, startX, height);
+        context.fillRect(endX, 0, width - endX, height);
+        context.globalAlpha = 1;
+    }
+
+    async function loadWaveform(crc, attempt = 0) {
+        if (!attempt) {
+            waveformState.crc = crc;
+            waveformState.peaks = null;
+            drawWaveform();
+        }
+        try {
+            const response = await fetch(`/tubio/audio/${encodeURIComponent(crc)}/peaks`, {
+                credentials: 'same-origin',
+            });
+            if (waveformState.crc !== crc) return;
+            if (response.status === 202 && attempt < 3) {
+                const delayS = Number(response.headers.get('Retry-After')) || 3;
+                window.setTimeout(() => {
+                    if (waveformState.crc === crc) loadWaveform(crc, attempt + 1);
+                }, delayS * 1000);
+                return;
+            }
+            if (!response.ok) return;
+            const peaks = parsePeaks(await response.arrayBuffer());
+            if (waveformState.crc !== crc) return;
+            waveformState.peaks = peaks;
+            drawWaveform();
+        } catch (_error) {
+            // The editor works without a waveform.
         }
     }
 
@@ -391,9 +612,10 @@
         document.getElementById('trim-start-seconds').value = track.dataset.trimStart || '0';
         document.getElementById('trim-end-seconds').value = track.dataset.trimEnd || '0';
         document.getElementById('trim-audio-error').classList.add('d-none');
-        bootstrap.Modal.getOrCreateInstance(
-            document.getElementById('trimAudioModal')
-        ).show();
+        const modal = document.getElementById('trimAudioModal');
+        modal.addEventListener('shown.bs.modal', drawWaveform, { once: true });
+        bootstrap.Modal.getOrCreateInstance(modal).show();
+        loadWaveform(track.dataset.audioCrc);
     }
 
     async function submitTrim(event) {
@@ -415,7 +637,7 @@
             bootstrap.Modal.getInstance(
                 document.getElementById('trimAudioModal')
             )?.hide();
-            replaceLibrary(payload.library_html);
+            await applyLibrary(payload);
             notify(payload.message, 'success');
         } catch (error) {
             errorElement.textContent = error.message;
@@ -432,7 +654,7 @@
         button.textContent = 'Syncing…';
         try {
             const payload = await api().post(`/tubio/resync/${track.dataset.audioCrc}`);
-            replaceLibrary(payload.library_html);
+            await applyLibrary(payload);
             notify(payload.message, 'success');
         } catch (error) {
             button.disabled = false;
@@ -451,7 +673,7 @@
                 `/tubio/delete_audio/${track.dataset.audioCrc}`
             );
             player()?.handleAction('forget-track', track);
-            replaceLibrary(payload.library_html);
+            await applyLibrary(payload);
             notify('Track removed', 'success');
         } catch (error) {
             button.disabled = false;
@@ -460,6 +682,39 @@
         }
     }
 
+    async function cachePlaylist(panel, button) {
+        const original = button.innerHTML;
+        const interval = Number.parseInt(
+            document.getElementById('playlists')?.dataset.bulkCachePollIntervalMs,
+            10,
+        ) || 2000;
+        button.disabled = true;
+        try {
+            let progress = await api().post('/tubio/cache_playlist', {
+                playlist_name: panel.dataset.playlistName,
+            });
+            const url = `/tubio/cache_playlist/${encodeURIComponent(progress.job_id)}`;
+            while (!progress.done) {
+                button.textContent = `${Math.floor(progress.percent)}%`;
+                await new Promise(resolve => window.setTimeout(resolve, interval));
+                progress = await api().get(url);
+            }
+            await refreshLibrary();
+            if (progress.failed) {
+                notify(`${progress.failed} of ${progress.total} songs could not be cached`, 'error');
+            } else {
+                notify('All songs cached', 'success');
+            }
+        } catch (error) {
+            notify(error.message, 'error');
+        } finally {
+            if (button.isConnected) {
+                button.disabled = false;
+                button.innerHTML = original;
+            }
+        }
+    }
+
     function preparePlaylist() {
         const selected = Array.from(document.querySelectorAll(
             '.song-checkbox:checked'
@@ -498,6 +753,13 @@
                 if (track) resyncTrack(track, element); return true;
             case 'remove-track':
                 if (track) removeTrack(track, element); return true;
+            case 'pin-offline':
+                Tubio.offline?.togglePin(element); return true;
+            case 'cache-playlist': {
+                const panel = element.closest('.playlist-panel');
+                if (panel) cachePlaylist(panel, element);
+                return true;
+            }
             default:
                 return false;
         }
@@ -521,9 +783,16 @@
             'submit',
             submitTrim,
         );
+        // Delegated: the trim modal is re-rendered with the library.
+        document.addEventListener('input', event => {
+            if (event.target.matches('#trim-start-seconds, #trim-end-seconds')) {
+                drawWaveform();
+            }
+        });
     }
 
     Tubio.ui = {
+        applyLibrary,
         decorate,
         notify,
         replaceLibrary,
@@ -0,0 +1,39 @@
+"""WebP renditions of Tubio track thumbnails."""
+
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from web_app.config import ConfigManager
+
+
+class ThumbnailError(ValueError):
+    """Raised when a fetched thumbnail cannot be decoded as an image."""
+
+
+def render_thumbnails(source: bytes) -> dict[str, bytes]:
+    """Return WebP bytes for each configured size name, never upscaling."""
+
+    config = ConfigManager().tubio
+    try:
+        with Image.open(BytesIO(source)) as opened:
+            opened.load()
+            image = ImageOps.exif_transpose(opened).convert("RGB")
+    except (
+        Image.DecompressionBombError,
+        Image.DecompressionBombWarning,
+        UnidentifiedImageError,
+        OSError,
+        SyntaxError,
+        ValueError,
+    ) as error:
+        raise ThumbnailError("Could not decode thumbnail as an image") from error
+
+    rendered = {}
+    for size, width in config.thumbnail_sizes:
+        resized = image.copy()
+        resized.thumbnail((width, width), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        resized.save(output, "WEBP", quality=config.thumbnail_webp_quality, method=4)
+        rendered[size] = output.getvalue()
+    return rendered
@@ -0,0 +1,106 @@
+"""Low-bitrate Opus variants of cached Tubio audio for slow links.
+
+Variants are transcoded from the cached m4a on a background thread the first
+time a request asks for one; until then the original is served. Each is a
+plain file, so byte-range serving works the same as for the original.
+"""
+
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from typing import Mapping
+
+from web_app.config import ConfigManager
+from web_app.logging_utils import log_event
+from web_app.redis_client import get_redis
+from web_app.tubio.data_interface import AUDIO_VARIANT_SUFFIX, DataInterface
+
+
+VARIANT_MIMETYPE = "audio/webm"
+ORIGINAL_QUALITY = "original"
+
+
+def known_qualities() -> set[str]:
+    return {ORIGINAL_QUALITY, *dict(ConfigManager().tubio.audio_variant_bitrates)}
+
+
+def select_quality(requested: str | None, headers: Mapping[str, str]) -> str | None:
+    """The variant quality to serve, or None for the original m4a.
+
+    An explicit `requested` quality wins; otherwise the Save-Data and ECT
+    client hints pick one.
+    """
+    config = ConfigManager().tubio
+    if requested is not None:
+        return None if requested == ORIGINAL_QUALITY else requested
+    if headers.get("Save-Data", "").strip().lower() == "on":
+        return config.audio_variant_save_data_quality
+    return dict(config.audio_variant_ect_qualities).get(headers.get("ECT", "").strip().lower())
+
+
+def transcode_variant(crc: int, quality: str, *, data: DataInterface | None = None) -> bool:
+    """Write the `quality` variant of cached audio `crc`; False when it is not cached."""
+    config = ConfigManager().tubio
+    data = data or DataInterface()
+    try:
+        audio_path = data.get_audio_path(crc)
+    except ValueError:
+        return False
+    if not audio_path.exists():
+        return False
+    bitrate = dict(config.audio_variant_bitrates)[quality]
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory(dir=data.app_audio_dir) as staging_dir:
+        output_path = os.path.join(staging_dir, f"variant{AUDIO_VARIANT_SUFFIX}")
+        subprocess.run(
+            [
+                "ffmpeg", "-nostdin", "-hide_banner", "-v", "error",
+                "-i", str(audio_path),
+                "-map", "0:a:0",
+                "-c:a", "libopus", "-b:a", bitrate, "-vbr", "on",
+                "-f", "webm",
+                output_path,
+            ],
+            capture_output=True,
+            timeout=config.audio_variant_transcode_timeout_s,
+            check=True,
+        )
+        # Published under the catalog lock so cleanup never races a track
+        # that was collected while it was transcoding.
+        with data.edit_metadata() as metadata:
+            if crc not in metadata.audios:
+                return False
+            os.replace(output_path, data.get_variant_path(crc, quality))
+    log_event(
+        "tubio", "tubio.audio_variant_transcoded",
+        crc=crc, quality=quality, bitrate=bitrate,
+        duration_ms=round((time.monotonic() - started) * 1000),
+    )
+    return True
+
+
+def schedule_variant(crc: int, quality: str) -> bool:
+    """Transcode a variant on a daemon thread unless some worker already is."""
+    config = ConfigManager().tubio
+    lock_key = f"{config.audio_variant_lock_redis_prefix}{crc}:{quality}"
+    if not get_redis().set(lock_key, 1, nx=True, ex=config.audio_variant_transcode_timeout_s):
+        return False
+
+    def run() -> None:
+        try:
+            transcode_variant(crc, quality)
+        except Exception as error:
+            log_event(
+                "tubio", "tubio.audio_variant_failed",
+                level=logging.ERROR, crc=crc, quality=quality,
+                exc_info=error, error_type=type(error).__name__,
+            )
+        finally:
+            get_redis().delete(lock_key)
+
+    threading.Thread(target=run, name=f"nabicat-variant-{crc}-{quality}", daemon=True).start()
+    return True
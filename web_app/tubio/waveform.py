@@ -0,0 +1,174 @@
+"""Precomputed waveform peaks for the trim editor.
+
+A peaks blob is a header followed by one int8 (min, max) pair per bucket for
+each zoom level, finest level first. Level 0 buckets cover
+`waveform_bucket_samples` samples of mono PCM at `waveform_sample_rate`, and
+each further level merges `waveform_level_factor` buckets of the one before.
+Blobs are computed from the cached m4a by streaming ffmpeg's PCM output, so
+memory stays bounded by the read chunk whatever the track length.
+"""
+
+import logging
+import struct
+import subprocess
+import threading
+import time
+
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from web_app.config import ConfigManager
+from web_app.logging_utils import log_event
+from web_app.redis_client import get_redis
+from web_app.tubio.data_interface import DataInterface
+
+
+PEAKS_MAGIC = b"NCPK"
+PEAKS_FORMAT_VERSION = 1
+# magic, format version, level count, level factor, sample rate, level-0 bucket samples
+PEAKS_HEADER = struct.Struct("<4sBBHII")
+# bucket count, once per level
+PEAKS_LEVEL = struct.Struct("<I")
+
+
+class WaveformError(RuntimeError):
+    """ffmpeg could not decode the cached audio."""
+
+
+def _quantize(values: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(values * (127 / 32767)), -127, 127).astype(np.int8)
+
+
+def extract_peaks(
+    chunks: Iterable[bytes],
+    *,
+    sample_rate: int,
+    bucket_samples: int,
+    levels: int,
+    level_factor: int,
+) -> bytes:
+    """Encode a stream of s16le mono PCM chunks as a peaks blob."""
+    bucket_bytes = bucket_samples * 2
+    mins: list[np.ndarray] = []
+    maxs: list[np.ndarray] = []
+    carry = b""
+    for chunk in chunks:
+        if carry:
+            chunk = carry + chunk
+        usable = len(chunk) // bucket_bytes * bucket_bytes
+        if usable:
+            frames = np.frombuffer(chunk, dtype="<i2", count=usable // 2).reshape(-1, bucket_samples)
+            mins.append(frames.min(axis=1))
+            maxs.append(frames.max(axis=1))
+        carry = chunk[usable:]
+    if len(carry) >= 2:
+        tail = np.frombuffer(carry, dtype="<i2", count=len(carry) // 2)
+        mins.append(tail.min(keepdims=True))
+        maxs.append(tail.max(keepdims=True))
+
+    level_min = np.concatenate(mins) if mins else np.zeros(0, dtype=np.int16)
+    level_max = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.int16)
+    counts = []
+    blocks = []
+    for level in range(levels):
+        if level and len(level_min):
+            pad = -len(level_min) % level_factor
+            level_min = np.pad(level_min, (0, pad), mode="edge").reshape(-1, level_factor).min(axis=1)
+            level_max = np.pad(level_max, (0, pad), mode="edge").reshape(-1, level_factor).max(axis=1)
+        pairs = np.empty(2 * len(level_min), dtype=np.int8)
+        pairs[0::2] = _quantize(level_min)
+        pairs[1::2] = _quantize(level_max)
+        counts.append(len(level_min))
+        blocks.append(pairs.tobytes())
+
+    header = PEAKS_HEADER.pack(
+        PEAKS_MAGIC, PEAKS_FORMAT_VERSION, levels, level_factor, sample_rate, bucket_samples,
+    )
+    return b"".join([header, *(PEAKS_LEVEL.pack(count) for count in counts), *blocks])
+
+
+def decode_pcm(audio_path: Path) -> Iterator[bytes]:
+    """Stream the audio as s16le mono PCM chunks from an ffmpeg subprocess."""
+    config = ConfigManager().tubio
+    process = subprocess.Popen(
+        [
+            "ffmpeg", "-hide_banner", "-nostdin", "-v", "error",
+            "-i", str(audio_path),
+            "-vn", "-ac", "1", "-ar", str(config.waveform_sample_rate),
+            "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    timer = threading.Timer(config.waveform_decode_timeout_s, process.kill)
+    timer.start()
+    finished = False
+    try:
+        while chunk := process.stdout.read(config.waveform_read_chunk_bytes):
+            yield chunk
+        finished = True
+    finally:
+        timer.cancel()
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise WaveformError(f"ffmpeg exited with status {returncode}")
+
+
+def compute_peaks(crc: int, *, data: DataInterface | None = None) -> bool:
+    """Store the peaks of the cached audio `crc`; False when it is not cached."""
+    config = ConfigManager().tubio
+    data = data or DataInterface()
+    try:
+        audio_path = data.get_audio_path(crc)
+    except ValueError:
+        return False
+    if not audio_path.exists():
+        return False
+    started = time.monotonic()
+    blob = extract_peaks(
+        decode_pcm(audio_path),
+        sample_rate=config.waveform_sample_rate,
+        bucket_samples=config.waveform_bucket_samples,
+        levels=config.waveform_levels,
+        level_factor=config.waveform_level_factor,
+    )
+    # Published under the catalog lock so cleanup never races a track that
+    # was collected while it was decoding.
+    with data.edit_metadata() as metadata:
+        if crc not in metadata.audios:
+            return False
+        data.atomic_write(data.get_peaks_path(crc), data=blob, mode="wb")
+    log_event(
+        "tubio", "tubio.waveform_computed",
+        crc=crc, bytes=len(blob),
+        duration_ms=round((time.monotonic() - started) * 1000),
+    )
+    return True
+
+
+def schedule_peaks(crc: int) -> bool:
+    """Compute peaks on a daemon thread unless some worker already is."""
+    config = ConfigManager().tubio
+    lock_key = config.waveform_lock_redis_prefix + str(crc)
+    if not get_redis().set(lock_key, 1, nx=True, ex=config.waveform_decode_timeout_s):
+        return False
+
+    def run() -> None:
+        try:
+            compute_peaks(crc)
+        except Exception as error:
+            log_event(
+                "tubio", "tubio.waveform_failed",
+                level=logging.ERROR, crc=crc,
+                exc_info=error, error_type=type(error).__name__,
+            )
+        finally:
+            get_redis().delete(lock_key)
+
+    threading.Thread(target=run, name=f"nabicat-waveform-{crc}", daemon=True).start()
+    return True